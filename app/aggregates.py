@@ -0,0 +1,234 @@
+import argparse
+from collections import defaultdict
+from sqlalchemy import text
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+from app.models import LeaderboardScore, ProficiencyStat, User
+
+# Dashboard aggregates: proficiency distributions, accuracy and leaderboards
+# per topic, per project and overall.
+#
+# The tables are updated in the same transaction as the answer they count
+# (see `submit_answer`), so dashboards read one row per scope instead of
+# scanning question_history and topic_scores. Deltas are applied as upserts
+# that add to the stored values, which keeps concurrent submissions from
+# overwriting each other. `rebuild_aggregates` recomputes everything from the
+# source tables with a couple of GROUP BY passes, for backfills and repairs.
+#
+# Counts follow history rows: grading the same question again only moves the
+# correct count, so an incremental run and a rebuild agree.
+
+LEVEL_COLUMNS = {"Beginner": "beginner", "Intermediate": "intermediate", "Advanced": "advanced"}
+STAT_COLUMNS = ("answers_total", "answers_correct", "beginner", "intermediate", "advanced")
+LEADERBOARD_COLUMNS = ("score", "answers_total", "answers_correct")
+GLOBAL_SCOPE = ("global", 0)
+
+def scopes_for(topic_id: int = None, project_id: int = None):
+    keys = [GLOBAL_SCOPE]
+    if topic_id is not None:
+        keys.append(("topic", topic_id))
+    if project_id is not None:
+        keys.append(("project", project_id))
+    return keys
+
+class AggregateDeltas:
+    """
+    Changes to the aggregate tables collected while grading; `flush` writes
+    them with one upsert per table, however many answers were graded.
+    """
+
+    def __init__(self):
+        self.stats = defaultdict(lambda: dict.fromkeys(STAT_COLUMNS, 0)) # (scope, scope_id) -> deltas
+        self.leaderboard = defaultdict(lambda: dict.fromkeys(LEADERBOARD_COLUMNS, 0)) # (scope, scope_id, user_id) -> deltas
+        self.topic_projects = {} # topic_id -> project_id, stored on topic rows
+
+    def record_answer(self, user_id: int, topic_id: int, project_id: int, is_correct: bool,
+                      was_graded: bool = False, was_correct: bool = False):
+        """A graded answer. `was_graded`/`was_correct` describe the history row before this grading."""
+        total = 0 if was_graded else 1
+        correct = int(bool(is_correct)) - (int(bool(was_correct)) if was_graded else 0)
+        if total == 0 and correct == 0:
+            return
+        self.topic_projects[topic_id] = project_id
+        for key in scopes_for(topic_id, project_id):
+            for deltas in (self.stats[key], self.leaderboard[key + (user_id,)]):
+                deltas["answers_total"] += total
+                deltas["answers_correct"] += correct
+
+    def record_topic_score(self, user_id: int, topic_id: int, project_id: int, points: float,
+                           level_before: str = None, level_after: str = "Beginner"):
+        """Points added to a user's topic score. `level_before` is None when the TopicScore row is new."""
+        self.topic_projects[topic_id] = project_id
+        for key in scopes_for(topic_id, project_id):
+            if level_before != level_after:
+                if level_before is not None:
+                    self.stats[key][LEVEL_COLUMNS[level_before]] -= 1
+                self.stats[key][LEVEL_COLUMNS[level_after]] += 1
+            self.leaderboard[key + (user_id,)]["score"] += points
+
+    def flush(self, db: Session):
+        """Applies the collected deltas in the caller's transaction and clears them."""
+        stat_rows = [
+            {"scope": scope, "scope_id": scope_id,
+             "project_id": self.topic_projects.get(scope_id) if scope == "topic" else None, **deltas}
+            for (scope, scope_id), deltas in self.stats.items() if any(deltas.values())
+        ]
+        if stat_rows:
+            statement = insert(ProficiencyStat).values(stat_rows)
+            db.execute(statement.on_conflict_do_update(
+                index_elements=["scope", "scope_id"],
+                set_={
+                    "project_id": statement.excluded.project_id,
+                    **{c: getattr(ProficiencyStat, c) + getattr(statement.excluded, c) for c in STAT_COLUMNS},
+                },
+            ))
+
+        leaderboard_rows = [
+            {"scope": scope, "scope_id": scope_id, "user_id": user_id, **deltas}
+            for (scope, scope_id, user_id), deltas in self.leaderboard.items() if any(deltas.values())
+        ]
+        if leaderboard_rows:
+            statement = insert(LeaderboardScore).values(leaderboard_rows)
+            db.execute(statement.on_conflict_do_update(
+                index_elements=["scope", "scope_id", "user_id"],
+                set_={c: getattr(LeaderboardScore, c) + getattr(statement.excluded, c) for c in LEADERBOARD_COLUMNS},
+            ))
+
+        self.stats.clear()
+        self.leaderboard.clear()
+        self.topic_projects.clear()
+
+# Reads
+
+def accuracy(correct: int, total: int):
+    return round(correct / total, 4) if total else None
+
+def proficiency_summary(db: Session, scope: str = "global", scope_id: int = 0):
+    row = db.get(ProficiencyStat, (scope, scope_id))
+    total = row.answers_total if row else 0
+    correct = row.answers_correct if row else 0
+    return {
+        "scope": scope,
+        "scope_id": scope_id,
+        "answers_total": total,
+        "answers_correct": correct,
+        "accuracy": accuracy(correct, total),
+        "proficiency": {level: getattr(row, column) if row else 0 for level, column in LEVEL_COLUMNS.items()},
+    }
+
+def topic_summaries(db: Session, project_id: int):
+    """Per-topic summaries for a project's topics that have been answered at least once."""
+    rows = db.query(ProficiencyStat).filter(
+        ProficiencyStat.scope == "topic", ProficiencyStat.project_id == project_id
+    ).order_by(ProficiencyStat.scope_id).all()
+    return [
+        {
+            "topic_id": row.scope_id,
+            "answers_total": row.answers_total,
+            "answers_correct": row.answers_correct,
+            "accuracy": accuracy(row.answers_correct, row.answers_total),
+            "proficiency": {level: getattr(row, column) for level, column in LEVEL_COLUMNS.items()},
+        }
+        for row in rows
+    ]
+
+def leaderboard(db: Session, scope: str = "global", scope_id: int = 0, limit: int = 10):
+    """Top `limit` users by score in the scope, read straight off the (scope, scope_id, score) index."""
+    rows = (
+        db.query(LeaderboardScore, User.username)
+        .outerjoin(User, User.id == LeaderboardScore.user_id)
+        .filter(LeaderboardScore.scope == scope, LeaderboardScore.scope_id == scope_id)
+        .order_by(LeaderboardScore.score.desc(), LeaderboardScore.user_id)
+        .limit(limit)
+        .all()
+    )
+    return [
+        {
+            "rank": rank,
+            "user_id": entry.user_id,
+            "username": username,
+            "score": entry.score,
+            "answers_total": entry.answers_total,
+            "answers_correct": entry.answers_correct,
+            "accuracy": accuracy(entry.answers_correct, entry.answers_total),
+        }
+        for rank, (entry, username) in enumerate(rows, start=1)
+    ]
+
+# Bulk rebuild
+
+# One row per (user, topic) that has graded answers or topic points, fanned
+# out to the three scopes. Graded rows are the ones with a match tier, or with
+# feedback for rows written before match tiers were recorded.
+_SCOPED_USER_TOPICS = """
+WITH answers AS (
+    SELECT s.user_id, h.topic_id, COUNT(*) AS total, SUM(h.is_correct) AS correct
+    FROM question_history h JOIN assessment_sessions s ON s.id = h.session_id
+    WHERE h.match_tier IS NOT NULL OR h.feedback IS NOT NULL
+    GROUP BY s.user_id, h.topic_id
+),
+pairs AS (
+    SELECT user_id, topic_id FROM answers
+    UNION
+    SELECT user_id, topic_id FROM topic_scores WHERE score > 0
+),
+base AS (
+    SELECT p.user_id, p.topic_id, t.project_id AS topic_project,
+           COALESCE(a.total, 0) AS total, COALESCE(a.correct, 0) AS correct,
+           COALESCE(ts.score, 0) AS score,
+           CASE WHEN ts.score > 0 THEN COALESCE(ts.proficiency_level, 'Beginner') END AS level
+    FROM pairs p
+    LEFT JOIN answers a ON a.user_id = p.user_id AND a.topic_id IS p.topic_id
+    LEFT JOIN topic_scores ts ON ts.user_id = p.user_id AND ts.topic_id = p.topic_id
+    LEFT JOIN topics t ON t.id = p.topic_id
+),
+scoped AS (
+    SELECT 'global' AS scope, 0 AS scope_id, NULL AS project_id, * FROM base
+    UNION ALL
+    SELECT 'topic', topic_id, topic_project, * FROM base WHERE topic_id IS NOT NULL
+    UNION ALL
+    SELECT 'project', topic_project, NULL, * FROM base WHERE topic_project IS NOT NULL
+)
+"""
+
+def rebuild_aggregates(db):
+    """
+    Recomputes both aggregate tables from question_history and topic_scores.
+    `db` is a Session or Connection; the caller commits.
+    """
+    db.execute(text("DELETE FROM proficiency_stats"))
+    db.execute(text("DELETE FROM leaderboard_scores"))
+    db.execute(text(
+        "INSERT INTO proficiency_stats "
+        "(scope, scope_id, project_id, answers_total, answers_correct, beginner, intermediate, advanced) "
+        + _SCOPED_USER_TOPICS +
+        "SELECT scope, scope_id, MAX(project_id), SUM(total), SUM(correct), "
+        "TOTAL(level = 'Beginner'), TOTAL(level = 'Intermediate'), TOTAL(level = 'Advanced') "
+        "FROM scoped GROUP BY scope, scope_id"
+    ))
+    db.execute(text(
+        "INSERT INTO leaderboard_scores (scope, scope_id, user_id, score, answers_total, answers_correct) "
+        + _SCOPED_USER_TOPICS +
+        "SELECT scope, scope_id, user_id, SUM(score), SUM(total), SUM(correct) "
+        "FROM scoped GROUP BY scope, scope_id, user_id"
+    ))
+
+if __name__ == "__main__":
+    from app.database import SessionLocal, engine
+    from app.migrations import run_migrations
+
+    parser = argparse.ArgumentParser(description="Dashboard aggregates")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute the aggregate tables from scratch")
+    args = parser.parse_args()
+
+    if not args.rebuild:
+        parser.error("nothing to do (use --rebuild)")
+    run_migrations(engine)
+    db = SessionLocal()
+    try:
+        rebuild_aggregates(db)
+        db.commit()
+        print(f"Rebuilt {db.query(ProficiencyStat).count()} proficiency rows, "
+              f"{db.query(LeaderboardScore).count()} leaderboard rows")
+    finally:
+        db.close()
@@ -0,0 +1,162 @@
+import math
+import re
+import threading
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+from app.config import settings
+
+MATCH = "match"
+NO_MATCH = "no_match"
+AMBIGUOUS = "ambiguous"
+
+STOPWORDS = {"a", "an", "the", "to", "of", "and", "or", "is", "are", "be", "it", "that", "this", "for", "in", "on", "with", "by", "as"}
+NEGATIONS = {"not", "no", "never", "none", "cannot", "without", "dont", "doesnt", "isnt", "shouldnt", "wont", "cant"}
+
+class MatchDecision(NamedTuple):
+    verdict: str # MATCH, NO_MATCH or AMBIGUOUS
+    tier: str # exact, lexical, embedding (the LLM tier is applied by the caller)
+    score: Optional[float] = None
+
+def normalize_answer(text):
+    # Remove all whitespace and convert to lower case
+    # Also remove common punctuation like . , -
+    text = str(text).lower()
+    text = re.sub(r'\s+', '', text) # Remove all whitespace
+    text = re.sub(r'[.,-]', '', text) # Remove punctuation
+    return text
+
+def content_words(text) -> list:
+    words = re.findall(r"[a-z0-9]+", str(text).lower().replace("'", ""))
+    return [w for w in words if w not in STOPWORDS]
+
+def tokenize(text):
+    return set(content_words(text))
+
+def token_set_similarity(a: str, b: str) -> float:
+    """Jaccard similarity of the content words of both answers."""
+    tokens_a, tokens_b = tokenize(a), tokenize(b)
+    if not tokens_a or not tokens_b:
+        return 0.0
+    return len(tokens_a & tokens_b) / len(tokens_a | tokens_b)
+
+def edit_distance(a: str, b: str) -> int:
+    """Levenshtein distance."""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+def edit_similarity(a: str, b: str) -> float:
+    """1 - normalized Levenshtein distance of the normalized answers (catches typos)."""
+    a, b = normalize_answer(a), normalize_answer(b)
+    if not a or not b:
+        return 0.0
+    return 1.0 - edit_distance(a, b) / max(len(a), len(b))
+
+def is_typo_of(a: str, b: str) -> bool:
+    """
+    Whether the two answers differ only by misspelt words: the same content
+    words in the same order, each one equal to its counterpart or a single
+    edit away from it (two for words of 10+ letters) with the same first
+    letter. Numbers must match exactly. A high edit similarity alone also
+    accepts "Increase the price" for "Decrease the price".
+    """
+    words_a, words_b = content_words(a), content_words(b)
+    if len(words_a) != len(words_b):
+        return False
+    for word_a, word_b in zip(words_a, words_b):
+        if word_a == word_b:
+            continue
+        if word_a[0] != word_b[0] or any(c.isdigit() for c in word_a + word_b):
+            return False
+        if edit_distance(word_a, word_b) > (1 if max(len(word_a), len(word_b)) < 10 else 2):
+            return False
+    return True
+
+def cosine_similarity(a, b) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+def _negation_mismatch(a: str, b: str) -> bool:
+    # "Always discount" vs "Never discount" look alike lexically and in embedding space
+    return (tokenize(a) & NEGATIONS) != (tokenize(b) & NEGATIONS)
+
+class AnswerMatcher:
+    """
+    Decides whether a free-text answer means the same as the canonical answer
+    without calling the LLM, escalating through cheaper tiers first:
+
+      1. exact      normalized string equality
+      2. lexical    token-set similarity, or edit-distance similarity when
+                    the only differences are typos (accept only)
+      3. embedding  cosine similarity of answer embeddings (accept or reject)
+
+    Anything the tiers can't settle comes back AMBIGUOUS for the LLM check.
+    Canonical answers repeat across every rep who gets the question, so
+    embeddings are kept in an LRU cache.
+    """
+
+    def __init__(self, embed_model=None, cache_size: int = None):
+        self._embed_model = embed_model
+        self._cache = OrderedDict()
+        self._cache_size = cache_size or settings.ANSWER_MATCH_EMBED_CACHE_SIZE
+        self._lock = threading.Lock()
+
+    @property
+    def embed_model(self):
+        if self._embed_model is not None:
+            return self._embed_model
+        from app.resources import registry
+        return registry.embed_model
+
+    def embedding(self, text: str):
+        key = normalize_answer(text)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        vector = self.embed_model.get_text_embedding(str(text))
+        with self._lock:
+            self._cache[key] = vector
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return vector
+
+    def evaluate(self, user_answer: str, correct_answer: str, use_embeddings: bool = None) -> MatchDecision:
+        if normalize_answer(user_answer) == normalize_answer(correct_answer):
+            return MatchDecision(MATCH, "exact", 1.0)
+
+        negation_mismatch = _negation_mismatch(user_answer, correct_answer)
+        token_score = token_set_similarity(user_answer, correct_answer)
+        edit_score = edit_similarity(user_answer, correct_answer)
+        lexical_score = max(token_score, edit_score)
+        if not negation_mismatch and (
+            token_score >= settings.ANSWER_MATCH_TOKEN_ACCEPT
+            or (edit_score >= settings.ANSWER_MATCH_EDIT_ACCEPT and is_typo_of(user_answer, correct_answer))
+        ):
+            return MatchDecision(MATCH, "lexical", lexical_score)
+
+        if use_embeddings is None:
+            use_embeddings = settings.ANSWER_MATCH_USE_EMBEDDINGS
+        if not use_embeddings:
+            return MatchDecision(AMBIGUOUS, "lexical", lexical_score)
+
+        try:
+            score = cosine_similarity(self.embedding(user_answer), self.embedding(correct_answer))
+        except Exception as e:
+            print(f"Answer embedding failed: {e}")
+            return MatchDecision(AMBIGUOUS, "lexical", lexical_score)
+
+        if score <= settings.ANSWER_MATCH_EMBED_REJECT:
+            return MatchDecision(NO_MATCH, "embedding", score)
+        if score >= settings.ANSWER_MATCH_EMBED_ACCEPT and not negation_mismatch:
+            return MatchDecision(MATCH, "embedding", score)
+        return MatchDecision(AMBIGUOUS, "embedding", score)
+
+answer_matcher = AnswerMatcher()
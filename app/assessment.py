@@ -1,20 +1,22 @@
 import json
 import random
+import re
+from collections import defaultdict
+from sqlalchemy import or_, update
+from sqlalchemy.dialects.sqlite import insert
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
 from app.models import AssessmentSession, QuestionHistory, Topic, User, TopicScore
-from llama_index.core import VectorStoreIndex
-from llama_index.vector_stores.chroma import ChromaVectorStore
-import chromadb
 from app.config import settings
-from llama_index.core import Settings as LlamaSettings
-
-# Re-initialize Chroma (should be a singleton in real app)
-db_client = chromadb.PersistentClient(path=settings.CHROMA_DB_DIR)
-chroma_collection = db_client.get_or_create_collection("sales_knowledge_base")
-vector_store = ChromaVectorStore(chroma_collection=chroma_collection)
-index = VectorStoreIndex.from_vector_store(vector_store=vector_store)
-
-from llama_index.core.vector_stores import MetadataFilters, ExactMatchFilter
+from app.database import SessionLocal
+from app.llm_cache import cached_query, stream_cached_query
+from app.sampling import pick_random_topic, sample_unseen_question
+from app.resources import registry
+from app.answer_matching import answer_matcher, normalize_answer, MatchDecision, MATCH, NO_MATCH, AMBIGUOUS
+from app.aggregates import AggregateDeltas
+from app.topic_chunks import contexts_from_rows, topic_chunk_rows
+from app.question_dedup import find_duplicate, near_duplicate_of
+from app.prefetch import SessionPrefetcher
 
 def start_new_session(db: Session, user_id: int, project_id: int = None, topic_id: int = None):
     # Check if user exists, if not create (simple logic for now)
@@ -34,263 +36,675 @@ def start_new_session(db: Session, user_id: int, project_id: int = None, topic_i
     db.add(session)
     db.commit()
     db.refresh(session)
+
+    # Start filling the lookahead buffer before the first /get_question arrives
+    prefetcher.schedule_refill(session.id)
     return session
 
+def question_topic(db: Session, session: AssessmentSession):
+    """The topic of the session's next question: its own topic, or a random one from its project (or all)."""
+    if session.topic_id:
+        return db.query(Topic).filter(Topic.id == session.topic_id).first()
+    return pick_random_topic(db, session.project_id)
+
+def no_topic_error(session: AssessmentSession) -> dict:
+    if session.topic_id:
+        return {"error": "Specified topic not found."}
+    return {"error": "No topics found. Please ingest a PDF first."}
+
+def question_payload(session: AssessmentSession, topic: Topic, question_bank_id, question_text: str,
+                     choices, correct_answer: str) -> dict:
+    return {
+        "level": session.current_level,
+        "topic_id": topic.id,
+        "topic": topic.name,
+        "question_bank_id": question_bank_id,
+        "question_text": question_text,
+        "choices": choices,
+        "correct_answer": correct_answer,
+    }
+
+def bank_question(db: Session, session: AssessmentSession, topic: Topic, exclude_bank_ids=()):
+    """An unseen bank question of the topic at the session's level, or None."""
+    # Pick an unseen bank question through the (topic, difficulty, id) index without loading the bank
+    q = sample_unseen_question(db, session.id, topic.id, session.current_level, exclude_ids=exclude_bank_ids)
+    if q is None:
+        return None
+    return question_payload(session, topic, q.id, q.question_text, json.loads(q.choices), q.correct_answer)
+
+def fallback_setup(db: Session, session: AssessmentSession, topic: Topic, exclude_texts=()):
+    """
+    The query engine a question about `topic` is generated with, and the texts
+    it must not repeat (the session's questions plus `exclude_texts`).
+    """
+    answered_texts, chunk_rows = fallback_inputs(db, session, topic, exclude_texts)
+    return fallback_engine(session, topic, chunk_rows), answered_texts
+
+def fallback_inputs(db: Session, session: AssessmentSession, topic: Topic, exclude_texts=()):
+    """The database half of `fallback_setup`: texts not to repeat and the topic's recorded chunk rows."""
+    # Texts already asked in this session, so generated questions don't repeat them
+    answered_texts = {a[0] for a in db.query(QuestionHistory.question_text).filter(QuestionHistory.session_id == session.id)}
+    answered_texts.update(exclude_texts)
+    return answered_texts, topic_chunk_rows(db, [topic.id])
+
+def fallback_engine(session: AssessmentSession, topic: Topic, chunk_rows):
+    """The vector store half of `fallback_setup` (a blocking Chroma read when the topic has recorded chunks)."""
+    # Grounded in the topic's recorded chunks, or else in a search of the project's
+    # own collection (every collection without a project)
+    collection = registry.vector_store(topic.project_id).client
+    context = contexts_from_rows(chunk_rows, collection).get(topic.id)
+    if context:
+        return registry.context_query_engine(context)
+    return registry.query_engine(project_id=session.project_id)
+
+def fallback_prompt(level: str, topic_name: str, attempt: int, duplicate: str = None) -> str:
+    prompt = (
+        f"Generate a {level} level multiple-choice question about '{topic_name}'. "
+        "The output must be a valid JSON object with the following keys: "
+        "'question_text', 'choices' (list of 4 strings), 'correct_answer' (string, must match one choice exactly). "
+        "Do not include markdown formatting like ```json."
+    )
+    # Add variation to prompt on retries
+    if attempt > 0:
+        prompt += f" Ensure the question is different from previous ones. Attempt {attempt+1}."
+    if duplicate:
+        prompt += f" Do not ask this question again in other words: {duplicate}"
+    return prompt
+
+def parse_generated(response) -> dict:
+    """The question JSON of a fallback generation response. Raises json.JSONDecodeError."""
+    json_str = str(response).strip()
+    # Remove markdown code blocks if present
+    if json_str.startswith("```json"):
+        json_str = json_str[7:]
+    if json_str.endswith("```"):
+        json_str = json_str[:-3]
+    return json.loads(json_str)
+
+def generated_duplicate(db: Session, topic_id: int, question_text: str, answered_texts):
+    """The question a generated one rewords: one asked in this session, or a bank question of the topic."""
+    duplicate = near_duplicate_of(question_text, answered_texts)
+    if duplicate is None and find_duplicate(db, topic_id, question_text) is not None:
+        duplicate = question_text
+    return duplicate
+
+def accept_generated(db: Session, session: AssessmentSession, topic: Topic, response, answered_texts):
+    """
+    Checks one fallback generation. Returns (question payload, None) if it can
+    be asked, else (None, the question it repeats or None for invalid JSON).
+    """
+    try:
+        question_data = parse_generated(response)
+    except json.JSONDecodeError:
+        print(f"Error parsing JSON: {response}")
+        return None, None
+
+    # Check if duplicate: a rewording of a question asked in this session or of a bank question
+    duplicate = generated_duplicate(db, topic.id, question_data['question_text'], answered_texts)
+    if duplicate is not None:
+        print(f"Duplicate generated: {question_data['question_text'][:30]}... Retrying.")
+        return None, duplicate
+    return question_payload(session, topic, None, question_data['question_text'],
+                            question_data['choices'], question_data['correct_answer']), None
+
+# Retries of the fallback generation when it repeats a question or returns invalid JSON
+FALLBACK_RETRIES = 3
+GENERATION_FAILED = {"error": "Failed to generate a unique question after retries."}
+
+def pick_question(db: Session, session: AssessmentSession, exclude_bank_ids=()):
+    """
+    The topic of the session's next question and an unseen bank question of
+    it: (topic, question), (topic, None) if it needs generating, or
+    (None, error) without a topic.
+    """
+    topic = question_topic(db, session)
+    if not topic:
+        return None, no_topic_error(session)
+    return topic, bank_question(db, session, topic, exclude_bank_ids)
+
+def prepare_question(db: Session, session: AssessmentSession, exclude_bank_ids=(), exclude_texts=()):
+    """
+    Picks the next question for a session without recording it: an unseen bank
+    question if there is one, otherwise one generated by the LLM. Used directly
+    by `generate_question` and ahead of time by the session prefetcher, which
+    passes the questions it already holds in `exclude_*`.
+    """
+    topic, question = pick_question(db, session, exclude_bank_ids)
+    if question:
+        return question
+
+    # Fallback to dynamic generation if no pre-generated questions found
+    query_engine, answered_texts = fallback_setup(db, session, topic, exclude_texts)
+    duplicate = None
+    for attempt in range(FALLBACK_RETRIES):
+        # Never cached: the prompt is the same for every session, so a cached answer would be everyone's "new" question
+        response = cached_query(query_engine, fallback_prompt(session.current_level, topic.name, attempt, duplicate),
+                                "fallback_generation", bypass=True)
+        question, repeated = accept_generated(db, session, topic, response, answered_texts)
+        if question:
+            return question
+        duplicate = repeated or duplicate
+
+    return GENERATION_FAILED
+
+def taken_from_buffer(db: Session, session: AssessmentSession):
+    """
+    A question from the session's lookahead buffer (None if it is empty),
+    skipping ones a request that missed the buffer served meanwhile.
+    """
+    question = prefetcher.take(session.id, session.current_level)
+    while question is not None and db.query(QuestionHistory.id).filter(
+        QuestionHistory.session_id == session.id, QuestionHistory.question_text == question["question_text"]
+    ).first():
+        question = prefetcher.take(session.id, session.current_level)
+    return question
+
+def history_for(session: AssessmentSession, question: dict) -> QuestionHistory:
+    """The history row recording that `question` was asked (pending an answer)."""
+    return QuestionHistory(
+        session_id=session.id,
+        topic_id=question["topic_id"],
+        question_bank_id=question["question_bank_id"],
+        question_text=question["question_text"],
+        correct_answer=question["correct_answer"],
+        is_correct=0 # Default
+    )
+
+def question_response(session: AssessmentSession, question: dict) -> dict:
+    return {
+        "session_id": session.id,
+        "level": session.current_level,
+        "topic": question["topic"],
+        "question": question["question_text"],
+        "options": [{"key": chr(65+i), "value": opt} for i, opt in enumerate(question["choices"])]
+    }
+
 def generate_question(db: Session, session_id: int):
     session = db.query(AssessmentSession).filter(AssessmentSession.id == session_id).first()
     if not session:
         return None
-    
-    # Logic to pick a topic
-    if session.topic_id:
-        topic = db.query(Topic).filter(Topic.id == session.topic_id).first()
-        if not topic:
-            return {"error": "Specified topic not found."}
-    else:
-        # Pick random topic from project or all
-        query = db.query(Topic)
-        if session.project_id:
-            query = query.filter(Topic.project_id == session.project_id)
-        topics = query.all()
-        
-        if not topics:
-            return {"error": "No topics found. Please ingest a PDF first."}
-        topic = random.choice(topics)
-
-    # Generate Question using LLM with strict JSON format
-    # Filter retrieval by project_id if applicable
-    
-    # NEW LOGIC: Try to get from QuestionBank first
-    from app.models import QuestionBank, QuestionHistory
-    import json
-
-    # Get IDs of questions already answered in this session
-    answered_ids = db.query(QuestionHistory.question_text).filter(QuestionHistory.session_id == session_id).all()
-    # Note: QuestionHistory stores text, not ID currently. 
-    # Ideally we should link to QuestionBank ID, but for now we filter by text or just random pick and hope?
-    # Let's try to filter by text if possible, or just pick random and check.
-    answered_texts = [a[0] for a in answered_ids]
-
-    # Query QuestionBank
-    q_query = db.query(QuestionBank).filter(
-        QuestionBank.topic_id == topic.id,
-        QuestionBank.difficulty == session.current_level
-    )
-    if answered_texts:
-        q_query = q_query.filter(QuestionBank.question_text.notin_(answered_texts))
-    
-    available_questions = q_query.all()
-    
-    if available_questions:
-        # Pick one
-        q = random.choice(available_questions)
-        
-        # Store question in history (pending answer)
-        history = QuestionHistory(
-            session_id=session.id,
-            topic_id=topic.id,
-            question_text=q.question_text,
-            correct_answer=q.correct_answer,
-            is_correct=0 # Default
-        )
-        db.add(history)
-        db.commit()
 
-        return {
-            "session_id": session.id,
-            "level": session.current_level,
-            "topic": topic.name,
-            "question": q.question_text,
-            "options": [{"key": chr(65+i), "value": opt} for i, opt in enumerate(json.loads(q.choices))]
-        }
-    
-    # Fallback to dynamic generation if no pre-generated questions found
-    filters = None
-    if session.project_id:
-        filters = MetadataFilters(
-            filters=[ExactMatchFilter(key="project_id", value=str(session.project_id))]
-        )
+    # Serve from the session's lookahead buffer when possible, so the LLM fallback happens in the background
+    question = taken_from_buffer(db, session)
+    if question is None:
+        question = prepare_question(db, session)
+        if "error" in question:
+            return question
+
+    # Store question in history (pending answer)
+    db.add(history_for(session, question))
+    db.commit()
 
-    query_engine = index.as_query_engine(filters=filters)
-    
-    # Retry loop to avoid duplicates
-    max_retries = 3
-    for attempt in range(max_retries):
-        prompt = (
-            f"Generate a {session.current_level} level multiple-choice question about '{topic.name}'. "
-            "The output must be a valid JSON object with the following keys: "
-            "'question_text', 'choices' (list of 4 strings), 'correct_answer' (string, must match one choice exactly). "
-            "Do not include markdown formatting like ```json."
+    prefetcher.schedule_refill(session.id)
+
+    return question_response(session, question)
+
+def match_choice(answer, choices):
+    """Returns the choice the answer corresponds to, or None for a free-text answer."""
+    normalized = normalize_answer(answer)
+    for choice in choices:
+        if normalize_answer(choice) == normalized:
+            return choice
+    return None
+
+def stored_explanation(qb_entry, chosen):
+    """Looks up the precomputed explanation for a wrong choice (None if there isn't one)."""
+    if qb_entry is None or chosen is None or not qb_entry.explanations:
+        return None
+    try:
+        explanations = json.loads(qb_entry.explanations)
+    except Exception as e:
+        print(f"Failed to load explanations: {e}")
+        return None
+    for choice, explanation in explanations.items():
+        if normalize_answer(choice) == normalize_answer(chosen):
+            return explanation
+    return None
+
+def bank_entry_for(db: Session, history: QuestionHistory):
+    from app.models import QuestionBank
+    if history.question_bank_id:
+        return db.query(QuestionBank).filter(QuestionBank.id == history.question_bank_id).first()
+    # Older history rows only carry the text, which relies on it matching exactly
+    return db.query(QuestionBank).filter(QuestionBank.question_text == history.question_text).first()
+
+def load_choices(qb_entry):
+    if qb_entry and qb_entry.choices:
+        try:
+            return json.loads(qb_entry.choices)
+        except Exception as e:
+            print(f"Failed to load choices: {e}")
+    return []
+
+def map_option(user_answer: str, choices):
+    """Maps an option letter (A-D, "Option B") to the text of that choice; anything else is returned as is."""
+    option_match = re.match(r'^(?:option\s*)?([a-d])$', user_answer.strip(), re.IGNORECASE)
+    if option_match:
+        letter = option_match.group(1).upper()
+        idx = ord(letter) - ord('A')
+        if 0 <= idx < len(choices):
+            print(f"Mapped option {letter} to '{choices[idx]}'")
+            return choices[idx]
+    return user_answer
+
+def is_graded(history: QuestionHistory) -> bool:
+    # Older rows have no match tier, but graded ones always got feedback
+    return history.match_tier is not None or history.feedback is not None
+
+def local_decision(user_answer: str, choices, correct_answer: str):
+    """
+    Grades without the LLM. Returns (chosen choice or None, MatchDecision);
+    the decision is AMBIGUOUS when only the LLM check can settle it.
+    """
+    # A picked choice is unambiguous: distinct choices never mean the same thing,
+    # so only free-text answers go through the matcher and, if it can't decide, the LLM.
+    chosen = match_choice(user_answer, choices)
+    if chosen is not None:
+        is_correct = normalize_answer(chosen) == normalize_answer(correct_answer)
+        return chosen, MatchDecision(MATCH if is_correct else NO_MATCH, "exact" if is_correct else "choice")
+    return None, answer_matcher.evaluate(user_answer, correct_answer)
+
+def topic_score_for(db: Session, user_id: int, topic_id: int) -> TopicScore:
+    """
+    The user's score row for a topic, created if it doesn't exist yet. Created
+    with INSERT ... ON CONFLICT DO NOTHING and read back, so two first answers
+    on the same topic arriving together share the row another request inserted.
+    """
+    query = db.query(TopicScore).filter(TopicScore.user_id == user_id, TopicScore.topic_id == topic_id)
+    topic_score = query.first()
+    if topic_score is None:
+        db.execute(
+            insert(TopicScore)
+            .values(user_id=user_id, topic_id=topic_id, score=0.0, proficiency_level="Beginner")
+            .on_conflict_do_nothing(index_elements=["user_id", "topic_id"])
         )
-        # Add variation to prompt on retries
-        if attempt > 0:
-            prompt += f" Ensure the question is different from previous ones. Attempt {attempt+1}."
-        
-        response = query_engine.query(prompt)
-        
-        # Parse JSON
+        topic_score = query.first()
+    return topic_score
+
+def add_points(db: Session, session: AssessmentSession, topic_points: dict, deltas: AggregateDeltas = None,
+               topic_projects: dict = None, topic_scores: dict = None) -> dict:
+    """
+    Adds points to the session's score and to the user's score on each topic
+    ({topic_id: points}), and the change to `deltas` for the dashboard
+    aggregates. Returns the TopicScore rows by topic id (`topic_scores` holds
+    ones already loaded).
+
+    Scores are written as `score = score + :points` and the totals read back
+    from the same statement, so two answers to one session recorded at the
+    same time (e.g. one of them after waiting on the LLM) both count.
+    """
+    topic_projects = topic_projects or {}
+    topic_scores = dict(topic_scores or {})
+    score = db.execute(
+        update(AssessmentSession)
+        .where(AssessmentSession.id == session.id)
+        .values(score=AssessmentSession.score + sum(topic_points.values()))
+        .returning(AssessmentSession.score)
+        .execution_options(synchronize_session=False)
+    ).scalar_one()
+    set_committed_value(session, "score", score)
+
+    for topic_id, points in topic_points.items():
+        topic_score = topic_scores.get(topic_id) or topic_score_for(db, session.user_id, topic_id)
+        score, level = db.execute(
+            update(TopicScore)
+            .where(TopicScore.id == topic_score.id)
+            .values(score=TopicScore.score + points)
+            .returning(TopicScore.score, TopicScore.proficiency_level)
+            .execution_options(synchronize_session=False)
+        ).one()
+        set_committed_value(topic_score, "score", score)
+        set_committed_value(topic_score, "proficiency_level", level)
+
+        # Update Topic Proficiency
+        if score >= 30:
+            topic_score.proficiency_level = "Intermediate"
+        if score >= 60:
+            topic_score.proficiency_level = "Advanced"
+
+        if deltas is not None:
+            # A topic score without points isn't counted in the proficiency distribution yet
+            level_before = level if score - points else None
+            deltas.record_topic_score(session.user_id, topic_id, topic_projects.get(topic_id), points, level_before,
+                                      topic_score.proficiency_level or "Beginner")
+        topic_scores[topic_id] = topic_score
+    return topic_scores
+
+def record_correct_answer(db: Session, session: AssessmentSession, topic_id: int,
+                          deltas: AggregateDeltas = None, project_id: int = None) -> TopicScore:
+    """Adds the points for a correct answer (see `add_points`). Returns the user's topic score."""
+    # Simple logic: +10 for correct.
+    return add_points(db, session, {topic_id: 10}, deltas, {topic_id: project_id})[topic_id]
+
+def advance_level(session: AssessmentSession) -> bool:
+    """Moves the session up a level once its score allows it. Returns True if the level changed."""
+    # If score >= 50, move to Intermediate. If >= 100, Advanced.
+    previous_level = session.current_level
+    if session.score >= 50 and session.current_level == "Beginner":
+        session.current_level = "Intermediate"
+    elif session.score >= 100 and session.current_level == "Intermediate":
+        session.current_level = "Advanced"
+    return session.current_level != previous_level
+
+def equivalence_prompt(question_text: str, correct_answer: str, user_answer: str) -> str:
+    return (
+        f"The correct answer to the question '{question_text}' is '{correct_answer}'. "
+        f"The user answered '{user_answer}'. "
+        "Does the user's answer mean the same thing as the correct answer? "
+        "Ignore minor typos, formatting differences, or extra words if the core meaning is identical. "
+        "Return ONLY 'YES' or 'NO'."
+    )
+
+def explanation_prompt(user_answer: str, question_text: str, correct_answer: str) -> str:
+    return (
+        f"The user answered '{user_answer}' to the question '{question_text}'. "
+        f"The correct answer is '{correct_answer}'. "
+        "Provide a brief explanation of why the answer is incorrect and explain the correct concept."
+    )
+
+def stream_explanation(history_id: int, prompt: str, project_id: int = None):
+    """
+    Yields the wrong-answer explanation token by token and saves the full text
+    to `QuestionHistory.feedback` once the stream ends. The stream outlives the
+    request, so the write goes through a session of its own.
+    """
+    chunks = []
+    try:
+        # Same prompt as the non-streaming path, so both share LLM cache entries
+        for token in stream_cached_query(registry.query_engine(project_id, streaming=True), prompt, "explanation"):
+            chunks.append(token)
+            yield token
+    except Exception as e:
+        print(f"Streaming explanation failed: {e}")
+    finally:
+        db = SessionLocal()
         try:
-            json_str = str(response).strip()
-            # Remove markdown code blocks if present
-            if json_str.startswith("```json"):
-                json_str = json_str[7:]
-            if json_str.endswith("```"):
-                json_str = json_str[:-3]
-                
-            question_data = json.loads(json_str)
-            
-            # Check if duplicate
-            if question_data['question_text'] in answered_texts:
-                print(f"Duplicate generated: {question_data['question_text'][:30]}... Retrying.")
-                continue
-
-            # Store question in history (pending answer)
-            history = QuestionHistory(
-                session_id=session.id,
-                topic_id=topic.id,
-                question_text=question_data['question_text'],
-                correct_answer=question_data['correct_answer'],
-                is_correct=0 # Default
+            db.query(QuestionHistory).filter(QuestionHistory.id == history_id).update(
+                {QuestionHistory.feedback: "".join(chunks)}, synchronize_session=False
             )
-            db.add(history)
             db.commit()
-            
-            return {
-                "session_id": session.id,
-                "level": session.current_level,
-                "topic": topic.name,
-                "question": question_data['question_text'],
-                "options": [{"key": chr(65+i), "value": opt} for i, opt in enumerate(question_data['choices'])]
-            }
-        except json.JSONDecodeError:
-            print(f"Error parsing JSON: {response}")
-            continue
-            
-    return {"error": "Failed to generate a unique question after retries."}
+        finally:
+            db.close()
 
-def submit_answer(db: Session, session_id: int, user_answer: str, question_text: str):
+def answer_target(db: Session, session_id: int, question_text: str) -> dict:
+    """
+    What an answer is graded against: the session, its latest history row for
+    the question, the topic's project and the question's bank entry. Returns
+    {"error": ...} if the session or question isn't found.
+    """
     session = db.query(AssessmentSession).filter(AssessmentSession.id == session_id).first()
     if not session:
         return {"error": "Session not found"}
-        
+
     # Find the last question for this session matching the text
     # In a real app, we'd pass the question_id, but for now we match text
-    history = db.query(QuestionHistory).filter(
+    row = db.query(QuestionHistory, Topic.project_id).outerjoin(Topic, Topic.id == QuestionHistory.topic_id).filter(
         QuestionHistory.session_id == session.id,
         QuestionHistory.question_text == question_text
     ).order_by(QuestionHistory.id.desc()).first()
-    
-    if not history:
+    if not row:
         return {"error": "Question not found in history"}
-    
+    history, project_id = row
+
+    # The bank entry has the choices and precomputed explanations
+    return {"session": session, "history": history, "project_id": project_id, "qb_entry": bank_entry_for(db, history)}
+
+def llm_decision(eval_response: str, decision: MatchDecision) -> MatchDecision:
+    """The verdict of the LLM equivalence check (`equivalence_prompt`) on an AMBIGUOUS decision."""
+    is_correct = eval_response.strip().upper() == "YES"
+    return MatchDecision(MATCH if is_correct else NO_MATCH, "llm", decision.score)
+
+def record_answer(db: Session, target: dict, user_answer: str, decision: MatchDecision, feedback):
+    """
+    Records a graded answer in the caller's transaction: the history row, the
+    points for a correct answer, the session's level and the dashboard
+    aggregates. Returns (the topic score or None, whether the level changed).
+    """
+    session, history, project_id = target["session"], target["history"], target["project_id"]
+    is_correct = decision.verdict == MATCH
+
+    deltas = AggregateDeltas()
+    deltas.record_answer(session.user_id, history.topic_id, project_id, is_correct,
+                         was_graded=is_graded(history), was_correct=history.is_correct)
+
     history.user_answer = user_answer
-    
+    # Record which tier decided, so the matcher thresholds can be tuned from real answers
+    history.match_tier = decision.tier
+    history.match_score = decision.score
+    history.is_correct = 1 if is_correct else 0
+    history.feedback = feedback
+
+    # Update Score and Level
+    topic_score = None
+    if is_correct:
+        topic_score = record_correct_answer(db, session, history.topic_id, deltas=deltas, project_id=project_id)
+
+    # Update Session Level based on overall score (simplified)
+    level_changed = advance_level(session)
+
+    deltas.flush(db)
+    return topic_score, level_changed
+
+def restart_prefetch(session_id: int):
+    # Buffered questions are for the old level
+    prefetcher.invalidate(session_id)
+    prefetcher.schedule_refill(session_id)
+
+def answer_response(session: AssessmentSession, decision: MatchDecision, feedback, topic_score) -> dict:
+    return {
+        "correct": decision.verdict == MATCH,
+        "feedback": feedback,
+        "current_score": session.score,
+        "current_level": session.current_level,
+        "topic_score": topic_score.score if topic_score is not None else 0 # Return current topic score
+    }
+
+def submit_answer(db: Session, session_id: int, user_answer: str, question_text: str, stream: bool = False):
+    """
+    Grades an answer and updates the session and topic scores.
+
+    With `stream=True` an explanation that has to come from the LLM is not
+    generated here: `feedback` is None and `explanation_stream` holds a
+    generator (see `stream_explanation`) for the caller to send on.
+    """
+    target = answer_target(db, session_id, question_text)
+    if "error" in target:
+        return target
+    session, history, qb_entry = target["session"], target["history"], target["qb_entry"]
+    choices = load_choices(qb_entry)
+
     # Check if answer is an option (A, B, C, D or Option A, etc.)
     # and map it to the actual text if possible
-    import re
-    from app.models import QuestionBank
-    
-    # Normalize to just the letter if it looks like an option
-    option_match = re.match(r'^(?:option\s*)?([a-d])$', user_answer.strip(), re.IGNORECASE)
-    if option_match:
-        letter = option_match.group(1).upper()
-        idx = ord(letter) - ord('A')
-        
-        # Try to find the question in QuestionBank to get choices
-        # Note: This relies on question_text being unique enough or matching exactly
-        qb_entry = db.query(QuestionBank).filter(QuestionBank.question_text == question_text).first()
-        
-        if qb_entry and qb_entry.choices:
-            try:
-                choices = json.loads(qb_entry.choices)
-                if 0 <= idx < len(choices):
-                    # Replace user_answer with the actual text of the choice
-                    user_answer = choices[idx]
-                    print(f"Mapped option {letter} to '{user_answer}'")
-            except Exception as e:
-                print(f"Failed to map option: {e}")
+    raw_answer, user_answer = user_answer, map_option(user_answer, choices)
 
     # Evaluate
-    def normalize_answer(text):
-        import re
-        # Remove all whitespace and convert to lower case
-        # Also remove common punctuation like . , -
-        text = str(text).lower()
-        text = re.sub(r'\s+', '', text) # Remove all whitespace
-        text = re.sub(r'[.,-]', '', text) # Remove punctuation
-        return text
-
-    is_correct = (normalize_answer(user_answer) == normalize_answer(history.correct_answer))
-    
-    # Fallback to LLM evaluation if strict match fails
-    if not is_correct and settings.ENABLE_LLM_EVALUATION:
+    chosen, decision = local_decision(user_answer, choices, history.correct_answer)
+
+    # Fallback to LLM evaluation only when the local tiers are unsure
+    if decision.verdict == AMBIGUOUS and settings.ENABLE_LLM_EVALUATION:
         try:
-            eval_query_engine = index.as_query_engine()
-            eval_prompt = (
-                f"The correct answer to the question '{question_text}' is '{history.correct_answer}'. "
-                f"The user answered '{user_answer}'. "
-                "Does the user's answer mean the same thing as the correct answer? "
-                "Ignore minor typos, formatting differences, or extra words if the core meaning is identical. "
-                "Return ONLY 'YES' or 'NO'."
-            )
-            eval_response = eval_query_engine.query(eval_prompt)
-            if str(eval_response).strip().upper() == "YES":
-                is_correct = True
+            eval_query_engine = registry.query_engine(session.project_id)
+            eval_prompt = equivalence_prompt(question_text, history.correct_answer, user_answer)
+            decision = llm_decision(cached_query(eval_query_engine, eval_prompt, "equivalence_check"), decision)
         except Exception as e:
             print(f"LLM evaluation failed: {e}")
             # Fallback to False if LLM fails
 
-    history.is_correct = 1 if is_correct else 0
-    
     feedback = "Correct!"
-    if not is_correct:
-        # Generate explanation using LLM
-        query_engine = index.as_query_engine()
-        prompt = (
-            f"The user answered '{user_answer}' to the question '{question_text}'. "
-            f"The correct answer is '{history.correct_answer}'. "
-            "Provide a brief explanation of why the answer is incorrect and explain the correct concept."
-        )
-        response = query_engine.query(prompt)
-        feedback = str(response)
-    
-    history.feedback = feedback
-    
-    # Update Score and Level
-    # Simple logic: +10 for correct. If score > 50, move to Intermediate. If > 100, Advanced.
-    if is_correct:
-        session.score += 10
-        
-        # Update Topic Score
-        topic_score = db.query(TopicScore).filter(
-            TopicScore.user_id == session.user_id,
-            TopicScore.topic_id == history.topic_id
-        ).first()
-        
-        if not topic_score:
-            topic_score = TopicScore(user_id=session.user_id, topic_id=history.topic_id, score=0.0)
-            db.add(topic_score)
-            
-        topic_score.score += 10
-        
-        # Update Topic Proficiency
-        if topic_score.score >= 30:
-            topic_score.proficiency_level = "Intermediate"
-        if topic_score.score >= 60:
-            topic_score.proficiency_level = "Advanced"
-            
-    # Update Session Level based on overall score (simplified)
-    if session.score >= 50 and session.current_level == "Beginner":
-        session.current_level = "Intermediate"
-    elif session.score >= 100 and session.current_level == "Intermediate":
-        session.current_level = "Advanced"
-        
+    explanation_stream = None
+    if decision.verdict != MATCH:
+        # Serve the explanation generated at ingestion time for this distractor if there is one
+        feedback = stored_explanation(qb_entry, chosen)
+        if feedback is None:
+            # Generate explanation using LLM
+            prompt = explanation_prompt(user_answer, question_text, history.correct_answer)
+            if stream:
+                explanation_stream = stream_explanation(history.id, prompt, session.project_id)
+            else:
+                query_engine = registry.query_engine(session.project_id)
+                feedback = cached_query(query_engine, prompt, "explanation")
+
+    topic_score, level_changed = record_answer(db, target, raw_answer, decision, feedback)
+    db.commit()
+
+    if level_changed:
+        restart_prefetch(session.id)
+
+    result = answer_response(session, decision, feedback, topic_score)
+    if stream:
+        result["explanation_stream"] = explanation_stream
+    return result
+
+def submit_answers_bulk(db: Session, session_id: int, answers):
+    """
+    Grades a batch of answers ({"question_text", "user_answer"}) for one session
+    in a single transaction, applying score and level progression in order.
+
+    History, bank and topic score rows are each loaded with one query. Items
+    only the LLM can grade come back with status "deferred" and are not scored
+    yet, and wrong answers without a stored explanation come back with
+    `explanation_pending`; `resolve_pending_answers` finishes both later. A
+    question that appears more than once is graded with its last answer; the
+    earlier items come back with status "duplicate".
+    """
+    from app.models import QuestionBank
+
+    session = db.query(AssessmentSession).filter(AssessmentSession.id == session_id).first()
+    if not session:
+        return {"error": "Session not found"}
+
+    texts = {item["question_text"] for item in answers}
+    history_by_text, topic_projects = {}, {}
+    for history, project_id in (
+        db.query(QuestionHistory, Topic.project_id)
+        .outerjoin(Topic, Topic.id == QuestionHistory.topic_id)
+        .filter(QuestionHistory.session_id == session.id, QuestionHistory.question_text.in_(texts))
+        .order_by(QuestionHistory.id)
+    ):
+        history_by_text[history.question_text] = history # Latest row per text wins, as in submit_answer
+        topic_projects[history.topic_id] = project_id
+
+    bank_ids = {h.question_bank_id for h in history_by_text.values() if h.question_bank_id}
+    legacy_texts = {h.question_text for h in history_by_text.values() if not h.question_bank_id}
+    bank_by_id, bank_by_text = {}, {}
+    if bank_ids or legacy_texts:
+        for qb in db.query(QuestionBank).filter(
+            or_(QuestionBank.id.in_(bank_ids), QuestionBank.question_text.in_(legacy_texts))
+        ).order_by(QuestionBank.id.desc()):
+            bank_by_id[qb.id] = qb
+            bank_by_text[qb.question_text] = qb # Lowest id wins, like .first()
+
+    topic_ids = {h.topic_id for h in history_by_text.values()}
+    topic_scores = {
+        ts.topic_id: ts
+        for ts in db.query(TopicScore).filter(TopicScore.user_id == session.user_id, TopicScore.topic_id.in_(topic_ids))
+    }
+    topic_points = defaultdict(int)
+
+    # A question answered twice in one batch is graded once, with its last answer
+    last_position = {item["question_text"]: position for position, item in enumerate(answers)}
+
+    results = []
+    level_changed = False
+    deltas = AggregateDeltas()
+    for position, item in enumerate(answers):
+        question_text = item["question_text"]
+        if last_position[question_text] != position:
+            results.append({"question_text": question_text, "status": "duplicate",
+                            "error": "Answered again later in this batch"})
+            continue
+        history = history_by_text.get(question_text)
+        if history is None:
+            results.append({"question_text": question_text, "status": "error", "error": "Question not found in history"})
+            continue
+
+        history.user_answer = item["user_answer"]
+        qb_entry = bank_by_id.get(history.question_bank_id) if history.question_bank_id else bank_by_text.get(question_text)
+        choices = load_choices(qb_entry)
+        user_answer = map_option(item["user_answer"], choices)
+        chosen, decision = local_decision(user_answer, choices, history.correct_answer)
+
+        if decision.verdict == AMBIGUOUS and settings.ENABLE_LLM_EVALUATION:
+            # Don't hold the rest of the batch up on an LLM call
+            results.append({"question_text": question_text, "history_id": history.id, "status": "deferred"})
+            continue
+
+        is_correct = decision.verdict == MATCH
+        project_id = topic_projects.get(history.topic_id)
+        deltas.record_answer(session.user_id, history.topic_id, project_id, is_correct,
+                             was_graded=is_graded(history), was_correct=history.is_correct)
+        history.match_tier = decision.tier
+        history.match_score = decision.score
+        history.is_correct = 1 if is_correct else 0
+
+        feedback = "Correct!" if is_correct else stored_explanation(qb_entry, chosen)
+        history.feedback = feedback
+
+        if is_correct:
+            # Counted here for the running score and level; written once for the batch below
+            session.score += 10
+            topic_points[history.topic_id] += 10
+        level_changed = advance_level(session) or level_changed
+
+        results.append({
+            "question_text": question_text,
+            "history_id": history.id,
+            "status": "graded",
+            "correct": is_correct,
+            "feedback": feedback,
+            "explanation_pending": feedback is None,
+            "match_tier": decision.tier,
+            "current_score": session.score,
+            "current_level": session.current_level,
+        })
+
+    if topic_points:
+        add_points(db, session, topic_points, deltas, topic_projects, topic_scores)
+        # The total read back includes answers recorded meanwhile
+        level_changed = advance_level(session) or level_changed
+    deltas.flush(db)
     db.commit()
-    
+
+    if level_changed:
+        restart_prefetch(session.id)
+
     return {
-        "correct": is_correct,
-        "feedback": feedback,
+        "session_id": session.id,
+        "results": results,
         "current_score": session.score,
         "current_level": session.current_level,
-        "topic_score": topic_score.score if is_correct else 0 # Return current topic score
     }
+
+def resolve_pending_answers(session_id: int, deferred_ids=(), explain_ids=()):
+    """
+    Finishes what `submit_answers_bulk` left open: grades deferred answers the
+    normal way (LLM check, scoring, feedback) and generates the missing
+    explanations for wrong answers. Each item is committed as it completes.
+    Runs after the response is sent, so it works in a session of its own.
+    """
+    db = SessionLocal()
+    try:
+        _resolve_pending_answers(db, session_id, deferred_ids, explain_ids)
+    finally:
+        db.close()
+
+def _resolve_pending_answers(db: Session, session_id: int, deferred_ids, explain_ids):
+    for history_id in deferred_ids:
+        history = db.query(QuestionHistory).filter(QuestionHistory.id == history_id).first()
+        if history:
+            submit_answer(db, session_id, history.user_answer, history.question_text)
+
+    for history_id in explain_ids:
+        history = db.query(QuestionHistory).filter(QuestionHistory.id == history_id).first()
+        if not history or history.feedback is not None:
+            continue
+        user_answer = map_option(history.user_answer, load_choices(bank_entry_for(db, history)))
+        prompt = explanation_prompt(user_answer, history.question_text, history.correct_answer)
+        try:
+            history.feedback = cached_query(registry.query_engine(history.session.project_id), prompt, "explanation")
+            db.commit()
+        except Exception as e:
+            print(f"Explanation for history {history_id} failed: {e}")
+            db.rollback()
+
+prefetcher = SessionPrefetcher(prepare_question)
@@ -0,0 +1,132 @@
+import asyncio
+import json
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.answer_matching import MATCH, AMBIGUOUS
+from app.assessment import (
+    FALLBACK_RETRIES, GENERATION_FAILED, accept_generated, answer_response, answer_target, equivalence_prompt,
+    explanation_prompt, fallback_engine, fallback_inputs, fallback_prompt, history_for, llm_decision, load_choices,
+    local_decision, map_option, match_choice, pick_question, prefetcher, question_response, record_answer,
+    restart_prefetch, stored_explanation, taken_from_buffer,
+)
+from app.config import settings
+from app.llm_cache import acached_query
+from app.models import AssessmentSession
+from app.resources import registry
+
+# Async variant of the /get_question and /submit_answer service (app/assessment.py).
+#
+# The sync handlers hold a threadpool worker for the whole request, LLM calls
+# included, so a few slow generations or explanations use up the pool and
+# bank-served requests queue behind them. Here the LLM calls are awaited
+# (`acached_query`) and the DB goes through the asyncio engine (aiosqlite):
+# the sync path's steps (picking, grading, recording) run through
+# `AsyncSession.run_sync`, which awaits their I/O the same way, so only the
+# LLM calls between them are written here.
+#
+# A session keeps its pooled connection until its transaction ends, so the
+# read transaction is ended before every LLM call (`release_connection`):
+# otherwise requests waiting on the LLM hold the whole pool and the fast path
+# queues for a connection instead of a thread.
+
+async def release_connection(db: AsyncSession):
+    """Ends the session's transaction, returning its connection to the pool. Only call with nothing pending."""
+    await db.commit()
+
+async def aprepare_question(db: AsyncSession, session: AssessmentSession):
+    """`prepare_question` with the fallback generation awaited."""
+    topic, question = await db.run_sync(pick_question, session)
+    if question:
+        return question
+
+    answered_texts, chunk_rows = await db.run_sync(fallback_inputs, session, topic)
+    # Reads the topic's chunks from Chroma, whose client is synchronous
+    query_engine = await asyncio.to_thread(fallback_engine, session, topic, chunk_rows)
+    duplicate = None
+    for attempt in range(FALLBACK_RETRIES):
+        await release_connection(db)
+        response = await acached_query(
+            query_engine, fallback_prompt(session.current_level, topic.name, attempt, duplicate), "fallback_generation",
+            bypass=True,
+        )
+        question, repeated = await db.run_sync(accept_generated, session, topic, response, answered_texts)
+        if question:
+            return question
+        duplicate = repeated or duplicate
+
+    return GENERATION_FAILED
+
+async def agenerate_question(db: AsyncSession, session_id: int):
+    """Async `generate_question`: same buffer, history row and response."""
+    session = await db.get(AssessmentSession, session_id)
+    if not session:
+        return None
+
+    question = await db.run_sync(taken_from_buffer, session)
+    if question is None:
+        question = await aprepare_question(db, session)
+        if "error" in question:
+            return question
+
+    db.add(history_for(session, question))
+    await db.commit()
+
+    prefetcher.schedule_refill(session.id)
+
+    return question_response(session, question)
+
+async def asubmit_answer(db: AsyncSession, session_id: int, user_answer: str, question_text: str):
+    """Async `submit_answer` (without streaming): same grading, scoring and response."""
+    target = await db.run_sync(answer_target, session_id, question_text)
+    if "error" in target:
+        return target
+    session, history, qb_entry = target["session"], target["history"], target["qb_entry"]
+    choices = load_choices(qb_entry)
+    raw_answer, user_answer = user_answer, map_option(user_answer, choices)
+
+    if match_choice(user_answer, choices) is None:
+        # Free text can reach the embedding tier, which calls the embedding model
+        chosen, decision = await asyncio.to_thread(local_decision, user_answer, choices, history.correct_answer)
+    else:
+        chosen, decision = local_decision(user_answer, choices, history.correct_answer)
+
+    waited = False
+    if decision.verdict == AMBIGUOUS and settings.ENABLE_LLM_EVALUATION:
+        await release_connection(db)
+        waited = True
+        try:
+            eval_response = await acached_query(
+                registry.query_engine(session.project_id),
+                equivalence_prompt(question_text, history.correct_answer, user_answer),
+                "equivalence_check",
+            )
+            decision = llm_decision(eval_response, decision)
+        except Exception as e:
+            print(f"LLM evaluation failed: {e}")
+
+    feedback = "Correct!"
+    if decision.verdict != MATCH:
+        feedback = stored_explanation(qb_entry, chosen)
+        if feedback is None:
+            await release_connection(db)
+            waited = True
+            feedback = await acached_query(
+                registry.query_engine(session.project_id),
+                explanation_prompt(user_answer, question_text, history.correct_answer),
+                "explanation",
+            )
+
+    def record(sync_db):
+        if waited:
+            # Read before the LLM calls: another answer to the session may have been recorded meanwhile
+            sync_db.refresh(session)
+            sync_db.refresh(history)
+        return record_answer(sync_db, target, raw_answer, decision, feedback)
+
+    # Nothing is written until the LLM calls are done (they run with the connection released)
+    topic_score, level_changed = await db.run_sync(record)
+    await db.commit()
+
+    if level_changed:
+        restart_prefetch(session.id)
+
+    return answer_response(session, decision, feedback, topic_score)
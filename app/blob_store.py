@@ -0,0 +1,112 @@
+import argparse
+import io
+import os
+import tempfile
+import time
+from typing import Optional
+from app.config import settings
+from app.knowledge_files import copy_with_digest
+
+# Content-addressed blob storage.
+#
+# Uploads are kept under BLOB_DIR as <sha256[:2]>/<sha256><ext> for as long as
+# a file in the registry (or a queued job) points at them, so a job can be
+# retried or reprocessed without the user uploading the file again. The
+# extension is kept because the PDF reader is picked by it. Ingestion also
+# stores each file's parsed pages here (see app/ingest_checkpoints.py).
+# Identical content is stored once; blobs nothing refers to any more (e.g.
+# old versions of a re-uploaded file) are removed by `collect_garbage`.
+
+def blob_path(content_hash: str, filename: str = "") -> str:
+    extension = os.path.splitext(filename)[1].lower()
+    return os.path.join(settings.BLOB_DIR, content_hash[:2], f"{content_hash}{extension}")
+
+def in_blob_store(path: str) -> bool:
+    root = os.path.abspath(settings.BLOB_DIR)
+    return os.path.commonpath([root, os.path.abspath(path)]) == root
+
+def store_blob(source, filename: str = ""):
+    """
+    Copies a file object into the store. Returns (sha256, size in bytes, path).
+    The content is written to a temporary file first and renamed into place,
+    so a reader never sees a partial blob.
+    """
+    os.makedirs(settings.BLOB_DIR, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=settings.BLOB_DIR, prefix=".upload_")
+    try:
+        with os.fdopen(fd, "wb") as destination:
+            content_hash, size_bytes = copy_with_digest(source, destination)
+        path = blob_path(content_hash, filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return content_hash, size_bytes, path
+
+def store_bytes(data: bytes, filename: str = ""):
+    return store_blob(io.BytesIO(data), filename)
+
+def read_blob(content_hash: str, filename: str = "") -> Optional[bytes]:
+    path = blob_path(content_hash, filename)
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return f.read()
+
+def referenced_blobs(db) -> set:
+    """Paths of every blob a registered file, an unfinished job or a parse checkpoint refers to."""
+    from app.ingest_checkpoints import parsed_pages_paths
+    from app.job_queue import ACTIVE_STATUSES
+    from app.models import KnowledgeFile, ProcessingJob
+
+    paths = {
+        os.path.abspath(blob_path(content_hash, filename))
+        for content_hash, filename in db.query(KnowledgeFile.content_hash, KnowledgeFile.filename)
+        .filter(KnowledgeFile.content_hash.isnot(None))
+    }
+    paths.update(
+        os.path.abspath(file_path)
+        for (file_path,) in db.query(ProcessingJob.file_path)
+        .filter(ProcessingJob.status.in_(ACTIVE_STATUSES), ProcessingJob.file_path.isnot(None))
+    )
+    paths.update(os.path.abspath(path) for path in parsed_pages_paths(db))
+    return paths
+
+def collect_garbage(db, min_age_seconds: float = 3600.0) -> int:
+    """
+    Removes blobs nothing refers to. Recent ones are left alone: an upload is
+    stored before its job is queued. Returns the number of blobs removed.
+    """
+    if not os.path.isdir(settings.BLOB_DIR):
+        return 0
+    keep = referenced_blobs(db)
+    cutoff = time.time() - min_age_seconds
+    removed = 0
+    for directory, _, names in os.walk(settings.BLOB_DIR):
+        for name in names:
+            path = os.path.abspath(os.path.join(directory, name))
+            if path in keep or os.path.getmtime(path) > cutoff:
+                continue
+            os.remove(path)
+            removed += 1
+    return removed
+
+if __name__ == "__main__":
+    from app.database import SessionLocal, engine
+    from app.migrations import run_migrations
+
+    parser = argparse.ArgumentParser(description="Content-addressed upload storage")
+    parser.add_argument("--gc", action="store_true", help="Remove blobs no file, job or checkpoint refers to")
+    parser.add_argument("--min-age", type=float, default=3600.0, help="Keep blobs younger than this many seconds")
+    args = parser.parse_args()
+
+    if not args.gc:
+        parser.error("nothing to do (use --gc)")
+    run_migrations(engine)
+    db = SessionLocal()
+    try:
+        print(f"Removed {collect_garbage(db, args.min_age)} unreferenced blob(s) from {settings.BLOB_DIR}")
+    finally:
+        db.close()
@@ -0,0 +1,117 @@
+import hashlib
+from typing import Optional
+from llama_index.core import Settings as LlamaSettings
+from llama_index.core.schema import MetadataMode
+
+# Metadata that describes where a chunk came from rather than what it says.
+# Keeping it out of the embedded text means re-uploading a file under a new
+# path, project context or job never changes a chunk's embedding.
+NON_CONTENT_METADATA_KEYS = ["file_path", "filename", "context", "project_id", "chunk_hash"]
+
+def chunk_node_id(filename: str, project_id: Optional[int], chunk_hash: str) -> str:
+    scope = f"{filename}|{project_id or ''}|{chunk_hash}"
+    return hashlib.sha256(scope.encode("utf-8")).hexdigest()
+
+def _in_scope(metadata: dict, project_id: Optional[int]) -> bool:
+    return (metadata.get("project_id") or None) == (str(project_id) if project_id else None)
+
+def chunk_documents(documents, filename: str, project_id: Optional[int] = None, node_parser=None) -> dict:
+    """
+    Splits documents into chunks, each identified by a hash of its embedded
+    content scoped to (filename, project). Returns node id -> node, one node
+    per distinct chunk (identical chunks add nothing to retrieval).
+    """
+    node_parser = node_parser or LlamaSettings.node_parser
+    for doc in documents:
+        for key in NON_CONTENT_METADATA_KEYS:
+            if key not in doc.excluded_embed_metadata_keys:
+                doc.excluded_embed_metadata_keys.append(key)
+            if key == "chunk_hash" and key not in doc.excluded_llm_metadata_keys:
+                doc.excluded_llm_metadata_keys.append(key)
+
+    desired = {}
+    for node in node_parser.get_nodes_from_documents(documents):
+        chunk_hash = hashlib.sha256(
+            node.get_content(metadata_mode=MetadataMode.EMBED).encode("utf-8")
+        ).hexdigest()
+        node.metadata["chunk_hash"] = chunk_hash
+        node.id_ = chunk_node_id(filename, project_id, chunk_hash)
+        desired.setdefault(node.id_, node)
+    return desired
+
+def chunker_settings(node_parser=None) -> dict:
+    """What chunk boundaries depend on, for ingestion checkpoints."""
+    node_parser = node_parser or LlamaSettings.node_parser
+    return {
+        "parser": type(node_parser).__name__,
+        "chunk_size": getattr(node_parser, "chunk_size", None),
+        "chunk_overlap": getattr(node_parser, "chunk_overlap", None),
+    }
+
+def sync_document_chunks(documents, vector_store, filename: str, project_id: Optional[int] = None,
+                         embed_model=None, node_parser=None, lexical_index=None) -> dict:
+    """
+    Brings the vector store in line with the current version of a document:
+    `chunk_documents` then `sync_chunks`.
+    """
+    desired = chunk_documents(documents, filename, project_id, node_parser)
+    return sync_chunks(desired, vector_store, filename, project_id, embed_model, lexical_index)
+
+def sync_chunks(desired: dict, vector_store, filename: str, project_id: Optional[int] = None,
+                embed_model=None, lexical_index=None) -> dict:
+    """
+    Brings the vector store in line with `desired` (from `chunk_documents`).
+
+    Only chunks that are new since the last ingestion are embedded; chunks
+    that disappeared from the document are deleted, and chunks whose content
+    is unchanged but whose metadata (e.g. `context`) changed are rewritten
+    with their stored embedding, at no embedding cost.
+
+    If given, `lexical_index` (app/lexical_index.py) is brought in line with
+    the same chunks.
+
+    Returns counts of added, unchanged, updated, removed and embedded chunks.
+    """
+    embed_model = embed_model or LlamaSettings.embed_model
+    collection = vector_store.client
+
+    # Current state: everything stored for this file in this project.
+    # Chunks from before chunk hashing have random IDs and will show up as stale.
+    stored = collection.get(where={"filename": filename}, include=["metadatas", "embeddings"])
+    existing = {}
+    for node_id, metadata, embedding in zip(stored["ids"], stored["metadatas"], stored["embeddings"]):
+        if _in_scope(metadata or {}, project_id):
+            existing[node_id] = (metadata, embedding)
+
+    stale_ids = [node_id for node_id in existing if node_id not in desired]
+    new_nodes = [node for node_id, node in desired.items() if node_id not in existing]
+
+    updated_nodes = []
+    for node_id, (metadata, embedding) in existing.items():
+        node = desired.get(node_id)
+        if node is None:
+            continue
+        if any(str(metadata.get(key) or "") != str(node.metadata.get(key) or "")
+               for key in NON_CONTENT_METADATA_KEYS):
+            node.embedding = list(embedding)
+            updated_nodes.append(node)
+
+    if new_nodes:
+        texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in new_nodes]
+        for node, embedding in zip(new_nodes, embed_model.get_text_embedding_batch(texts)):
+            node.embedding = embedding
+
+    if stale_ids or updated_nodes:
+        collection.delete(ids=stale_ids + [node.id_ for node in updated_nodes])
+    if new_nodes or updated_nodes:
+        vector_store.add(new_nodes + updated_nodes)
+    if lexical_index is not None:
+        lexical_index.sync_file(filename, project_id, desired.values(), [node.id_ for node in updated_nodes])
+
+    return {
+        "added": len(new_nodes),
+        "unchanged": len(existing) - len(stale_ids) - len(updated_nodes),
+        "updated": len(updated_nodes),
+        "removed": len(stale_ids),
+        "embedded": len(new_nodes),
+    }
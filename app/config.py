@@ -10,6 +10,81 @@ class Settings(BaseSettings):
     DATABASE_URL: str = "sqlite:///./sales_training.db"
     CHROMA_DB_DIR: str = "./chroma_db"
     ENABLE_LLM_EVALUATION: bool = True
+    LLM_MODEL_NAME: str = "gemini-2.5-pro"
+    EMBED_MODEL_NAME: str = "models/embedding-001"
+    WARMUP_ON_STARTUP: bool = False # Run one retrieval at startup so the first request doesn't load the index
+
+    # SQLite connection pragmas (see app/database.py)
+    SQLITE_WAL: bool = True # Readers don't block on ingestion writes
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000 # Wait this long for a write lock instead of failing with "database is locked"
+    SQLITE_CACHE_SIZE_KB: int = 64000 # Page cache per connection
+    SQLITE_MMAP_SIZE_MB: int = 256
+
+    # Retrieval (see app/lexical_index.py)
+    RETRIEVAL_MODE: str = "hybrid" # vector, hybrid (BM25 + vector, fused) or lexical (BM25 only, no embedding call)
+    LEXICAL_INDEX_PATH: str = "./lexical_index.db"
+    HYBRID_RRF_K: int = 60 # Reciprocal rank fusion constant; higher values flatten the gap between ranks
+
+    # Instrumentation (see app/metrics.py, Prometheus format at /metrics)
+    METRICS_TIMING_HEADER: bool = False # Add a Server-Timing header with per-request llm/retrieval/db time
+
+    # Local answer matching before the LLM equivalence check (see app/answer_matching.py)
+    ANSWER_MATCH_TOKEN_ACCEPT: float = 0.8 # Token-set (Jaccard) similarity that counts as a match
+    ANSWER_MATCH_EDIT_ACCEPT: float = 0.9 # Edit-distance similarity that counts as a match (typos)
+    ANSWER_MATCH_USE_EMBEDDINGS: bool = True
+    ANSWER_MATCH_EMBED_ACCEPT: float = 0.9 # Cosine similarity at or above: match
+    ANSWER_MATCH_EMBED_REJECT: float = 0.5 # Cosine similarity at or below: no match
+    ANSWER_MATCH_EMBED_CACHE_SIZE: int = 10000
+
+    # Ingestion job queue and worker pool (see app/worker.py)
+    INGEST_WORKERS: int = 1 # Worker processes
+    INGEST_WORKER_CONCURRENCY: int = 2 # Jobs each worker runs at once
+    INGEST_RUN_WORKERS_WITH_API: bool = True # Start the pool from the API process; disable when running `python -m app.worker` separately
+    INGEST_QUEUE_MAX_PENDING: int = 20 # Uploads are rejected with 503 beyond this many queued/running jobs
+    INGEST_MAX_ATTEMPTS: int = 3
+    INGEST_RETRY_BACKOFF_SECONDS: float = 30.0 # Doubles after every failed attempt
+    INGEST_HEARTBEAT_SECONDS: float = 10.0
+    INGEST_HEARTBEAT_TIMEOUT_SECONDS: float = 60.0 # A Processing job without a heartbeat for this long is requeued
+    INGEST_POLL_SECONDS: float = 2.0
+    BLOB_DIR: str = "./blobs" # Uploads and parsed pages, stored under their sha256 (see app/blob_store.py)
+
+    # Embedding stage (see app/embedding_pipeline.py)
+    EMBED_BATCH_SIZE: int = 32 # Initial batch size, adapted to observed latency and errors
+    EMBED_MIN_BATCH_SIZE: int = 4
+    EMBED_MAX_BATCH_SIZE: int = 128
+    EMBED_TARGET_BATCH_SECONDS: float = 5.0 # Batches slower than this shrink the next batch
+    EMBED_MAX_RETRIES: int = 5 # Per batch, before the job fails
+    EMBED_RETRY_BACKOFF_SECONDS: float = 2.0
+    EMBED_RATE_LIMIT_PER_MINUTE: int = 1500 # Texts per minute across all ingestion workers
+    EMBED_RATE_LIMIT_BURST: int = 128
+
+    # LLM response cache (content-addressed, keyed on prompt + model + retrieved nodes + filters)
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_PATH: str = "./llm_cache.db"
+    LLM_CACHE_TTL_SECONDS: float = 7 * 24 * 3600
+    LLM_CACHE_MAX_ENTRIES: int = 50000
+
+    # Question bank generation during ingestion
+    QUESTION_GEN_CONCURRENCY: int = 8 # Max LLM requests in flight per document
+    QUESTION_GEN_TIMEOUT_SECONDS: float = 120.0 # Per topic/level request
+    TOPIC_MERGE_SIMILARITY: float = 0.88 # Name embedding similarity at which an extracted topic merges into an existing one (see app/topic_dedup.py); above 1 disables
+    QUESTION_DUP_SIMILARITY: float = 0.7 # Estimated word-set similarity at which a generated question counts as a near-duplicate (see app/question_dedup.py)
+    TOPIC_CHUNKS_PER_TOPIC: int = 3 # Chunks recorded per topic at ingestion; generation answers from these (see app/topic_chunks.py)
+    GENERATION_CONTEXT_TOKENS: int = 1024 # Context budget per generation call (bank and fallback), estimated tokens; 0 for no limit
+
+    # Per-session question prefetch (see app/prefetch.py)
+    PREFETCH_LOOKAHEAD: int = 3 # Questions kept ready per session; 0 disables prefetching
+    PREFETCH_WORKERS: int = 4 # Background threads filling the buffers
+    PREFETCH_MAX_SESSIONS: int = 1000 # Least recently used session buffers are dropped beyond this
+
+    # Authentication (see app/password_hashing.py and app/security.py)
+    JWT_SECRET_KEY: str = "YOUR_SUPER_SECRET_KEY_CHANGE_IN_PROD"
+    ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    PASSWORD_HASH_WORKERS: int = 2 # Processes running argon2; 0 hashes in the request's thread instead
+    PASSWORD_HASH_NICE: int = 10 # Added to the hashing processes' niceness, so request handling gets the CPU first
+    PASSWORD_HASH_MAX_QUEUE: int = 256 # Hash/verify jobs waiting for a worker beyond this are rejected with 503
+    AUTH_CACHE_TTL_SECONDS: float = 60.0 # How long a verified token's claims and user row are reused
+    AUTH_CACHE_MAX_ENTRIES: int = 10000
 
     class Config:
         env_file = ".env"
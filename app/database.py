@@ -1,10 +1,56 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
 from app.config import settings
+from app.metrics import current_endpoint, instrument_engine, span
+
+def configure_sqlite(engine):
+    """
+    Per-connection pragmas for SQLite. WAL lets the API keep reading while the
+    ingestion workers write, and with synchronous=NORMAL a commit no longer
+    waits for an fsync of the main database file.
+    """
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if settings.SQLITE_WAL:
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+        cursor.execute(f"PRAGMA cache_size=-{int(settings.SQLITE_CACHE_SIZE_KB)}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE_MB) * 1024 * 1024}")
+        cursor.close()
+
+class InstrumentedSession(Session):
+    def commit(self):
+        with span("db_commit", current_endpoint()):
+            super().commit()
 
 # Database Setup
 engine = create_engine(settings.DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+configure_sqlite(engine)
+instrument_engine(engine)
+SessionLocal = sessionmaker(class_=InstrumentedSession, autocommit=False, autoflush=False, bind=engine)
+
+def async_url(url: str) -> str:
+    """The asyncio driver's URL for a database URL (aiosqlite for SQLite)."""
+    url = make_url(url)
+    if url.get_backend_name() == "sqlite":
+        return url.set(drivername="sqlite+aiosqlite").render_as_string(hide_password=False)
+    return url.render_as_string(hide_password=False)
+
+# Same database through the asyncio engine, for the async request path (see app/async_assessment.py).
+# expire_on_commit=False: attributes can't be lazily reloaded outside an await.
+async_engine = create_async_engine(async_url(settings.DATABASE_URL))
+configure_sqlite(async_engine.sync_engine)
+instrument_engine(async_engine.sync_engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, sync_session_class=InstrumentedSession, autoflush=False,
+                                       expire_on_commit=False)
 
 # Dependency
 def get_db():
@@ -13,3 +59,7 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,148 @@
+import time
+from typing import List
+from sqlalchemy.exc import IntegrityError
+from app.config import settings
+from app.database import SessionLocal
+from app.models import JobMetric, RateLimitBucket
+
+class TokenBucket:
+    """
+    Token bucket stored in the `rate_limit_buckets` table, so every ingestion
+    worker process draws from the same budget. Updates are compare-and-set on
+    `updated_at`, the same pattern the job queue uses to claim jobs.
+    """
+
+    def __init__(self, name: str, rate_per_second: float, capacity: float, session_factory=SessionLocal):
+        self.name = name
+        self.rate_per_second = rate_per_second
+        self.capacity = capacity
+        self.session_factory = session_factory
+
+    def _try_acquire(self, db, amount: float) -> float:
+        """Takes `amount` tokens if available and returns 0, otherwise returns how long to wait."""
+        now = time.time()
+        bucket = db.query(RateLimitBucket).filter(RateLimitBucket.name == self.name).first()
+        if bucket is None:
+            try:
+                db.add(RateLimitBucket(name=self.name, tokens=self.capacity - amount, updated_at=now))
+                db.commit()
+                return 0.0
+            except IntegrityError:
+                db.rollback() # Another worker created it first, go through the normal path
+                return self._try_acquire(db, amount)
+
+        available = min(self.capacity, bucket.tokens + (now - bucket.updated_at) * self.rate_per_second)
+        if available < amount:
+            return (amount - available) / self.rate_per_second
+
+        updated = (
+            db.query(RateLimitBucket)
+            .filter(RateLimitBucket.name == self.name, RateLimitBucket.updated_at == bucket.updated_at)
+            .update({RateLimitBucket.tokens: available - amount, RateLimitBucket.updated_at: now},
+                    synchronize_session=False)
+        )
+        db.commit()
+        return 0.0 if updated else 0.01 # Lost the race, try again right away
+
+    def acquire(self, amount: float = 1.0):
+        """Blocks until `amount` tokens (capped at the bucket capacity) have been taken."""
+        amount = min(amount, self.capacity)
+        db = self.session_factory()
+        try:
+            while True:
+                wait = self._try_acquire(db, amount)
+                if wait <= 0:
+                    return
+                db.expire_all()
+                time.sleep(wait)
+        finally:
+            db.close()
+
+def embedding_rate_limiter() -> TokenBucket:
+    return TokenBucket(
+        "gemini_embedding",
+        rate_per_second=settings.EMBED_RATE_LIMIT_PER_MINUTE / 60.0,
+        capacity=settings.EMBED_RATE_LIMIT_BURST,
+    )
+
+class AdaptiveBatcher:
+    """
+    Picks the next embedding batch size: grows it additively while batches come
+    back faster than the target latency, halves it on errors or slow batches.
+    """
+
+    def __init__(self, initial: int = None, minimum: int = None, maximum: int = None, target_seconds: float = None):
+        self.minimum = minimum or settings.EMBED_MIN_BATCH_SIZE
+        self.maximum = maximum or settings.EMBED_MAX_BATCH_SIZE
+        self.target_seconds = target_seconds or settings.EMBED_TARGET_BATCH_SECONDS
+        self.size = max(self.minimum, min(self.maximum, initial or settings.EMBED_BATCH_SIZE))
+
+    def on_success(self, batch_size: int, seconds: float):
+        if seconds > self.target_seconds:
+            self.size = max(self.minimum, self.size // 2)
+        elif batch_size >= self.size:
+            # Only grow when the full size was actually exercised
+            self.size = min(self.maximum, self.size + self.minimum)
+
+    def on_error(self):
+        self.size = max(self.minimum, self.size // 2)
+
+class EmbeddingPipeline:
+    """
+    Embedding stage for ingestion. Quacks like an embed model
+    (`get_text_embedding_batch`) so it can be handed to `sync_document_chunks`.
+
+    Texts are sent in adaptively sized batches, each batch waits for the shared
+    rate limiter, and a failing batch is retried (smaller, with backoff) instead
+    of failing the whole document.
+    """
+
+    def __init__(self, embed_model, rate_limiter: TokenBucket = None, batcher: AdaptiveBatcher = None,
+                 max_retries: int = None, backoff_seconds: float = None):
+        self.embed_model = embed_model
+        self.rate_limiter = rate_limiter if rate_limiter is not None else embedding_rate_limiter()
+        self.batcher = batcher or AdaptiveBatcher()
+        self.max_retries = max_retries if max_retries is not None else settings.EMBED_MAX_RETRIES
+        self.backoff_seconds = backoff_seconds if backoff_seconds is not None else settings.EMBED_RETRY_BACKOFF_SECONDS
+        self.stats = {"chunks": 0, "batches": 0, "retries": 0, "seconds": 0.0}
+
+    def get_text_embedding_batch(self, texts: List[str], **kwargs) -> List[List[float]]:
+        start = time.perf_counter()
+        embeddings = []
+        position = 0
+        failures = 0
+        while position < len(texts):
+            batch = texts[position:position + self.batcher.size]
+            if self.rate_limiter:
+                self.rate_limiter.acquire(len(batch))
+            batch_start = time.perf_counter()
+            try:
+                vectors = self.embed_model.get_text_embedding_batch(batch)
+            except Exception as e:
+                failures += 1
+                self.stats["retries"] += 1
+                self.batcher.on_error()
+                if failures > self.max_retries:
+                    raise RuntimeError(f"Embedding failed after {self.max_retries} retries: {e}") from e
+                delay = self.backoff_seconds * (2 ** (failures - 1))
+                print(f"Embedding batch of {len(batch)} failed ({e}), retrying in {delay:.1f}s with batch size {self.batcher.size}")
+                time.sleep(delay)
+                continue
+
+            failures = 0
+            self.batcher.on_success(len(batch), time.perf_counter() - batch_start)
+            embeddings.extend(vectors)
+            position += len(batch)
+            self.stats["batches"] += 1
+
+        self.stats["chunks"] += len(texts)
+        self.stats["seconds"] += time.perf_counter() - start
+        return embeddings
+
+    def throughput(self) -> float:
+        return self.stats["chunks"] / self.stats["seconds"] if self.stats["seconds"] else 0.0
+
+def record_job_metrics(db, job_id: int, metrics: dict):
+    for name, value in metrics.items():
+        db.add(JobMetric(job_id=job_id, name=name, value=float(value)))
+    db.commit()
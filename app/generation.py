@@ -0,0 +1,103 @@
+import asyncio
+import json
+from typing import Awaitable, Callable, List, Optional, Tuple
+from app.config import settings
+from app.llm_cache import acached_query
+
+LEVELS = ["Beginner", "Intermediate", "Advanced"]
+
+def build_bank_prompt(topic_name: str, level: str) -> str:
+    return (
+        f"Generate 3 {level} level multiple-choice questions about '{topic_name}' based on the document context. "
+        "Return a JSON array of objects. Each object must have: "
+        "'question_text', 'choices' (list of 4 strings), 'correct_answer' (string, must match one choice exactly), "
+        "'explanations' (object mapping each of the 3 incorrect choices, verbatim, to a brief explanation "
+        "of why that answer is incorrect and what the correct concept is). "
+        "Do not include markdown formatting like ```json."
+    )
+
+def parse_llm_json(response):
+    # Clean response (the LLM sometimes wraps JSON in markdown fences even when told not to)
+    json_str = str(response).strip()
+    if json_str.startswith("```json"):
+        json_str = json_str[7:]
+    if json_str.endswith("```"):
+        json_str = json_str[:-3]
+    return json.loads(json_str)
+
+async def _generate_for_level(query_engine, semaphore: asyncio.Semaphore, timeout: float,
+                              topic_id: int, topic_name: str, level: str):
+    """Runs one topic/level request. Never raises; failures are returned so one bad
+    topic cannot cancel the rest of the fan-out."""
+    prompt = build_bank_prompt(topic_name, level)
+    try:
+        # The timeout only covers the LLM call itself, not the time spent waiting for a slot
+        async with semaphore:
+            response = await asyncio.wait_for(
+                # Not cached: the prompt and context repeat when a file is reprocessed, and the old batch
+                # would come back only to be skipped as duplicates of the bank
+                acached_query(query_engine, prompt, "bank_generation", bypass=True), timeout=timeout
+            )
+        return topic_id, topic_name, level, parse_llm_json(response), None
+    except asyncio.TimeoutError:
+        return topic_id, topic_name, level, None, TimeoutError(f"timed out after {timeout}s")
+    except Exception as e:
+        return topic_id, topic_name, level, None, e
+
+async def generate_question_bank(
+    query_engine,
+    topics: List[Tuple[int, str]],
+    on_result: Callable[[int, str, list], Optional[Awaitable[None]]],
+    concurrency: int = None,
+    timeout: float = None,
+    query_engines: dict = None,
+    skip=(),
+    on_error: Callable[[int, str, Exception], None] = None,
+):
+    """
+    Generates bank questions for every (topic, level) pair concurrently.
+
+    At most `concurrency` LLM requests are in flight at once and each one is
+    cancelled after `timeout` seconds. `on_result(topic_id, level, questions)` is
+    called on the event loop as soon as each request finishes, so results are
+    recorded incrementally instead of after the whole batch.
+
+    `query_engines` maps topic ids to engines to use instead of `query_engine`
+    (e.g. ones answering from the topic's recorded chunks). (topic_id, level)
+    pairs in `skip` are left out, and `on_error(topic_id, level, error)` is
+    called for each request that fails.
+
+    Returns a dict with the number of succeeded and failed requests.
+    """
+    concurrency = concurrency or settings.QUESTION_GEN_CONCURRENCY
+    timeout = timeout or settings.QUESTION_GEN_TIMEOUT_SECONDS
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    query_engines = query_engines or {}
+
+    tasks = [
+        asyncio.create_task(_generate_for_level(
+            query_engines.get(topic_id, query_engine), semaphore, timeout, topic_id, topic_name, level
+        ))
+        for topic_id, topic_name in topics
+        for level in LEVELS
+        if (topic_id, level) not in skip
+    ]
+
+    stats = {"succeeded": 0, "failed": 0}
+    for next_done in asyncio.as_completed(tasks):
+        topic_id, topic_name, level, questions, error = await next_done
+        if error is None:
+            try:
+                result = on_result(topic_id, level, questions)
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as e:
+                error = e
+        if error is not None:
+            print(f"Failed to generate/parse questions for {topic_name} ({level}): {error}")
+            stats["failed"] += 1
+            if on_error is not None:
+                on_error(topic_id, level, error)
+        else:
+            stats["succeeded"] += 1
+    return stats
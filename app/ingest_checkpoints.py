@@ -0,0 +1,135 @@
+import hashlib
+import json
+from contextlib import contextmanager
+from typing import Callable, List, Optional
+from llama_index.core import Document
+from sqlalchemy.orm import Session
+from app.blob_store import blob_path, read_blob, store_bytes
+from app.models import IngestCheckpoint
+
+# Stage checkpoints for ingestion.
+#
+# A file's ingestion runs as stages: parse, chunk, embed, topics (extraction,
+# merging and chunk mapping) and generate (one checkpoint per topic/level).
+# Each finished stage is recorded per file with a fingerprint of its inputs:
+# the upstream stage's fingerprint plus whatever the stage itself reads
+# (context, model names, chunker settings). A stage whose recorded
+# fingerprint still matches is skipped; one that failed or whose inputs
+# changed runs again, and so does everything downstream of it. A retried job
+# therefore resumes where the last attempt stopped, and reprocessing with a
+# new context reruns topics and generation but embeds nothing.
+
+STAGES = ("parse", "chunk", "embed", "topics", "generate")
+PAGES_SUFFIX = ".pages.json"
+
+def fingerprint(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+class StageCheckpoints:
+    """The checkpoints of one file, as seen by the job processing it."""
+
+    def __init__(self, db: Session, file_id: int, job_id: int = None):
+        self.db = db
+        self.file_id = file_id
+        self.job_id = job_id
+        self.ran = set() # Stages this job ran (or tried to)
+
+    def _row(self, stage: str, key: str = "") -> Optional[IngestCheckpoint]:
+        return self.db.get(IngestCheckpoint, (self.file_id, stage, key))
+
+    def reuse(self, stage: str, input_hash: str, key: str = "", valid: Callable[[dict], bool] = None) -> Optional[dict]:
+        """
+        The stage's recorded output if it finished with these inputs (and
+        `valid(output)` agrees, e.g. what it wrote is still there), else None.
+        """
+        row = self._row(stage, key)
+        if row is None or row.status != "Done" or row.input_hash != input_hash:
+            return None
+        output = json.loads(row.output) if row.output else {}
+        if valid is not None and not valid(output):
+            return None
+        return output
+
+    def _save(self, stage: str, input_hash: str, key: str, status: str, output=None, error: str = None):
+        row = self._row(stage, key)
+        if row is None:
+            row = IngestCheckpoint(file_id=self.file_id, stage=stage, key=key)
+            self.db.add(row)
+        row.input_hash = input_hash
+        row.status = status
+        row.output = json.dumps(output) if output is not None else None
+        row.error = error
+        row.job_id = self.job_id
+        self.db.commit()
+        self.ran.add(stage)
+
+    def done(self, stage: str, input_hash: str, output: dict = None, key: str = "") -> dict:
+        self._save(stage, input_hash, key, "Done", output or {})
+        return output or {}
+
+    def failed(self, stage: str, input_hash: str, error: str, key: str = ""):
+        self._save(stage, input_hash, key, "Failed", error=error)
+
+    @contextmanager
+    def running(self, stage: str, input_hash: str, key: str = ""):
+        """Records the stage as Failed (with the error) if the block raises."""
+        try:
+            yield
+        except Exception as e:
+            self.db.rollback()
+            self.failed(stage, input_hash, str(e) or type(e).__name__, key)
+            raise
+
+    def prune(self, stage: str, keep_keys) -> int:
+        """Drops the stage's checkpoints for keys no longer produced (e.g. topics the file no longer has)."""
+        removed = (
+            self.db.query(IngestCheckpoint)
+            .filter(IngestCheckpoint.file_id == self.file_id, IngestCheckpoint.stage == stage,
+                    IngestCheckpoint.key.notin_(list(keep_keys)))
+            .delete(synchronize_session=False)
+        )
+        self.db.commit()
+        return removed
+
+def list_checkpoints(db: Session, file_id: int) -> List[IngestCheckpoint]:
+    rows = db.query(IngestCheckpoint).filter(IngestCheckpoint.file_id == file_id).all()
+    return sorted(rows, key=lambda row: (STAGES.index(row.stage) if row.stage in STAGES else len(STAGES), row.key))
+
+# Parsed pages are kept as a JSON blob, with the metadata exclusions the reader set:
+# they are part of each chunk's embedded text, so chunk hashes only stay stable if they come back unchanged
+
+def save_pages(documents) -> str:
+    pages = [
+        {
+            "text": doc.text,
+            "metadata": doc.metadata,
+            "excluded_embed_metadata_keys": doc.excluded_embed_metadata_keys,
+            "excluded_llm_metadata_keys": doc.excluded_llm_metadata_keys,
+        }
+        for doc in documents
+    ]
+    content_hash, _, _ = store_bytes(json.dumps(pages).encode("utf-8"), PAGES_SUFFIX)
+    return content_hash
+
+def load_pages(pages_hash: str) -> Optional[list]:
+    """The documents saved by `save_pages`, or None if the blob is gone."""
+    data = read_blob(pages_hash, PAGES_SUFFIX)
+    if data is None:
+        return None
+    return [
+        Document(
+            text=page["text"], metadata=page["metadata"],
+            excluded_embed_metadata_keys=page["excluded_embed_metadata_keys"],
+            excluded_llm_metadata_keys=page["excluded_llm_metadata_keys"],
+        )
+        for page in json.loads(data)
+    ]
+
+def parsed_pages_paths(db: Session) -> List[str]:
+    rows = db.query(IngestCheckpoint.output).filter(IngestCheckpoint.stage == "parse", IngestCheckpoint.output.isnot(None))
+    paths = []
+    for (output,) in rows:
+        pages_hash = json.loads(output).get("pages")
+        if pages_hash:
+            paths.append(blob_path(pages_hash, PAGES_SUFFIX))
+    return paths
@@ -1,162 +1,299 @@
 import os
-import shutil
+import json
 from typing import List
 from fastapi import UploadFile, File, HTTPException
-from llama_index.core import VectorStoreIndex, SimpleDirectoryReader, StorageContext, Document
-from llama_index.vector_stores.chroma import ChromaVectorStore
-from llama_index.embeddings.gemini import GeminiEmbedding
-from llama_index.llms.gemini import Gemini
-from llama_index.core import Settings as LlamaSettings
-import chromadb
+from llama_index.core import SimpleDirectoryReader
 from app.config import settings
 from app.database import SessionLocal
-from app.models import Topic
-
-# Initialize Gemini
-LlamaSettings.llm = Gemini(api_key=settings.GEMINI_API_KEY, model_name="gemini-2.5-pro")
-LlamaSettings.embed_model = GeminiEmbedding(api_key=settings.GEMINI_API_KEY, model_name="models/embedding-001")
-
-# Initialize ChromaDB
-db_client = chromadb.PersistentClient(path=settings.CHROMA_DB_DIR)
-chroma_collection = db_client.get_or_create_collection("sales_knowledge_base")
-vector_store = ChromaVectorStore(chroma_collection=chroma_collection)
-storage_context = StorageContext.from_defaults(vector_store=vector_store)
+from app.models import ProcessingJob, QuestionBank, Topic
+from app.generation import LEVELS, generate_question_bank
+from app.llm_cache import acached_query
+from app.blob_store import blob_path, store_blob
+from app.chunk_sync import chunk_documents, chunker_settings, sync_chunks
+from app.embedding_pipeline import EmbeddingPipeline, record_job_metrics
+from app.ingest_checkpoints import STAGES, StageCheckpoints, fingerprint, load_pages, save_pages
+from app.knowledge_files import file_digest, find_file, register_file, update_file_for_job
+from app.resources import registry
+from app.topic_chunks import bank_prompt_tokens, map_topic_chunks, topic_context
+from app.topic_dedup import resolve_topics
+from app.question_dedup import add_bank_questions
+from app.metrics import span
 
 import asyncio
-from fastapi import BackgroundTasks
-from app.models import ProcessingJob
+from app.job_queue import ACTIVE_STATUSES, enqueue_job, queue_depth, QueueFullError
 
-async def process_pdf_background(file_path: str, filename: str, job_id: int, context: str = None, project_id: int = None):
+async def _parsed_documents(checkpoints: StageCheckpoints, parse_key: str, file_path: str, stage_seconds: dict):
+    """The file's pages: from the parse checkpoint if its blob is still there, else parsed (and kept) now."""
+    parsed = checkpoints.reuse("parse", parse_key)
+    documents = await asyncio.to_thread(load_pages, parsed["pages"]) if parsed else None
+    if documents is not None:
+        return documents
+    # Parsing is blocking, keep it off the event loop
+    with checkpoints.running("parse", parse_key), span("ingest_stage", "parse") as timer:
+        documents = await asyncio.to_thread(SimpleDirectoryReader(input_files=[file_path]).load_data)
+        pages_hash = await asyncio.to_thread(save_pages, documents)
+    stage_seconds["parse"] = timer.seconds
+    checkpoints.done("parse", parse_key, {"pages": pages_hash, "page_count": len(documents)})
+    return documents
+
+async def process_pdf_background(file_path: str, filename: str, job_id: int, context: str = None, project_id: int = None) -> str:
+    """
+    Runs the ingestion pipeline for a job claimed by a worker and returns its
+    completion message. Stages that already finished for this file with the
+    same inputs are skipped (see app/ingest_checkpoints.py), so a retry or a
+    reprocess only reruns what failed or what the change invalidated. Errors
+    propagate: job status and retries are handled by app/job_queue.py.
+    """
     db = SessionLocal()
-    job = db.query(ProcessingJob).filter(ProcessingJob.id == job_id).first()
-    job.status = "Processing"
-    db.commit()
-    
     try:
-        # Load data
-        documents = SimpleDirectoryReader(input_files=[file_path]).load_data()
-        
-        # Add metadata to documents
-        for doc in documents:
-            doc.metadata["filename"] = filename
-            if context:
-                doc.metadata["context"] = context
-            if project_id:
-                doc.metadata["project_id"] = str(project_id)
-
-        # Create Index (This chunks and embeds automatically)
-        index = VectorStoreIndex.from_documents(
-            documents, storage_context=storage_context
-        )
-        
-        # Extract and Save Topics to SQLite
-        summary_query = (
-            "Analyze the document and extract a comprehensive list of all distinct sales training topics covered. "
-            "Return ONLY a comma-separated list of topic names. Do not include descriptions or numbering."
-        )
-        if context:
-            summary_query += f" Focus specifically on: {context}"
-            
-        query_engine = index.as_query_engine()
-        response = query_engine.query(summary_query)
-        
-        topics_list = [t.strip() for t in str(response).split(",") if t.strip()]
-        
-        topics_list = [t.strip() for t in str(response).split(",") if t.strip()]
-        
-        from app.models import QuestionBank
-        import json
-
-        for topic_name in topics_list:
-            # Check if exists in this project
-            existing = db.query(Topic).filter(Topic.name == topic_name, Topic.project_id == project_id).first()
-            if not existing:
-                new_topic = Topic(name=topic_name, description=f"Extracted from {filename}", project_id=project_id)
-                db.add(new_topic)
-                db.commit()
-                db.refresh(new_topic)
-                topic_id = new_topic.id
-            else:
-                topic_id = existing.id
-
-            # Generate Questions for this topic (3 per level)
-            levels = ["Beginner", "Intermediate", "Advanced"]
-            for level in levels:
-                # Check if we already have questions for this topic/level to avoid re-generating on re-process
-                # (Optional optimization, skipping for now to ensure we get fresh ones if requested)
-                
-                q_prompt = (
-                    f"Generate 3 {level} level multiple-choice questions about '{topic_name}' based on the document context. "
-                    "Return a JSON array of objects. Each object must have: "
-                    "'question_text', 'choices' (list of 4 strings), 'correct_answer' (string, must match one choice exactly). "
-                    "Do not include markdown formatting like ```json."
+        stage_seconds = {}
+        content_hash, size_bytes = await asyncio.to_thread(file_digest, file_path)
+        record = register_file(db, filename, project_id, job_id, "Processing", content_hash, size_bytes)
+        checkpoints = StageCheckpoints(db, record.id, job_id)
+
+        # Each stage's fingerprint covers the one before it, so a changed input reruns everything downstream
+        parse_key = fingerprint("parse", content_hash, os.path.splitext(file_path)[1].lower())
+        chunk_key = fingerprint("chunk", parse_key, chunker_settings(), filename, project_id)
+        embed_key = fingerprint("embed", chunk_key, context, settings.EMBED_MODEL_NAME)
+        topics_key = fingerprint("topics", embed_key, settings.LLM_MODEL_NAME)
+
+        # Chunk and embed incrementally: only chunks not already stored for this file get embedded.
+        # Skipped altogether while the chunks recorded by the last run are still what the store holds.
+        lexical_index = registry.lexical_index()
+        indexed = checkpoints.reuse("embed", embed_key, valid=lambda output: output.get("chunk_set") == fingerprint(
+            sorted(lexical_index.node_ids(filename, project_id))
+        ))
+        embedder = EmbeddingPipeline(registry.embed_model)
+        chunk_stats = None
+        if indexed is None:
+            documents = await _parsed_documents(checkpoints, parse_key, file_path, stage_seconds)
+            # Add metadata to documents
+            for doc in documents:
+                doc.metadata["filename"] = filename
+                if context:
+                    doc.metadata["context"] = context
+                if project_id:
+                    doc.metadata["project_id"] = str(project_id)
+
+            # Chunking is cheap and its nodes aren't stored, so it runs again whenever embedding does
+            with checkpoints.running("chunk", chunk_key), span("ingest_stage", "chunk") as timer:
+                nodes = await asyncio.to_thread(chunk_documents, documents, filename, project_id)
+            stage_seconds["chunk"] = timer.seconds
+            chunk_set = fingerprint(sorted(nodes))
+            checkpoints.done("chunk", chunk_key, {"chunks": len(nodes), "chunk_set": chunk_set})
+
+            with checkpoints.running("embed", embed_key), span("ingest_stage", "embed") as timer:
+                chunk_stats = await asyncio.to_thread(
+                    sync_chunks, nodes, registry.vector_store(project_id), filename, project_id, embedder,
+                    lexical_index=lexical_index,
+                )
+            stage_seconds["embed"] = timer.seconds
+            indexed = checkpoints.done("embed", embed_key, {
+                "page_count": len(documents), "chunks": len(nodes), "chunk_set": chunk_set,
+            })
+        # The chunks are in the vector store now, whatever happens to the rest of the job
+        update_file_for_job(db, job_id, status="Indexed", page_count=indexed["page_count"], chunk_count=indexed["chunks"])
+        if embedder.stats["chunks"]:
+            record_job_metrics(db, job_id, {
+                "embed_chunks": embedder.stats["chunks"],
+                "embed_batches": embedder.stats["batches"],
+                "embed_retries": embedder.stats["retries"],
+                "embed_seconds": embedder.stats["seconds"],
+                "embed_chunks_per_sec": embedder.throughput(),
+            })
+
+        project_topics = registry.project_topics(project_id)
+        collection = registry.vector_store(project_id).client
+        extracted = checkpoints.reuse("topics", topics_key, valid=lambda output: db.query(Topic).filter(
+            Topic.id.in_({topic_id for topic_id, _ in output["topics"]})
+        ).count() == len({topic_id for topic_id, _ in output["topics"]}))
+        dedup_stats = {}
+        if extracted is None:
+            with checkpoints.running("topics", topics_key):
+                # Extract and Save Topics to SQLite
+                summary_query = (
+                    "Analyze the document and extract a comprehensive list of all distinct sales training topics covered. "
+                    "Return ONLY a comma-separated list of topic names. Do not include descriptions or numbering."
                 )
-                
-                # We can use the index to query specifically for this topic to get better context
-                # But for now, general query engine is fine, maybe add topic focus
-                q_query_engine = index.as_query_engine()
-                q_response = q_query_engine.query(q_prompt)
-                
-                try:
-                    # Clean response
-                    json_str = str(q_response).strip()
-                    if json_str.startswith("```json"):
-                        json_str = json_str[7:]
-                    if json_str.endswith("```"):
-                        json_str = json_str[:-3]
-                    
-                    questions_data = json.loads(json_str)
-                    
-                    for q_data in questions_data:
-                        new_q = QuestionBank(
-                            topic_id=topic_id,
-                            question_text=q_data['question_text'],
-                            choices=json.dumps(q_data['choices']),
-                            correct_answer=q_data['correct_answer'],
-                            difficulty=level
-                        )
-                        db.add(new_q)
-                    db.commit()
-                except Exception as e:
-                    print(f"Failed to generate/parse questions for {topic_name} ({level}): {e}")
-                    # Continue to next level/topic
-                    continue
-
-        job.status = "Completed"
-        job.message = f"Extracted {len(topics_list)} topics and generated questions."
+                if context:
+                    summary_query += f" Focus specifically on: {context}"
+
+                query_engine = registry.query_engine(project_id)
+                with span("ingest_stage", "topic_extraction") as timer:
+                    response = await acached_query(query_engine, summary_query, "topic_extraction")
+                stage_seconds["topic_extraction"] = timer.seconds
+
+                topics_list = [t.strip() for t in str(response).split(",") if t.strip()]
+
+                # Merge names that match an existing topic (or each other) by normalized name or embedding,
+                # so near-duplicates don't each get their own topic and generation calls
+                with span("ingest_stage", "topic_dedup") as timer:
+                    topics, dedup_stats = await asyncio.to_thread(
+                        resolve_topics, db, topics_list, project_topics, EmbeddingPipeline(registry.embed_model),
+                        f"Extracted from {filename}",
+                    )
+                stage_seconds["topic_dedup"] = timer.seconds
+
+                # Record which of the file's chunks support each topic, then generate from those chunks
+                # (plus any recorded for the same topics by other files) instead of searching per prompt
+                with span("ingest_stage", "topic_mapping") as timer:
+                    mapping = await asyncio.to_thread(
+                        map_topic_chunks, db, topics, filename, project_id, collection,
+                        lexical_index.node_ids(filename, project_id), EmbeddingPipeline(registry.embed_model),
+                        topic_embeddings=project_topics.embeddings([topic_id for topic_id, _ in topics]),
+                    )
+                stage_seconds["topic_mapping"] = timer.seconds
+            extracted = checkpoints.done("topics", topics_key, {
+                "topics": topics, "extracted": len(topics_list), "avg_chunk_tokens": mapping["avg_chunk_tokens"],
+            })
+        topics = [(topic_id, name) for topic_id, name in extracted["topics"]]
+        query_engine = registry.query_engine(project_id)
+        contexts = topic_context(db, [topic_id for topic_id, _ in topics], collection)
+        query_engines = {topic_id: registry.context_query_engine(nodes) for topic_id, nodes in contexts.items()}
+        prompt_tokens = bank_prompt_tokens(topics, contexts, extracted["avg_chunk_tokens"])
+
+        # One checkpoint per topic/level: batches that succeeded for these topics before are not asked for again
+        batch_keys = {
+            (topic_id, level): fingerprint("generate", topics_key, topic_id, level)
+            for topic_id, _ in topics for level in LEVELS
+        }
+        generated = {
+            pair for pair, key in batch_keys.items()
+            if checkpoints.reuse("generate", key, key=f"{pair[0]}:{pair[1]}") is not None
+        }
+        checkpoints.prune("generate", [f"{topic_id}:{level}" for topic_id, level in batch_keys])
+
+        # Generate Questions for every remaining topic/level (3 per level) concurrently.
+        # Each batch is committed as soon as it arrives so partial progress survives a crash.
+        # Near-duplicates of the topic's bank (e.g. from reprocessing the same file) are skipped.
+        bank_stats = {"added": 0, "skipped": 0}
+        def save_questions(topic_id, level, questions_data):
+            try:
+                batch_stats = add_bank_questions(db, topic_id, level, [
+                    QuestionBank(
+                        question_text=q_data['question_text'],
+                        choices=json.dumps(q_data['choices']),
+                        correct_answer=q_data['correct_answer'],
+                        explanations=json.dumps(q_data.get('explanations') or {}),
+                    )
+                    for q_data in questions_data
+                ])
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+            for key, count in batch_stats.items():
+                bank_stats[key] += count
+            checkpoints.done("generate", batch_keys[topic_id, level], batch_stats, key=f"{topic_id}:{level}")
+
+        def generation_failed(topic_id, level, error):
+            checkpoints.failed("generate", batch_keys[topic_id, level], str(error) or type(error).__name__,
+                               key=f"{topic_id}:{level}")
+
+        with span("ingest_stage", "question_generation") as timer:
+            gen_stats = await generate_question_bank(
+                query_engine, topics, save_questions, query_engines=query_engines,
+                skip=generated, on_error=generation_failed,
+            )
+        stage_seconds["question_generation"] = timer.seconds
+        skipped_stages = [stage for stage in STAGES if stage != "generate" and stage not in checkpoints.ran]
+        record_job_metrics(db, job_id, {
+            **{f"stage_{stage}_seconds": seconds for stage, seconds in stage_seconds.items()},
+            **prompt_tokens,
+            **dedup_stats,
+            "stages_reused": len(skipped_stages),
+            "gen_batches_reused": len(generated),
+            "bank_questions_added": bank_stats["added"],
+            "bank_duplicates_skipped": bank_stats["skipped"],
+        })
+
+        if "topics" in checkpoints.ran:
+            message = (
+                f"Extracted {extracted['extracted']} topics ({len(topics)} after merging near-duplicates) "
+                f"and generated questions."
+            )
+        else:
+            message = f"Kept the {len(topics)} topics from the last run."
+        if chunk_stats is not None:
+            message += (
+                f" Chunks: {chunk_stats['added']} new, {chunk_stats['unchanged'] + chunk_stats['updated']} reused, "
+                f"{chunk_stats['removed']} removed."
+            )
+        if embedder.stats["chunks"]:
+            message += f" Embedded {embedder.stats['chunks']} chunks at {embedder.throughput():.1f} chunks/sec."
+        if skipped_stages or generated:
+            message += f" Unchanged since the last run, skipped: {', '.join(skipped_stages) or 'no stages'}"
+            message += f" and {len(generated)} topic/level batches." if generated else "."
+        if bank_stats["skipped"]:
+            message += f" Skipped {bank_stats['skipped']} near-duplicate questions."
+        if dedup_stats.get("gen_calls_saved"):
+            message += f" Merging topics saved {dedup_stats['gen_calls_saved']} generation calls."
+        if prompt_tokens and gen_stats["succeeded"] + gen_stats["failed"]:
+            message += (
+                f" Generation prompts: ~{prompt_tokens['gen_prompt_tokens']:.0f} tokens "
+                f"({-prompt_tokens['gen_prompt_token_reduction']:+.0%} vs. similarity search)."
+            )
+        if gen_stats["failed"]:
+            message += (
+                f" {gen_stats['failed']} of {gen_stats['failed'] + gen_stats['succeeded']} topic/level batches failed;"
+                f" reprocess the file to retry them."
+            )
         if context:
-            job.message += f" (Context: {context})"
-        db.commit()
-        
-    except Exception as e:
-        job.status = "Failed"
-        job.message = str(e)
-        db.commit()
+            message += f" (Context: {context})"
+        return message
     finally:
         db.close()
-        # Cleanup
-        if os.path.exists(file_path):
-            os.remove(file_path)
-
-async def process_pdf_document(file: UploadFile, background_tasks: BackgroundTasks, context: str = None, project_id: int = None):
-    # Save temp file
-    temp_dir = "temp_ingest"
-    os.makedirs(temp_dir, exist_ok=True)
-    file_path = os.path.join(temp_dir, file.filename)
-    
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
-    # Create Job
+
+def queue_full(error: QueueFullError) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail=str(error),
+        headers={"Retry-After": str(int(settings.INGEST_RETRY_BACKOFF_SECONDS))},
+    )
+
+async def process_pdf_document(file: UploadFile, context: str = None, project_id: int = None):
     db = SessionLocal()
-    job = ProcessingJob(filename=file.filename, status="Pending", project_id=project_id)
-    if context:
-        job.message = f"Queued with context: {context}"
-    db.add(job)
-    db.commit()
-    db.refresh(job)
-    db.close()
-    
-    background_tasks.add_task(process_pdf_background, file_path, file.filename, job.id, context, project_id)
-    
+    try:
+        # Reject early, before spending time on writing the upload to disk
+        if queue_depth(db) >= settings.INGEST_QUEUE_MAX_PENDING:
+            raise QueueFullError(f"Ingestion queue is full ({settings.INGEST_QUEUE_MAX_PENDING} jobs pending)")
+
+        # Keep the upload in the blob store, so retries and reprocessing don't need it uploaded again.
+        # Nothing is removed if queueing fails: the same content may already back another file.
+        content_hash, size_bytes, file_path = await asyncio.to_thread(store_blob, file.file, file.filename)
+
+        # Create Job; a worker process picks it up from the processing_jobs table
+        job = enqueue_job(db, file.filename, file_path, context, project_id)
+        register_file(db, file.filename, project_id, job.id, "Queued", content_hash, size_bytes)
+        job_id = job.id
+    except QueueFullError as e:
+        raise queue_full(e)
+    finally:
+        db.close()
+
+    return {"status": "queued", "job_id": job_id}
+
+def reprocess_document(db, filename: str, project_id: int = None, context: str = None) -> dict:
+    """
+    Queues a stored file for ingestion again, with a new context if given
+    (otherwise the last one). Only stages whose inputs changed, or that
+    failed, run again (see app/ingest_checkpoints.py).
+    """
+    record = find_file(db, filename, project_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    file_path = blob_path(record.content_hash, record.filename) if record.content_hash else None
+    if file_path is None or not os.path.exists(file_path):
+        raise HTTPException(status_code=410, detail="The uploaded file was not kept, please upload it again")
+    previous = db.get(ProcessingJob, record.job_id) if record.job_id else None
+    if previous is not None and previous.status in ACTIVE_STATUSES:
+        raise HTTPException(status_code=409, detail=f"File is already being processed (job {previous.id})")
+
+    if context is None and previous is not None:
+        context = previous.context
+    try:
+        job = enqueue_job(db, record.filename, file_path, context or None, record.project_id)
+    except QueueFullError as e:
+        raise queue_full(e)
+    register_file(db, record.filename, record.project_id, job.id, "Queued")
     return {"status": "queued", "job_id": job.id}
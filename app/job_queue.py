@@ -0,0 +1,165 @@
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.models import ProcessingJob
+from app.blob_store import in_blob_store
+from app.knowledge_files import fail_file_for_job
+
+ACTIVE_STATUSES = ("Pending", "Processing")
+
+class QueueFullError(Exception):
+    """Raised by `enqueue_job` when the ingestion backlog is at capacity."""
+
+def queue_depth(db: Session) -> int:
+    return db.query(ProcessingJob).filter(ProcessingJob.status.in_(ACTIVE_STATUSES)).count()
+
+def enqueue_job(db: Session, filename: str, file_path: str, context: str = None, project_id: int = None) -> ProcessingJob:
+    if queue_depth(db) >= settings.INGEST_QUEUE_MAX_PENDING:
+        raise QueueFullError(f"Ingestion queue is full ({settings.INGEST_QUEUE_MAX_PENDING} jobs pending)")
+
+    job = ProcessingJob(
+        filename=filename,
+        file_path=file_path,
+        context=context,
+        project_id=project_id,
+        status="Pending",
+        attempts=0,
+    )
+    if context:
+        job.message = f"Queued with context: {context}"
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+def claim_next_job(db: Session, worker_id: str) -> Optional[ProcessingJob]:
+    """
+    Atomically claims the oldest runnable job for `worker_id`.
+
+    The claim is a compare-and-set UPDATE on the status column, so when several
+    worker processes race for the same row only one of them gets it.
+    """
+    now = datetime.utcnow()
+    candidates = (
+        db.query(ProcessingJob.id)
+        .filter(
+            ProcessingJob.status == "Pending",
+            or_(ProcessingJob.next_run_at.is_(None), ProcessingJob.next_run_at <= now),
+        )
+        .order_by(ProcessingJob.id)
+        .limit(5)
+        .all()
+    )
+    for (job_id,) in candidates:
+        claimed = (
+            db.query(ProcessingJob)
+            .filter(ProcessingJob.id == job_id, ProcessingJob.status == "Pending")
+            .update(
+                {
+                    ProcessingJob.status: "Processing",
+                    ProcessingJob.locked_by: worker_id,
+                    ProcessingJob.heartbeat_at: now,
+                    ProcessingJob.attempts: func.coalesce(ProcessingJob.attempts, 0) + 1,
+                },
+                synchronize_session=False,
+            )
+        )
+        db.commit()
+        if claimed:
+            return db.query(ProcessingJob).filter(ProcessingJob.id == job_id).first()
+    return None
+
+def heartbeat(db: Session, job_id: int, worker_id: str) -> bool:
+    """Returns False if the job is no longer ours (e.g. it was requeued as stale)."""
+    updated = (
+        db.query(ProcessingJob)
+        .filter(ProcessingJob.id == job_id, ProcessingJob.locked_by == worker_id, ProcessingJob.status == "Processing")
+        .update({ProcessingJob.heartbeat_at: datetime.utcnow()}, synchronize_session=False)
+    )
+    db.commit()
+    return bool(updated)
+
+def _remove_file(job: ProcessingJob):
+    # Uploads in the blob store are kept for reprocessing; only files queued from elsewhere are removed
+    if job.file_path and not in_blob_store(job.file_path) and os.path.exists(job.file_path):
+        os.remove(job.file_path)
+
+def _release(db: Session, job: ProcessingJob, worker_id: str, values: dict) -> bool:
+    # Compare-and-set on the lock, like the claim: a worker whose job was requeued as stale
+    # (and possibly claimed again) must not overwrite the new owner's status
+    released = (
+        db.query(ProcessingJob)
+        .filter(ProcessingJob.id == job.id, ProcessingJob.locked_by == worker_id, ProcessingJob.status == "Processing")
+        .update({ProcessingJob.locked_by: None, **values}, synchronize_session=False)
+    )
+    if not released:
+        db.rollback()
+    return bool(released)
+
+def complete_job(db: Session, job: ProcessingJob, worker_id: str, message: str) -> bool:
+    """Marks the job Completed. Returns False, changing nothing, if `worker_id` no longer holds it."""
+    if not _release(db, job, worker_id, {ProcessingJob.status: "Completed", ProcessingJob.message: message}):
+        return False
+    db.commit()
+    _remove_file(job)
+    return True
+
+def fail_job(db: Session, job: ProcessingJob, worker_id: str, error: str) -> bool:
+    """
+    Schedules a retry with exponential backoff, or marks the job Failed once
+    attempts run out. Returns False, changing nothing, if `worker_id` no longer holds it.
+    """
+    attempts = job.attempts or 1
+    if attempts < settings.INGEST_MAX_ATTEMPTS:
+        delay = settings.INGEST_RETRY_BACKOFF_SECONDS * (2 ** (attempts - 1))
+        values = {
+            ProcessingJob.status: "Pending",
+            ProcessingJob.next_run_at: datetime.utcnow() + timedelta(seconds=delay),
+            ProcessingJob.message: f"Attempt {attempts} failed: {error}. Retrying in {int(delay)}s.",
+        }
+    else:
+        values = {ProcessingJob.status: "Failed", ProcessingJob.message: error}
+    if not _release(db, job, worker_id, values):
+        return False
+    if attempts >= settings.INGEST_MAX_ATTEMPTS:
+        fail_file_for_job(db, job.id)
+    db.commit()
+    if job.status == "Failed":
+        _remove_file(job)
+    return True
+
+def requeue_stale_jobs(db: Session) -> int:
+    """
+    Returns jobs whose worker stopped sending heartbeats (crash, restart) to the
+    queue. Jobs without a stored file cannot be retried and are failed instead.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=settings.INGEST_HEARTBEAT_TIMEOUT_SECONDS)
+    stale = (
+        db.query(ProcessingJob)
+        .filter(
+            ProcessingJob.status == "Processing",
+            or_(ProcessingJob.heartbeat_at.is_(None), ProcessingJob.heartbeat_at < cutoff),
+        )
+        .all()
+    )
+    for job in stale:
+        if (job.attempts or 0) >= settings.INGEST_MAX_ATTEMPTS:
+            # Don't let a document that keeps killing its worker loop forever
+            job.status = "Failed"
+            job.message = f"Worker stopped responding on each of {job.attempts} attempts."
+            fail_file_for_job(db, job.id)
+            _remove_file(job)
+        elif job.file_path and os.path.exists(job.file_path):
+            print(f"Requeueing stale job {job.id} (worker {job.locked_by} stopped responding)")
+            job.status = "Pending"
+            job.locked_by = None
+            job.next_run_at = None
+        else:
+            job.status = "Failed"
+            job.message = "Interrupted by a restart and the uploaded file is no longer available. Please re-upload."
+            fail_file_for_job(db, job.id)
+    db.commit()
+    return len(stale)
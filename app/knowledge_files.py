@@ -0,0 +1,73 @@
+import hashlib
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import func, literal_column
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+from app.models import KnowledgeFile
+
+# The files registry: one KnowledgeFile row per (project, filename), which is
+# also the scope chunks are stored under in the vector store (see
+# app/chunk_sync.py). Uploads register the file as Queued with its content
+# hash and size; ingestion moves it to Processing, then to Indexed with page
+# and chunk counts once its chunks are in the vector store. A job that fails
+# for good before that leaves the file Failed.
+
+def copy_with_digest(source, destination=None, chunk_size: int = 1024 * 1024):
+    """Reads a file object to the end, copying it to `destination` if given. Returns (sha256, size in bytes)."""
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        digest.update(chunk)
+        size += len(chunk)
+        if destination is not None:
+            destination.write(chunk)
+    return digest.hexdigest(), size
+
+def file_digest(path: str):
+    with open(path, "rb") as source:
+        return copy_with_digest(source)
+
+def _scope():
+    # The unique index's first column: files without a project share scope 0 (project ids start at 1).
+    # The 0 is inlined rather than bound, or SQLite won't match the expression to the index.
+    return func.coalesce(KnowledgeFile.project_id, literal_column("0"))
+
+def find_file(db: Session, filename: str, project_id: Optional[int] = None) -> Optional[KnowledgeFile]:
+    return db.query(KnowledgeFile).filter(_scope() == (project_id or 0), KnowledgeFile.filename == filename).first()
+
+def register_file(db: Session, filename: str, project_id: Optional[int], job_id: int, status: str = "Queued",
+                  content_hash: str = None, size_bytes: int = None) -> KnowledgeFile:
+    """
+    Creates or updates the file's row for a new ingestion job, as one upsert,
+    so concurrent uploads of the same file end up sharing the row.
+    """
+    now = datetime.utcnow()
+    changes = {"job_id": job_id, "status": status, "updated_at": now}
+    if content_hash is not None:
+        changes.update(content_hash=content_hash, size_bytes=size_bytes)
+    db.execute(
+        insert(KnowledgeFile)
+        .values(filename=filename, project_id=project_id or None, created_at=now, **changes)
+        .on_conflict_do_update(
+            index_elements=[_scope(), KnowledgeFile.filename],
+            set_=changes,
+        )
+    )
+    db.commit()
+    return find_file(db, filename, project_id)
+
+def update_file_for_job(db: Session, job_id: int, **fields) -> int:
+    """Updates the file whose latest job is `job_id` (no-op if a newer upload took over). Returns rows changed."""
+    updated = db.query(KnowledgeFile).filter(KnowledgeFile.job_id == job_id).update(fields, synchronize_session=False)
+    db.commit()
+    return updated
+
+def fail_file_for_job(db: Session, job_id: int):
+    # Files already Indexed keep that status: their chunks made it into the vector store
+    db.query(KnowledgeFile).filter(
+        KnowledgeFile.job_id == job_id, KnowledgeFile.status != "Indexed"
+    ).update({KnowledgeFile.status: "Failed"}, synchronize_session=False)
@@ -0,0 +1,245 @@
+import argparse
+import asyncio
+import json
+import re
+import sqlite3
+import threading
+from typing import List, Optional
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle, TextNode
+from llama_index.core.vector_stores import ExactMatchFilter, MetadataFilters
+from llama_index.core.vector_stores.utils import metadata_dict_to_node
+from app.config import settings
+from app.chunk_sync import NON_CONTENT_METADATA_KEYS
+
+# Local BM25 index over the same chunks as the vector store.
+#
+# Chunks live in a plain table (looked up by node id and by file) with an
+# external-content FTS5 table on top, kept in sync by triggers. Ingestion
+# updates it alongside the vector store (see app/chunk_sync.py), so it only
+# ever touches the chunks of the file being ingested. Queries need no
+# embedding call: exact terms such as product SKUs match directly, and
+# `HybridRetriever` fuses these results with the vector ones.
+
+_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS chunks ("
+    " id INTEGER PRIMARY KEY, node_id TEXT UNIQUE, filename TEXT, project_id TEXT, text TEXT, metadata TEXT)",
+    "CREATE INDEX IF NOT EXISTS ix_chunks_file ON chunks (filename, project_id)",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5("
+    " text, content='chunks', content_rowid='id', tokenize='porter unicode61')",
+    "CREATE TRIGGER IF NOT EXISTS chunks_ai AFTER INSERT ON chunks BEGIN"
+    " INSERT INTO chunks_fts (rowid, text) VALUES (new.id, new.text); END",
+    "CREATE TRIGGER IF NOT EXISTS chunks_ad AFTER DELETE ON chunks BEGIN"
+    " INSERT INTO chunks_fts (chunks_fts, rowid, text) VALUES ('delete', old.id, old.text); END",
+]
+
+def _project_key(project_id) -> str:
+    # Same scoping as the vector store metadata: project id as a string, empty for no project
+    return str(project_id) if project_id else ""
+
+def project_filters(project_id) -> Optional[MetadataFilters]:
+    """Filters that scope a lexical search to one project (None searches everything)."""
+    if not project_id:
+        return None
+    return MetadataFilters(filters=[ExactMatchFilter(key="project_id", value=str(project_id))])
+
+def match_expression(query: str) -> Optional[str]:
+    """FTS5 query matching any of the query's terms; BM25 ranks chunks that match more (and rarer) terms first."""
+    terms = re.findall(r"\w+", query.lower())
+    if not terms:
+        return None
+    return " OR ".join(f'"{term}"' for term in dict.fromkeys(terms))
+
+class LexicalIndex:
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL") # Ingestion workers write while the API reads
+        for statement in _SCHEMA:
+            self._conn.execute(statement)
+        self._conn.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def node_ids(self, filename: str, project_id=None) -> set:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT node_id FROM chunks WHERE filename = ? AND project_id = ?", (filename, _project_key(project_id))
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def upsert(self, nodes):
+        rows = [
+            (node.node_id, node.metadata.get("filename"), _project_key(node.metadata.get("project_id")),
+             node.get_content(metadata_mode=MetadataMode.NONE), json.dumps(node.metadata))
+            for node in nodes
+        ]
+        with self._lock:
+            # Delete then insert (not REPLACE) so the delete trigger keeps the FTS table in step
+            self._conn.executemany("DELETE FROM chunks WHERE node_id = ?", [(row[0],) for row in rows])
+            self._conn.executemany(
+                "INSERT INTO chunks (node_id, filename, project_id, text, metadata) VALUES (?, ?, ?, ?, ?)", rows
+            )
+            self._conn.commit()
+
+    def delete(self, node_ids):
+        with self._lock:
+            self._conn.executemany("DELETE FROM chunks WHERE node_id = ?", [(node_id,) for node_id in node_ids])
+            self._conn.commit()
+
+    def sync_file(self, filename: str, project_id, nodes, changed_ids=()) -> dict:
+        """
+        Makes the file's chunks match `nodes`: removes chunks that are gone,
+        adds missing ones and rewrites `changed_ids` (metadata changes).
+        """
+        desired = {node.node_id: node for node in nodes}
+        existing = self.node_ids(filename, project_id)
+        stale = existing - set(desired)
+        changed = set(changed_ids) & existing
+        missing = [node for node_id, node in desired.items() if node_id not in existing or node_id in changed]
+        if stale:
+            self.delete(stale)
+        if missing:
+            self.upsert(missing)
+        return {"added": len(missing) - len(changed), "updated": len(changed), "removed": len(stale)}
+
+    def delete_project(self, project_id) -> int:
+        with self._lock:
+            deleted = self._conn.execute("DELETE FROM chunks WHERE project_id = ?", (_project_key(project_id),)).rowcount
+            self._conn.commit()
+        return deleted
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.execute("INSERT INTO chunks_fts (chunks_fts) VALUES ('rebuild')")
+            self._conn.commit()
+
+    def rebuild_from_collections(self, collections, batch_size: int = 1000) -> int:
+        """Re-creates the index from everything in the given Chroma collections (no embeddings are read)."""
+        self.clear()
+        return sum(self._index_collection(collection, batch_size) for collection in collections)
+
+    def _index_collection(self, collection, batch_size: int) -> int:
+        total = 0
+        offset = 0
+        while True:
+            batch = collection.get(include=["documents", "metadatas"], limit=batch_size, offset=offset)
+            if not batch["ids"]:
+                break
+            nodes = []
+            for node_id, text, metadata in zip(batch["ids"], batch["documents"], batch["metadatas"]):
+                try:
+                    node = metadata_dict_to_node(metadata or {}, text=text)
+                except Exception:
+                    node = TextNode(id_=node_id, text=text or "", metadata=metadata or {})
+                node.id_ = node_id
+                nodes.append(node)
+            self.upsert(nodes)
+            total += len(nodes)
+            offset += len(batch["ids"])
+        return total
+
+    def search(self, query: str, top_k: int = 5, filters: MetadataFilters = None) -> List[NodeWithScore]:
+        expression = match_expression(query)
+        if expression is None:
+            return []
+        sql = (
+            "SELECT c.node_id, c.text, c.metadata, -bm25(chunks_fts) AS score "
+            "FROM chunks_fts JOIN chunks c ON c.id = chunks_fts.rowid WHERE chunks_fts MATCH ?"
+        )
+        params = [expression]
+        for metadata_filter in (filters.filters if filters is not None else []):
+            # Exact-match filters only, which is all the app uses (project_id)
+            if metadata_filter.key == "project_id":
+                sql += " AND c.project_id = ?"
+                params.append(_project_key(metadata_filter.value))
+            else:
+                sql += " AND json_extract(c.metadata, ?) = ?"
+                params += [f"$.{metadata_filter.key}", metadata_filter.value]
+        sql += " ORDER BY bm25(chunks_fts) LIMIT ?"
+        params.append(top_k)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [
+            NodeWithScore(
+                node=TextNode(
+                    id_=node_id, text=text, metadata=json.loads(metadata),
+                    excluded_embed_metadata_keys=list(NON_CONTENT_METADATA_KEYS),
+                    excluded_llm_metadata_keys=["chunk_hash"],
+                ),
+                score=score,
+            )
+            for node_id, text, metadata, score in rows
+        ]
+
+class LexicalRetriever(BaseRetriever):
+    """BM25 retrieval from the local index; no embedding call."""
+
+    def __init__(self, index: LexicalIndex, similarity_top_k: int = 5, filters: MetadataFilters = None):
+        super().__init__()
+        self.index = index
+        self.similarity_top_k = similarity_top_k
+        self.filters = filters
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        return self.index.search(query_bundle.query_str, self.similarity_top_k, self.filters)
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        # The FTS5 query is a blocking sqlite3 call
+        return await asyncio.to_thread(self._retrieve, query_bundle)
+
+def reciprocal_rank_fusion(result_lists, top_k: int, k: int = 60) -> List[NodeWithScore]:
+    """
+    Merges ranked lists by summing 1 / (k + rank) per node. Ranks, not raw
+    scores, are combined, since BM25 and cosine scores aren't comparable.
+    """
+    fused, nodes = {}, {}
+    for results in result_lists:
+        for rank, result in enumerate(results, start=1):
+            node_id = result.node.node_id
+            fused[node_id] = fused.get(node_id, 0.0) + 1.0 / (k + rank)
+            nodes.setdefault(node_id, result.node)
+    ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:top_k]
+    return [NodeWithScore(node=nodes[node_id], score=score) for node_id, score in ranked]
+
+class HybridRetriever(BaseRetriever):
+    """
+    Fuses BM25 and vector results into the top `similarity_top_k`. The caller
+    sizes the two child retrievers (the registry asks each for twice as many
+    candidates as are returned).
+    """
+
+    def __init__(self, vector_retriever, lexical_retriever: LexicalRetriever, similarity_top_k: int = 5,
+                 rrf_k: int = None):
+        super().__init__()
+        self.vector_retriever = vector_retriever
+        self.lexical_retriever = lexical_retriever
+        self.similarity_top_k = similarity_top_k
+        self.rrf_k = rrf_k or settings.HYBRID_RRF_K
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        lexical = self.lexical_retriever.retrieve(query_bundle)
+        vector = self.vector_retriever.retrieve(query_bundle)
+        return reciprocal_rank_fusion([lexical, vector], self.similarity_top_k, self.rrf_k)
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        lexical, vector = await asyncio.gather(
+            self.lexical_retriever.aretrieve(query_bundle), self.vector_retriever.aretrieve(query_bundle)
+        )
+        return reciprocal_rank_fusion([lexical, vector], self.similarity_top_k, self.rrf_k)
+
+if __name__ == "__main__":
+    from app.resources import registry
+
+    parser = argparse.ArgumentParser(description="Local BM25 index over the knowledge base")
+    parser.add_argument("--rebuild", action="store_true", help="Re-create the index from the vector store")
+    args = parser.parse_args()
+
+    if not args.rebuild:
+        parser.error("nothing to do (use --rebuild)")
+    collections = [registry.collection(name) for name in registry.collection_names()]
+    print(f"Indexed {registry.lexical_index().rebuild_from_collections(collections)} chunks")
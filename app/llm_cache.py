@@ -0,0 +1,233 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from typing import Iterator, Optional
+from llama_index.core.query_engine import RetrieverQueryEngine
+from llama_index.core.schema import QueryBundle
+from app.config import settings
+from app.metrics import LLM_CACHE_LOOKUPS, span, timed_iter
+
+class LLMCache:
+    """
+    Persistent, content-addressed store for LLM responses.
+
+    Entries live in a small SQLite file next to the app database. Each entry
+    expires after `ttl_seconds`, and once the table grows past `max_entries`
+    the least recently used rows are evicted.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL") # Worker processes share the file with the API
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            " key TEXT PRIMARY KEY, call_site TEXT, response TEXT,"
+            " created_at REAL, last_access REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_cache_last_access ON llm_cache (last_access)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+
+    def get(self, key: str, call_site: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row and now - row[1] <= self.ttl_seconds:
+                self._conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+                self.hits[call_site] += 1
+                LLM_CACHE_LOOKUPS.labels(call_site, "hit").inc()
+                return row[0]
+            if row:
+                # Expired
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                self._size -= 1
+            self.misses[call_site] += 1
+            LLM_CACHE_LOOKUPS.labels(call_site, "miss").inc()
+            return None
+
+    def set(self, key: str, call_site: str, response: str):
+        now = time.time()
+        with self._lock:
+            # INSERT OR REPLACE reports one row either way, so only count keys that weren't there yet
+            exists = self._conn.execute("SELECT 1 FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, call_site, response, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, call_site, response, now, now),
+            )
+            if exists is None:
+                self._size += 1
+            if self._size > self.max_entries:
+                self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        # Drop expired rows first, then the least recently used ones until we are back under the limit
+        self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+        self._size = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        overflow = self._size - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM llm_cache WHERE key IN "
+                "(SELECT key FROM llm_cache ORDER BY last_access ASC LIMIT ?)",
+                (overflow,),
+            )
+            self._size -= overflow
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+            self._size = 0
+
+    def stats(self) -> dict:
+        call_sites = sorted(set(self.hits) | set(self.misses))
+        return {
+            "entries": self._size,
+            "call_sites": {
+                site: {"hits": self.hits[site], "misses": self.misses[site]} for site in call_sites
+            },
+        }
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_llm_cache() -> LLMCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LLMCache(
+                    settings.LLM_CACHE_PATH,
+                    ttl_seconds=settings.LLM_CACHE_TTL_SECONDS,
+                    max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+                )
+    return _cache
+
+def make_cache_key(prompt: str, node_ids=None, filters=None, model: str = None) -> str:
+    payload = {
+        "prompt": prompt,
+        "model": model or settings.LLM_MODEL_NAME,
+        "nodes": list(node_ids or []),
+        "filters": filters.model_dump_json() if filters is not None else None,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+def _cache_enabled(bypass: bool) -> bool:
+    return settings.LLM_CACHE_ENABLED and not bypass
+
+def cached_query(query_engine, prompt: str, call_site: str, filters=None, bypass: bool = False) -> str:
+    """
+    Drop-in replacement for `str(query_engine.query(prompt))`.
+
+    For retriever-backed engines the retrieval step runs first and the IDs of
+    the retrieved nodes become part of the cache key, so a response is only
+    reused when the LLM would have seen exactly the same context. Retrieval and
+    generation are timed as separate spans either way.
+    """
+    cache = get_llm_cache() if _cache_enabled(bypass) else None
+    if isinstance(query_engine, RetrieverQueryEngine):
+        query_bundle = QueryBundle(prompt)
+        with span("retrieval", call_site):
+            nodes = query_engine.retrieve(query_bundle)
+        key = make_cache_key(prompt, [n.node.node_id for n in nodes], filters)
+        cached = cache.get(key, call_site) if cache else None
+        if cached is not None:
+            return cached
+        with span("llm", call_site):
+            response = str(query_engine.synthesize(query_bundle, nodes))
+    else:
+        key = make_cache_key(prompt, filters=filters)
+        cached = cache.get(key, call_site) if cache else None
+        if cached is not None:
+            return cached
+        with span("llm", call_site):
+            response = str(query_engine.query(prompt))
+
+    if cache:
+        cache.set(key, call_site, response)
+    return response
+
+async def acached_query(query_engine, prompt: str, call_site: str, filters=None, bypass: bool = False) -> str:
+    """
+    Async variant of `cached_query` (uses `aretrieve`/`asynthesize`/`aquery`).
+    Cache lookups and writes are sqlite3 calls, so they run in worker threads.
+    """
+    cache = get_llm_cache() if _cache_enabled(bypass) else None
+    if isinstance(query_engine, RetrieverQueryEngine):
+        query_bundle = QueryBundle(prompt)
+        with span("retrieval", call_site):
+            nodes = await query_engine.aretrieve(query_bundle)
+        key = make_cache_key(prompt, [n.node.node_id for n in nodes], filters)
+        cached = await asyncio.to_thread(cache.get, key, call_site) if cache else None
+        if cached is not None:
+            return cached
+        with span("llm", call_site):
+            response = str(await query_engine.asynthesize(query_bundle, nodes))
+    else:
+        key = make_cache_key(prompt, filters=filters)
+        cached = await asyncio.to_thread(cache.get, key, call_site) if cache else None
+        if cached is not None:
+            return cached
+        with span("llm", call_site):
+            response = str(await query_engine.aquery(prompt))
+
+    if cache:
+        await asyncio.to_thread(cache.set, key, call_site, response)
+    return response
+
+def _response_tokens(response) -> Iterator[str]:
+    # Engines built with streaming=True return a StreamingResponse; anything else is one chunk
+    response_gen = getattr(response, "response_gen", None)
+    if response_gen is not None:
+        yield from response_gen
+    else:
+        yield str(response)
+
+def stream_cached_query(query_engine, prompt: str, call_site: str, filters=None, bypass: bool = False) -> Iterator[str]:
+    """
+    Streaming variant of `cached_query`: yields response tokens as the LLM
+    produces them. A cache hit comes back as a single chunk, and the full text
+    is cached once the stream has been consumed to the end.
+    """
+    cache = get_llm_cache() if _cache_enabled(bypass) else None
+    if isinstance(query_engine, RetrieverQueryEngine):
+        query_bundle = QueryBundle(prompt)
+        with span("retrieval", call_site):
+            nodes = query_engine.retrieve(query_bundle)
+        key = make_cache_key(prompt, [n.node.node_id for n in nodes], filters)
+        cached = cache.get(key, call_site) if cache else None
+        if cached is not None:
+            yield cached
+            return
+        with span("llm", call_site):
+            response = query_engine.synthesize(query_bundle, nodes)
+    else:
+        key = make_cache_key(prompt, filters=filters)
+        cached = cache.get(key, call_site) if cache else None
+        if cached is not None:
+            yield cached
+            return
+        with span("llm", call_site):
+            response = query_engine.query(prompt)
+
+    # The body may be resumed from different threads, so no span is held open across a yield
+    chunks = []
+    for token in timed_iter(_response_tokens(response), "llm", call_site):
+        chunks.append(token)
+        yield token
+    if cache:
+        cache.set(key, call_site, "".join(chunks))
@@ -1,11 +1,36 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
 from app.config import settings
-from app.models import Base
 from app.database import engine
-from app.routers import training, auth, admin, projects
+from app.migrations import run_migrations
+from app.metrics import metrics_middleware, render_metrics
+from app.resources import registry
+from app.assessment import prefetcher
+from app.password_hashing import password_hasher
+from app.routers import training, auth, admin, projects, dashboard
 from fastapi.middleware.cors import CORSMiddleware
 
-app = FastAPI(title=settings.APP_NAME)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Shared Chroma client, index and query engines for every request
+    registry.start(warmup=settings.WARMUP_ON_STARTUP)
+    # argon2 worker processes, up before the first login
+    password_hasher.start()
+
+    # Ingestion runs in separate worker processes, never inside the API process
+    pool = None
+    if settings.INGEST_RUN_WORKERS_WITH_API and settings.INGEST_WORKERS > 0:
+        from app.worker import WorkerPool
+        pool = WorkerPool()
+        pool.start()
+    yield
+    if pool:
+        pool.stop()
+    prefetcher.shutdown()
+    password_hasher.shutdown()
+    registry.reset()
+
+app = FastAPI(title=settings.APP_NAME, lifespan=lifespan)
 
 # CORS
 app.add_middleware(
@@ -16,13 +41,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-Base.metadata.create_all(bind=engine)
+# Per-endpoint latency histograms, request-scoped span totals and the optional Server-Timing header
+app.middleware("http")(metrics_middleware)
+
+run_migrations(engine)
 
 @app.get("/")
 def read_root():
     return {"message": "Welcome to the Sales Training Simulator API"}
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 app.include_router(training.router, prefix="/api/v1", tags=["training"])
 app.include_router(auth.router, prefix="/api/v1/auth", tags=["auth"])
 app.include_router(admin.router, prefix="/api/v1/admin", tags=["admin"])
 app.include_router(projects.router, prefix="/api/v1/projects", tags=["projects"])
+app.include_router(dashboard.router, prefix="/api/v1/dashboard", tags=["dashboard"])
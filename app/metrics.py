@@ -0,0 +1,210 @@
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest
+from llama_index.core.instrumentation import get_dispatcher
+from llama_index.core.instrumentation.event_handlers import BaseEventHandler
+from llama_index.core.instrumentation.events.llm import LLMChatEndEvent, LLMCompletionEndEvent
+from app.config import settings
+
+# Timing spans and Prometheus metrics for the hot paths.
+#
+# A span records how long one step took under a kind (llm, retrieval,
+# db_query, db_commit, ingest_stage, password_hash) and a call site (fallback_generation,
+# explanation, topic_extraction, parse, ...). Spans also add up per request,
+# which is what the optional Server-Timing header reports. LLM calls and
+# token usage are counted from LlamaIndex's instrumentation events, labelled
+# with the call site and the endpoint that triggered them.
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+SPAN_SECONDS = Histogram(
+    "sales_training_span_seconds", "Duration of instrumented steps", ["kind", "call_site"], buckets=LATENCY_BUCKETS
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "sales_training_http_request_seconds", "HTTP request latency", ["method", "endpoint", "status"], buckets=LATENCY_BUCKETS
+)
+LLM_CALLS = Counter("sales_training_llm_calls_total", "LLM calls made (cache hits excluded)", ["call_site", "endpoint"])
+LLM_TOKENS = Counter(
+    "sales_training_llm_tokens_total", "LLM tokens used", ["call_site", "endpoint", "direction"] # prompt or completion
+)
+LLM_CACHE_LOOKUPS = Counter("sales_training_llm_cache_lookups_total", "LLM response cache lookups", ["call_site", "result"])
+PASSWORD_HASH_QUEUE_DEPTH = Gauge(
+    "sales_training_password_hash_queue_depth", "argon2 jobs waiting for a hashing worker", multiprocess_mode="livesum"
+)
+PASSWORD_HASH_IN_FLIGHT = Gauge(
+    "sales_training_password_hash_in_flight", "argon2 jobs queued or running", multiprocess_mode="livesum"
+)
+PASSWORD_HASH_REJECTED = Counter(
+    "sales_training_password_hash_rejected_total", "argon2 jobs rejected because the queue was full", ["operation"]
+)
+AUTH_CACHE_LOOKUPS = Counter("sales_training_auth_cache_lookups_total", "Verified-token cache lookups", ["result"])
+
+_call_site: ContextVar[str] = ContextVar("call_site", default="unknown")
+_request_scope: ContextVar[Optional[dict]] = ContextVar("request_scope", default=None)
+_request_timings: ContextVar[Optional[dict]] = ContextVar("request_timings", default=None)
+
+def _route_path(scope: dict) -> str:
+    # Label by route template (/get_question/{session_id}), not the raw path, to keep label cardinality bounded.
+    # The router stores the matched route in the scope before the endpoint runs.
+    route = scope.get("route")
+    template = getattr(route, "path", None)
+    if template is None:
+        return "unmatched"
+    # Routes from included routers carry their path without the router prefix (e.g. /api/v1): recover
+    # the prefix as the part of the request path in front of what the route's own pattern matches
+    path = scope.get("path", "")
+    regex = getattr(route, "path_regex", None)
+    if regex is not None and not regex.match(path):
+        for i, char in enumerate(path):
+            if char == "/" and regex.match(path[i:]):
+                return path[:i] + template
+    return template
+
+def current_endpoint() -> str:
+    """Route of the request being handled, or "background" outside of one (workers, background tasks)."""
+    scope = _request_scope.get()
+    return _route_path(scope) if scope is not None else "background"
+
+class SpanTimer:
+    seconds: float = 0.0
+
+def observe_span(kind: str, call_site: str, seconds: float):
+    SPAN_SECONDS.labels(kind, call_site).observe(seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[kind]["seconds"] += seconds
+        timings[kind]["count"] += 1
+
+@contextmanager
+def span(kind: str, call_site: str):
+    """Times the block; `call_site` is also visible to LLM events raised inside it."""
+    timer = SpanTimer()
+    token = _call_site.set(call_site)
+    start = time.perf_counter()
+    try:
+        yield timer
+    finally:
+        timer.seconds = time.perf_counter() - start
+        _call_site.reset(token)
+        observe_span(kind, call_site, timer.seconds)
+
+def timed_iter(iterable, kind: str, call_site: str):
+    """
+    Span over a generator that may be resumed from different threads (e.g. a
+    StreamingResponse body): each step is timed on its own and one span with
+    the total is recorded when the iterator is exhausted.
+    """
+    iterator = iter(iterable)
+    total = 0.0
+    while True:
+        token = _call_site.set(call_site)
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            break
+        finally:
+            total += time.perf_counter() - start
+            _call_site.reset(token)
+        yield item
+    observe_span(kind, call_site, total)
+
+# LLM usage from LlamaIndex instrumentation events
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token), for when the API reports none."""
+    return max(1, len(text) // 4) if text else 0
+
+def _usage(response, prompt_text: str):
+    """(prompt, completion) tokens as reported by Gemini, estimated from the text otherwise."""
+    raw = getattr(response, "raw", None) or {}
+    usage = raw.get("usage_metadata") if isinstance(raw, dict) else getattr(raw, "usage_metadata", None)
+    if isinstance(usage, dict) and usage.get("prompt_token_count") is not None:
+        return usage.get("prompt_token_count", 0), usage.get("candidates_token_count", 0)
+    text = getattr(response, "text", None)
+    if text is None:
+        text = str(getattr(getattr(response, "message", None), "content", "") or "")
+    return estimate_tokens(prompt_text), estimate_tokens(text)
+
+class LLMUsageHandler(BaseEventHandler):
+    @classmethod
+    def class_name(cls) -> str:
+        return "LLMUsageHandler"
+
+    def handle(self, event, **kwargs):
+        if isinstance(event, LLMCompletionEndEvent):
+            prompt_text = event.prompt
+        elif isinstance(event, LLMChatEndEvent):
+            prompt_text = " ".join(str(message.content or "") for message in event.messages)
+        else:
+            return
+        call_site, endpoint = _call_site.get(), current_endpoint()
+        prompt_tokens, completion_tokens = _usage(event.response, prompt_text)
+        LLM_CALLS.labels(call_site, endpoint).inc()
+        LLM_TOKENS.labels(call_site, endpoint, "prompt").inc(prompt_tokens)
+        LLM_TOKENS.labels(call_site, endpoint, "completion").inc(completion_tokens)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings["llm_tokens"]["count"] += prompt_tokens + completion_tokens
+
+get_dispatcher().add_event_handler(LLMUsageHandler())
+
+# Database
+
+def instrument_engine(engine):
+    """Times every statement on `engine` as a db_query span (commits are timed by the session)."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start_query(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _end_query(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info["query_start"].pop()
+        observe_span("db_query", current_endpoint(), time.perf_counter() - start)
+
+# HTTP
+
+def server_timing(timings: dict, total: float) -> str:
+    parts = [
+        f'{kind};dur={values["seconds"] * 1000:.1f};desc="{values["count"]}"'
+        for kind, values in sorted(timings.items()) if kind != "llm_tokens"
+    ]
+    if timings.get("llm_tokens", {}).get("count"):
+        parts.append(f'llm_tokens;desc="{timings["llm_tokens"]["count"]}"')
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+async def metrics_middleware(request, call_next):
+    timings = defaultdict(lambda: {"seconds": 0.0, "count": 0})
+    scope_token = _request_scope.set(request.scope)
+    timings_token = _request_timings.set(timings)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        if settings.METRICS_TIMING_HEADER:
+            response.headers["Server-Timing"] = server_timing(timings, time.perf_counter() - start)
+        return response
+    finally:
+        endpoint = _route_path(request.scope)
+        if endpoint != "/metrics":
+            HTTP_REQUEST_SECONDS.labels(request.method, endpoint, str(status)).observe(time.perf_counter() - start)
+        _request_timings.reset(timings_token)
+        _request_scope.reset(scope_token)
+
+def render_metrics():
+    """Prometheus text exposition; merges worker processes when PROMETHEUS_MULTIPROC_DIR is set."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,138 @@
+from sqlalchemy import inspect, text
+from app.models import Base
+
+def add_missing_columns(engine):
+    """
+    `create_all` only creates missing tables, so columns added to existing
+    models would never reach an existing database. Add them in place
+    (SQLite only supports nullable ADD COLUMN, which is all we need).
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                print(f"Migration: added column {table.name}.{column.name}")
+
+def merge_duplicate_topics(conn):
+    """
+    Topics are unique per (project_id, name) now. Older databases can hold
+    duplicates from concurrent ingestions: point everything at the oldest row
+    and drop the rest.
+    """
+    groups = conn.execute(text(
+        "SELECT MIN(id), GROUP_CONCAT(id) FROM topics "
+        "WHERE project_id IS NOT NULL GROUP BY project_id, name HAVING COUNT(*) > 1"
+    )).all()
+    for keep_id, ids in groups:
+        duplicates = [int(i) for i in ids.split(",") if int(i) != keep_id]
+        params = {"keep": keep_id, **{f"d{i}": d for i, d in enumerate(duplicates)}}
+        placeholders = ", ".join(f":d{i}" for i in range(len(duplicates)))
+        for table in ("question_bank", "question_history", "assessment_sessions", "topic_scores"):
+            conn.execute(text(f"UPDATE {table} SET topic_id = :keep WHERE topic_id IN ({placeholders})"), params)
+        conn.execute(text(f"DELETE FROM topics WHERE id IN ({placeholders})"), params)
+        print(f"Migration: merged topics {duplicates} into {keep_id}")
+
+def merge_duplicate_topic_scores(conn):
+    # One row per (user, topic); duplicates each hold part of the score, so add them up
+    groups = conn.execute(text(
+        "SELECT user_id, topic_id, MIN(id), SUM(score) FROM topic_scores "
+        "GROUP BY user_id, topic_id HAVING COUNT(*) > 1"
+    )).all()
+    for user_id, topic_id, keep_id, score in groups:
+        conn.execute(text(
+            "UPDATE topic_scores SET score = :score, proficiency_level = "
+            "CASE WHEN :score >= 60 THEN 'Advanced' WHEN :score >= 30 THEN 'Intermediate' ELSE 'Beginner' END "
+            "WHERE id = :keep"
+        ), {"score": score, "keep": keep_id})
+        conn.execute(text(
+            "DELETE FROM topic_scores WHERE user_id = :user AND topic_id = :topic AND id != :keep"
+        ), {"user": user_id, "topic": topic_id, "keep": keep_id})
+        print(f"Migration: merged duplicate topic scores for user {user_id}, topic {topic_id}")
+
+def merge_duplicate_knowledge_files(conn):
+    """
+    Files are unique per (project, filename) now. Concurrent uploads could
+    register one twice: keep the row of the latest job and drop the others
+    along with their stage checkpoints (those stages simply run again).
+    """
+    groups = conn.execute(text(
+        "SELECT COALESCE(project_id, 0), filename FROM knowledge_files "
+        "GROUP BY COALESCE(project_id, 0), filename HAVING COUNT(*) > 1"
+    )).all()
+    for scope, filename in groups:
+        ids = conn.execute(text(
+            "SELECT id FROM knowledge_files WHERE COALESCE(project_id, 0) = :scope AND filename = :filename "
+            "ORDER BY job_id IS NULL, job_id DESC, id DESC"
+        ), {"scope": scope, "filename": filename}).scalars().all()
+        keep_id, duplicates = ids[0], ids[1:]
+        params = {f"d{i}": d for i, d in enumerate(duplicates)}
+        placeholders = ", ".join(f":d{i}" for i in range(len(duplicates)))
+        conn.execute(text(f"DELETE FROM ingest_checkpoints WHERE file_id IN ({placeholders})"), params)
+        conn.execute(text(f"DELETE FROM knowledge_files WHERE id IN ({placeholders})"), params)
+        print(f"Migration: merged knowledge file rows {duplicates} into {keep_id}")
+
+def add_missing_indexes(engine):
+    # Same story for indexes declared on tables that already exist
+    with engine.begin() as conn:
+        # From sqlite_master: the inspector leaves out expression indexes
+        existing = set(conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'")).scalars())
+        # Unique indexes can only be created once existing duplicates are gone
+        if "ix_topics_project_name" not in existing:
+            merge_duplicate_topics(conn)
+        if "ix_topic_scores_user_topic" not in existing:
+            merge_duplicate_topic_scores(conn)
+        if "ix_knowledge_files_project_filename_unique" not in existing:
+            merge_duplicate_knowledge_files(conn)
+            # The non-unique index it replaces
+            conn.execute(text("DROP INDEX IF EXISTS ix_knowledge_files_project_filename"))
+
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(bind=conn)
+                    print(f"Migration: created index {index.name}")
+
+def backfill_aggregates(engine):
+    # Databases from before the dashboard aggregates existed get them computed once
+    from app.aggregates import rebuild_aggregates
+    with engine.begin() as conn:
+        rebuild_aggregates(conn)
+    print("Migration: built dashboard aggregates")
+
+def backfill_knowledge_files(engine):
+    # Register files ingested before the files registry existed; sizes and counts are unknown until re-ingested
+    with engine.begin() as conn:
+        added = conn.execute(text(
+            "INSERT INTO knowledge_files (project_id, filename, status, job_id, created_at, updated_at) "
+            "SELECT project_id, filename, 'Indexed', MAX(id), MIN(created_at), MAX(updated_at) "
+            "FROM processing_jobs WHERE status = 'Completed' GROUP BY project_id, filename"
+        )).rowcount
+    print(f"Migration: registered {added} knowledge base files")
+
+def backfill_question_index(engine):
+    # Signatures and LSH buckets for bank questions stored before near-duplicate detection existed
+    from sqlalchemy.orm import Session
+    from app.question_dedup import index_missing
+    with Session(engine) as db:
+        indexed = index_missing(db)
+        db.commit()
+    print(f"Migration: indexed {indexed} bank questions for near-duplicate detection")
+
+def run_migrations(engine):
+    existing_tables = set(inspect(engine).get_table_names())
+    Base.metadata.create_all(bind=engine)
+    add_missing_columns(engine)
+    add_missing_indexes(engine)
+    if "proficiency_stats" not in existing_tables:
+        backfill_aggregates(engine)
+    if "knowledge_files" not in existing_tables:
+        backfill_knowledge_files(engine)
+    if "question_bands" not in existing_tables:
+        backfill_question_index(engine)
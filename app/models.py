@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Float, DateTime, Text
-from sqlalchemy.orm import relationship, declarative_base
+from sqlalchemy import Column, Integer, String, ForeignKey, Float, DateTime, Text, Index, LargeBinary, func
+from sqlalchemy.orm import deferred, relationship, declarative_base
 from datetime import datetime
 
 Base = declarative_base()
@@ -22,6 +22,7 @@ class Project(Base):
 
     topics = relationship("Topic", back_populates="project")
     jobs = relationship("ProcessingJob", back_populates="project")
+    files = relationship("KnowledgeFile", back_populates="project")
     sessions = relationship("AssessmentSession", back_populates="project")
 
 class ProcessingJob(Base):
@@ -29,22 +30,92 @@ class ProcessingJob(Base):
     id = Column(Integer, primary_key=True, index=True)
     project_id = Column(Integer, ForeignKey("projects.id"), nullable=True) # Nullable for backward compatibility/default
     filename = Column(String)
-    status = Column(String, default="Pending") # Pending, Processing, Completed, Failed
+    status = Column(String, default="Pending", index=True) # Pending, Processing, Completed, Failed
     message = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    # Durable queue state (see app/job_queue.py)
+    file_path = Column(Text, nullable=True) # Uploaded file waiting to be ingested
+    context = Column(Text, nullable=True)
+    attempts = Column(Integer, default=0)
+    next_run_at = Column(DateTime, nullable=True) # Retry backoff, NULL = run as soon as possible
+    locked_by = Column(String, nullable=True) # Worker that claimed the job
+    heartbeat_at = Column(DateTime, nullable=True)
+
     project = relationship("Project", back_populates="jobs")
 
+    __table_args__ = (
+        Index("ix_processing_jobs_project_id", "project_id"),
+    )
+
+class KnowledgeFile(Base):
+    # What the vector store holds: one row per (project, filename), see app/knowledge_files.py
+    __tablename__ = "knowledge_files"
+    id = Column(Integer, primary_key=True, index=True)
+    project_id = Column(Integer, ForeignKey("projects.id"), nullable=True)
+    filename = Column(String)
+    status = Column(String, default="Queued") # Queued, Processing, Indexed, Failed
+    content_hash = Column(String, nullable=True) # sha256 of the last uploaded version
+    size_bytes = Column(Integer, nullable=True)
+    page_count = Column(Integer, nullable=True)
+    chunk_count = Column(Integer, nullable=True) # Chunks stored in the vector store
+    job_id = Column(Integer, ForeignKey("processing_jobs.id"), nullable=True) # Latest ingestion job
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    project = relationship("Project", back_populates="files")
+
+    __table_args__ = (
+        # Unique per (project, filename). On the expression, because SQLite treats NULLs
+        # (files without a project) as distinct in a plain unique index
+        Index("ix_knowledge_files_project_filename_unique", func.coalesce(project_id, 0), filename, unique=True),
+        Index("ix_knowledge_files_status", "status"),
+        Index("ix_knowledge_files_job_id", "job_id"),
+        Index("ix_knowledge_files_content_hash", "content_hash"),
+    )
+
+class IngestCheckpoint(Base):
+    # Finished (or failed) ingestion stages of a file, see app/ingest_checkpoints.py
+    __tablename__ = "ingest_checkpoints"
+    file_id = Column(Integer, ForeignKey("knowledge_files.id"), primary_key=True)
+    stage = Column(String, primary_key=True) # parse, chunk, embed, topics, generate
+    key = Column(String, primary_key=True, default="") # "<topic_id>:<level>" for generate, empty otherwise
+    input_hash = Column(String) # Fingerprint of everything the stage's output depends on
+    status = Column(String) # Done, Failed
+    output = Column(Text, nullable=True) # JSON
+    error = Column(Text, nullable=True)
+    job_id = Column(Integer, ForeignKey("processing_jobs.id"), nullable=True) # Job that ran the stage
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 class Topic(Base):
     __tablename__ = "topics"
     id = Column(Integer, primary_key=True, index=True)
     project_id = Column(Integer, ForeignKey("projects.id"), nullable=True)
     name = Column(String, index=True) # Removed unique constraint globally, should be unique per project ideally
     description = Column(Text)
+    # JSON embedding of the name for near-duplicate detection (see app/topic_dedup.py); deferred, only dedup reads it
+    name_embedding = deferred(Column(Text, nullable=True))
 
     project = relationship("Project", back_populates="topics")
 
+    __table_args__ = (
+        Index("ix_topics_project_id_id", "project_id", "id"), # Random topic sampling per project
+        Index("ix_topics_project_name", "project_id", "name", unique=True), # Topic upsert during ingestion
+    )
+
+class TopicChunk(Base):
+    # Chunks that support a topic, recorded at ingestion (see app/topic_chunks.py)
+    __tablename__ = "topic_chunks"
+    topic_id = Column(Integer, ForeignKey("topics.id"), primary_key=True)
+    node_id = Column(String, primary_key=True) # Chunk id in the vector store (see app/chunk_sync.py)
+    filename = Column(String) # Source file; re-ingesting it replaces its rows
+    score = Column(Float) # Similarity between the topic name and the chunk
+
+    __table_args__ = (
+        Index("ix_topic_chunks_filename", "filename"),
+    )
+
 class AssessmentSession(Base):
     __tablename__ = "assessment_sessions"
     id = Column(Integer, primary_key=True, index=True)
@@ -65,15 +136,23 @@ class QuestionHistory(Base):
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(Integer, ForeignKey("assessment_sessions.id"))
     topic_id = Column(Integer, ForeignKey("topics.id"))
+    question_bank_id = Column(Integer, ForeignKey("question_bank.id"), nullable=True) # NULL for LLM-generated questions
     question_text = Column(Text)
     user_answer = Column(Text)
     correct_answer = Column(Text)
     is_correct = Column(Integer) # 0 or 1
+    match_tier = Column(String, nullable=True) # exact, choice, lexical, embedding or llm (see app/answer_matching.py)
+    match_score = Column(Float, nullable=True) # Similarity score of the deciding tier
     feedback = Column(Text)
     timestamp = Column(DateTime, default=datetime.utcnow)
     
     session = relationship("AssessmentSession", back_populates="history")
 
+    __table_args__ = (
+        Index("ix_question_history_session_bank", "session_id", "question_bank_id"),
+        Index("ix_question_history_session_text", "session_id", "question_text"),
+    )
+
 class TopicScore(Base):
     __tablename__ = "topic_scores"
     id = Column(Integer, primary_key=True, index=True)
@@ -84,6 +163,11 @@ class TopicScore(Base):
     
     user = relationship("User")
     topic = relationship("Topic")
+
+    __table_args__ = (
+        Index("ix_topic_scores_user_topic", "user_id", "topic_id", unique=True),
+    )
+
 class QuestionBank(Base):
     __tablename__ = "question_bank"
     id = Column(Integer, primary_key=True, index=True)
@@ -91,7 +175,73 @@ class QuestionBank(Base):
     question_text = Column(Text)
     choices = Column(Text) # JSON string
     correct_answer = Column(Text)
+    explanations = Column(Text, nullable=True) # JSON object: wrong choice -> why it is wrong
     difficulty = Column(String) # Beginner, Intermediate, Advanced
     created_at = Column(DateTime, default=datetime.utcnow)
+    # MinHash signature of the question text (see app/question_dedup.py); deferred, only dedup reads it
+    minhash = deferred(Column(LargeBinary, nullable=True))
 
     topic = relationship("Topic")
+
+    __table_args__ = (
+        Index("ix_question_bank_topic_difficulty_id", "topic_id", "difficulty", "id"), # Random sampling per topic/level
+        Index("ix_question_bank_question_text", "question_text"), # Answer lookup for legacy history rows
+    )
+
+class QuestionBand(Base):
+    # LSH buckets of bank questions: questions of a topic sharing a bucket in any band are near-duplicate candidates
+    __tablename__ = "question_bands"
+    topic_id = Column(Integer, primary_key=True)
+    band = Column(Integer, primary_key=True)
+    bucket = Column(Integer, primary_key=True) # Hash of the band's slice of the signature
+    question_id = Column(Integer, ForeignKey("question_bank.id"), primary_key=True)
+
+    __table_args__ = (
+        Index("ix_question_bands_question_id", "question_id"), # Dropping a question's buckets
+    )
+
+class JobMetric(Base):
+    __tablename__ = "job_metrics"
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(Integer, ForeignKey("processing_jobs.id"), index=True)
+    name = Column(String) # e.g. embed_chunks_per_sec
+    value = Column(Float)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class RateLimitBucket(Base):
+    # Token bucket state shared by every worker process (see app/embedding_pipeline.py)
+    __tablename__ = "rate_limit_buckets"
+    name = Column(String, primary_key=True)
+    tokens = Column(Float)
+    updated_at = Column(Float) # Unix time of the last refill
+
+class ProficiencyStat(Base):
+    # Dashboard aggregates, kept current by submit_answer (see app/aggregates.py).
+    # One row per scope: scope "topic"/"project" with that id, or "global" with scope_id 0.
+    __tablename__ = "proficiency_stats"
+    scope = Column(String, primary_key=True)
+    scope_id = Column(Integer, primary_key=True)
+    project_id = Column(Integer, nullable=True) # Set on topic rows, for listing a project's topics
+    answers_total = Column(Integer, default=0) # Graded answers
+    answers_correct = Column(Integer, default=0)
+    beginner = Column(Integer, default=0) # (user, topic) pairs at each proficiency level
+    intermediate = Column(Integer, default=0)
+    advanced = Column(Integer, default=0)
+
+    __table_args__ = (
+        Index("ix_proficiency_stats_project", "scope", "project_id"),
+    )
+
+class LeaderboardScore(Base):
+    # Per-user totals for the same scopes as ProficiencyStat, ordered by the index for top-N reads
+    __tablename__ = "leaderboard_scores"
+    scope = Column(String, primary_key=True)
+    scope_id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, primary_key=True)
+    score = Column(Float, default=0.0) # Sum of the user's topic scores in the scope
+    answers_total = Column(Integer, default=0)
+    answers_correct = Column(Integer, default=0)
+
+    __table_args__ = (
+        Index("ix_leaderboard_scores_rank", "scope", "scope_id", score.desc(), "user_id"),
+    )
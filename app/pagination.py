@@ -0,0 +1,15 @@
+from typing import Optional
+
+def keyset_page(query, id_column, cursor: Optional[int] = None, limit: int = 50):
+    """
+    Newest-first page of `query` by `id_column`. `cursor` is the `next_cursor`
+    of the previous page; each page is an index seek, however deep it is.
+    Returns (rows, next_cursor), with next_cursor None on the last page.
+    """
+    if cursor is not None:
+        query = query.filter(id_column < cursor)
+    rows = query.order_by(id_column.desc()).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, getattr(rows[-1], id_column.key)
@@ -0,0 +1,131 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from passlib.context import CryptContext
+from app.config import settings
+
+# argon2 off the request path.
+#
+# A hash or verify costs a few hundred milliseconds of CPU and tens of MB of
+# memory, so a burst of logins run inline takes the API's threads (and
+# cores) away from question serving. Here they run on a small process pool
+# of PASSWORD_HASH_WORKERS lower-priority processes: at most that many run
+# at once however many logins arrive, requests wait on the result without
+# holding a thread, and once PASSWORD_HASH_MAX_QUEUE jobs are waiting new ones are rejected
+# (the login endpoints answer 503 with Retry-After) rather than queueing
+# without bound. Queue depth, jobs in flight and rejections are Prometheus
+# metrics; hashing and queue wait times are `password_hash` spans.
+#
+# Workers are spawned and import only this module and the settings, so they
+# carry neither the API's threads nor its LlamaIndex imports.
+
+pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+
+class PasswordHashingBusy(Exception):
+    """The hashing queue is full; the caller should retry later."""
+
+def _init_worker(niceness: int):
+    # Lower priority: when cores are short, the scheduler favours the API's request handling
+    if niceness:
+        os.nice(niceness)
+
+def _run(operation: str, *args):
+    """Runs in a worker: the result and the seconds spent hashing."""
+    start = time.perf_counter()
+    result = pwd_context.hash(*args) if operation == "hash" else pwd_context.verify(*args)
+    return result, time.perf_counter() - start
+
+class PasswordHasher:
+    def __init__(self, workers: int = None, max_queue: int = None):
+        self._workers = workers
+        self._max_queue = max_queue
+        self._lock = threading.Lock()
+        self._executor = None
+        self.in_flight = 0
+
+    @property
+    def workers(self) -> int:
+        # Read at call time so tests and benchmarks can switch modes through settings
+        return self._workers if self._workers is not None else settings.PASSWORD_HASH_WORKERS
+
+    @property
+    def max_queue(self) -> int:
+        return self._max_queue if self._max_queue is not None else settings.PASSWORD_HASH_MAX_QUEUE
+
+    @property
+    def queue_depth(self) -> int:
+        """Jobs submitted but not yet picked up by a worker."""
+        return max(0, self.in_flight - max(self.workers, 1))
+
+    def start(self):
+        """Starts the worker processes now (e.g. at API startup) instead of on the first login."""
+        with self._lock:
+            pool = self._pool()
+        if pool is not None:
+            for future in [pool.submit(_run, "hash", "warmup") for _ in range(self.workers)]:
+                future.result()
+
+    def _pool(self):
+        """The process pool (None when hashing inline). Hold the lock."""
+        if self.workers <= 0:
+            return None
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker, initargs=(settings.PASSWORD_HASH_NICE,),
+            )
+        return self._executor
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    async def _submit(self, operation: str, *args):
+        from app.metrics import PASSWORD_HASH_IN_FLIGHT, PASSWORD_HASH_QUEUE_DEPTH, PASSWORD_HASH_REJECTED, observe_span
+
+        with self._lock:
+            if self.in_flight >= max(self.workers, 1) + self.max_queue:
+                PASSWORD_HASH_REJECTED.labels(operation).inc()
+                raise PasswordHashingBusy()
+            self.in_flight += 1
+            PASSWORD_HASH_IN_FLIGHT.set(self.in_flight)
+            PASSWORD_HASH_QUEUE_DEPTH.set(self.queue_depth)
+            pool = self._pool()
+        start = time.perf_counter()
+        try:
+            if pool is None:
+                result, seconds = await asyncio.to_thread(_run, operation, *args)
+            else:
+                result, seconds = await asyncio.wrap_future(pool.submit(_run, operation, *args))
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); start a fresh pool for the next job
+            with self._lock:
+                if self._executor is pool:
+                    self._executor = None
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                PASSWORD_HASH_IN_FLIGHT.set(self.in_flight)
+                PASSWORD_HASH_QUEUE_DEPTH.set(self.queue_depth)
+        observe_span("password_hash", operation, seconds)
+        observe_span("password_hash_wait", operation, time.perf_counter() - start - seconds)
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._submit("hash", password)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        if not hashed:
+            # Users created by /start_assessment have no password
+            return False
+        return await self._submit("verify", password, hashed)
+
+password_hasher = PasswordHasher()
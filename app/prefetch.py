@@ -0,0 +1,133 @@
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from app.config import settings
+from app.database import SessionLocal
+from app.models import AssessmentSession
+
+class SessionPrefetcher:
+    """
+    Keeps a small buffer of ready-to-serve questions per assessment session so
+    `/get_question` rarely waits on the sampler or the LLM fallback.
+
+    `producer(db, session, exclude_bank_ids, exclude_texts)` is the function that
+    picks one question (`prepare_question` in app/assessment.py); the prefetcher
+    only decides when to call it. Buffers are tagged with the level they were
+    filled for and are dropped whenever the session's level changes. Refills run
+    on a small thread pool, at most one per session at a time.
+    """
+
+    def __init__(self, producer, lookahead: int = None, session_factory=SessionLocal,
+                 workers: int = None, max_sessions: int = None):
+        self.producer = producer
+        self._lookahead = lookahead
+        self.session_factory = session_factory
+        self.workers = workers or settings.PREFETCH_WORKERS
+        self.max_sessions = max_sessions or settings.PREFETCH_MAX_SESSIONS
+        self._lock = threading.Lock()
+        self._buffers = OrderedDict() # session_id -> {"level": str, "questions": deque}
+        self._refilling = set()
+        self._executor = None
+        self.stats = {"hits": 0, "misses": 0, "prefetched": 0}
+
+    @property
+    def lookahead(self) -> int:
+        # Read at call time so it can be changed (or disabled) through settings
+        return self._lookahead if self._lookahead is not None else settings.PREFETCH_LOOKAHEAD
+
+    def _buffer(self, session_id: int, level: str):
+        """Returns the buffer for (session, level), replacing one filled for another level. Hold the lock."""
+        buffer = self._buffers.get(session_id)
+        if buffer is None or buffer["level"] != level:
+            buffer = {"level": level, "questions": deque()}
+            self._buffers[session_id] = buffer
+        self._buffers.move_to_end(session_id)
+        while len(self._buffers) > self.max_sessions:
+            self._buffers.popitem(last=False)
+        return buffer
+
+    def take(self, session_id: int, level: str):
+        """Pops the next buffered question for the session at `level`, or None."""
+        with self._lock:
+            buffer = self._buffers.get(session_id)
+            if buffer is not None and buffer["level"] == level and buffer["questions"]:
+                self.stats["hits"] += 1
+                return buffer["questions"].popleft()
+            self.stats["misses"] += 1
+            return None
+
+    def invalidate(self, session_id: int):
+        with self._lock:
+            self._buffers.pop(session_id, None)
+
+    def schedule_refill(self, session_id: int):
+        """Tops the session's buffer back up in the background. No-op when prefetching is disabled."""
+        if self.lookahead <= 0:
+            return
+        with self._lock:
+            if session_id in self._refilling:
+                return
+            self._refilling.add(session_id)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="prefetch")
+        try:
+            self._executor.submit(self._refill_task, session_id)
+        except RuntimeError:
+            # Executor shut down (app stopping)
+            with self._lock:
+                self._refilling.discard(session_id)
+
+    def _refill_task(self, session_id: int):
+        try:
+            self.refill(session_id)
+        except Exception as e:
+            print(f"Prefetch for session {session_id} failed: {e}")
+        finally:
+            with self._lock:
+                self._refilling.discard(session_id)
+
+    def refill(self, session_id: int) -> int:
+        """Fills the buffer up to `lookahead` questions synchronously. Returns how many were added."""
+        db = self.session_factory()
+        added = 0
+        try:
+            session = db.query(AssessmentSession).filter(AssessmentSession.id == session_id).first()
+            if not session:
+                self.invalidate(session_id)
+                return 0
+            level = session.current_level
+
+            while True:
+                with self._lock:
+                    buffer = self._buffer(session_id, level)
+                    if len(buffer["questions"]) >= self.lookahead:
+                        break
+                    exclude_bank_ids = [q["question_bank_id"] for q in buffer["questions"] if q["question_bank_id"]]
+                    exclude_texts = [q["question_text"] for q in buffer["questions"]]
+
+                question = self.producer(db, session, exclude_bank_ids, exclude_texts)
+                if "error" in question:
+                    break # Nothing more to offer right now; the request path will report it
+
+                with self._lock:
+                    buffer = self._buffers.get(session_id)
+                    if buffer is None or buffer["level"] != level:
+                        break # Invalidated (level changed) while we were producing
+                    buffer["questions"].append(question)
+                    self.stats["prefetched"] += 1
+                added += 1
+            return added
+        finally:
+            db.close()
+
+    def buffered(self, session_id: int) -> int:
+        with self._lock:
+            buffer = self._buffers.get(session_id)
+            return len(buffer["questions"]) if buffer else 0
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+            self._buffers.clear()
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
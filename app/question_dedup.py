@@ -0,0 +1,229 @@
+import argparse
+import hashlib
+import re
+import zlib
+from typing import Iterable, List, Optional
+import numpy as np
+from nltk.stem import PorterStemmer
+from sqlalchemy import bindparam, tuple_
+from sqlalchemy.orm import Session
+from app.answer_matching import NEGATIONS, STOPWORDS
+from app.config import settings
+from app.models import QuestionBand, QuestionBank, QuestionHistory
+
+# Near-duplicate detection for question text.
+#
+# Each question gets a MinHash signature over its stemmed content words and
+# word pairs, so rewordings ("What is the first step of discovery?" / "What's
+# the first step in discovery?") estimate a high Jaccard similarity. Words in
+# the scope of a negation are features apart from the same words without one,
+# so a question and its opposite don't. For bank questions the signature is
+# stored on the row and split into LSH bands whose buckets go into
+# `question_bands`; a new question only has to be compared with the questions
+# of its topic that share a bucket with it. Bank inserts go through
+# `add_bank_questions`, which keeps the index current and skips
+# near-duplicates. `compact_bank` removes the ones that were stored before
+# (and re-indexes the rest).
+
+NUM_PERM = 64
+BANDS = 16 # 4 rows per band: pairs at similarity 0.7 become candidates ~99% of the time, at 0.3 ~12%
+_ROWS = NUM_PERM // BANDS
+_PRIME = (1 << 31) - 1
+# Fixed seed: stored signatures must stay comparable across processes and restarts
+_rng = np.random.RandomState(1109)
+_A = _rng.randint(1, _PRIME, NUM_PERM).astype(np.uint64)
+_B = _rng.randint(0, _PRIME, NUM_PERM).astype(np.uint64)
+
+_stemmer = PorterStemmer()
+
+def shingles(text: str) -> set:
+    # Words after a negation, up to the next punctuation mark, are features of their own ("~discount"):
+    # a single "not" would otherwise leave a question and its opposite above the duplicate threshold
+    words, negated = [], False
+    for token in re.findall(r"[a-z0-9]+|[.,;:!?]", str(text).lower().replace("'", "")):
+        if not token[0].isalnum():
+            negated = False
+        elif token in NEGATIONS:
+            words.append(token)
+            negated = True
+        elif token not in STOPWORDS:
+            words.append(f"~{_stemmer.stem(token)}" if negated else _stemmer.stem(token))
+    return set(words) | {f"{a} {b}" for a, b in zip(words, words[1:])}
+
+def minhash(text: str) -> Optional[np.ndarray]:
+    """MinHash signature of the text (None when it has no content words)."""
+    features = shingles(text)
+    if not features:
+        return None
+    hashes = np.array([zlib.crc32(feature.encode("utf-8")) % _PRIME for feature in features], dtype=np.uint64)
+    return ((np.outer(_A, hashes) + _B[:, None]) % _PRIME).min(axis=1)
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two signatures."""
+    return float(np.mean(a == b))
+
+def band_buckets(signature: np.ndarray):
+    return [
+        (band, int.from_bytes(
+            hashlib.blake2b(signature[band * _ROWS:(band + 1) * _ROWS].tobytes(), digest_size=7).digest(), "big"
+        ))
+        for band in range(BANDS)
+    ]
+
+def _from_bytes(data: bytes) -> np.ndarray:
+    return np.frombuffer(data, dtype=np.uint64)
+
+def find_duplicate(db: Session, topic_id: int, text: str = None, signature: np.ndarray = None,
+                   threshold: float = None) -> Optional[int]:
+    """Id of the most similar indexed bank question of the topic at or above `threshold`, if any."""
+    threshold = settings.QUESTION_DUP_SIMILARITY if threshold is None else threshold
+    signature = minhash(text) if signature is None else signature
+    if signature is None:
+        return None
+    candidates = (
+        db.query(QuestionBand.question_id)
+        .filter(
+            QuestionBand.topic_id == topic_id,
+            tuple_(QuestionBand.band, QuestionBand.bucket).in_(band_buckets(signature)),
+        )
+        .distinct()
+    )
+    best_id, best = None, threshold
+    for question_id, stored in db.query(QuestionBank.id, QuestionBank.minhash).filter(QuestionBank.id.in_(candidates)):
+        score = similarity(signature, _from_bytes(stored)) if stored else 0.0
+        if score >= best:
+            best_id, best = question_id, score
+    return best_id
+
+def index_question(db: Session, question_id: int, topic_id: int, signature: Optional[np.ndarray]):
+    """Stores a bank question's signature and buckets (replacing any it had). The caller commits."""
+    db.query(QuestionBand).filter(QuestionBand.question_id == question_id).delete(synchronize_session=False)
+    db.query(QuestionBank).filter(QuestionBank.id == question_id).update(
+        {QuestionBank.minhash: signature.tobytes() if signature is not None else None}, synchronize_session=False
+    )
+    if signature is not None:
+        db.execute(QuestionBand.__table__.insert(), [
+            {"topic_id": topic_id, "band": band, "bucket": bucket, "question_id": question_id}
+            for band, bucket in band_buckets(signature)
+        ])
+
+def add_bank_questions(db: Session, topic_id: int, difficulty: str, questions: Iterable[QuestionBank],
+                       threshold: float = None) -> dict:
+    """
+    Adds generated bank questions of a topic, skipping near-duplicates of the
+    topic's bank (any level) and of each other, and indexes the ones added.
+    The caller commits. Returns counts of added and skipped questions.
+    """
+    stats = {"added": 0, "skipped": 0}
+    for question in questions:
+        signature = minhash(question.question_text)
+        if find_duplicate(db, topic_id, signature=signature, threshold=threshold) is not None:
+            stats["skipped"] += 1
+            continue
+        question.topic_id = topic_id
+        question.difficulty = difficulty
+        question.minhash = signature.tobytes() if signature is not None else None
+        db.add(question)
+        db.flush()
+        if signature is not None:
+            db.execute(QuestionBand.__table__.insert(), [
+                {"topic_id": topic_id, "band": band, "bucket": bucket, "question_id": question.id}
+                for band, bucket in band_buckets(signature)
+            ])
+        stats["added"] += 1
+    return stats
+
+def near_duplicate_of(text: str, others: Iterable[str], threshold: float = None) -> Optional[str]:
+    """First of `others` (e.g. the questions already asked in a session) that `text` nearly duplicates."""
+    threshold = settings.QUESTION_DUP_SIMILARITY if threshold is None else threshold
+    signature = minhash(text)
+    for other in others:
+        if other == text:
+            return other
+        other_signature = minhash(other)
+        if signature is not None and other_signature is not None and similarity(signature, other_signature) >= threshold:
+            return other
+    return None
+
+def index_missing(db: Session, batch_size: int = 500) -> int:
+    """Indexes bank questions stored before signatures were (no dedup). The caller commits."""
+    indexed = 0
+    last_id = 0 # Keyset: questions without content words keep a NULL signature
+    while True:
+        rows = (
+            db.query(QuestionBank.id, QuestionBank.topic_id, QuestionBank.question_text)
+            .filter(QuestionBank.minhash.is_(None), QuestionBank.id > last_id)
+            .order_by(QuestionBank.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            return indexed
+        for question_id, topic_id, text in rows:
+            index_question(db, question_id, topic_id, minhash(text))
+        indexed += len(rows)
+        last_id = rows[-1][0]
+
+def compact_bank(db: Session, topic_ids: List[int] = None, threshold: float = None) -> dict:
+    """
+    Re-indexes the bank topic by topic and deletes near-duplicate questions,
+    keeping the oldest of each group. History rows that point at a deleted
+    question are moved to the one kept, so reps who saw either aren't served
+    the other. Commits per topic.
+    """
+    if topic_ids is None:
+        topic_ids = [row[0] for row in db.query(QuestionBank.topic_id).distinct().order_by(QuestionBank.topic_id)]
+    stats = {"topics": 0, "questions": 0, "removed": 0}
+    for topic_id in topic_ids:
+        db.query(QuestionBand).filter(QuestionBand.topic_id == topic_id).delete(synchronize_session=False)
+        rows = (
+            db.query(QuestionBank.id, QuestionBank.question_text)
+            .filter(QuestionBank.topic_id == topic_id)
+            .order_by(QuestionBank.id)
+            .all()
+        )
+        replaced_by = {}
+        for question_id, text in rows:
+            signature = minhash(text)
+            duplicate_of = find_duplicate(db, topic_id, signature=signature, threshold=threshold)
+            if duplicate_of is not None:
+                replaced_by[question_id] = duplicate_of
+            else:
+                index_question(db, question_id, topic_id, signature)
+        if replaced_by:
+            history = QuestionHistory.__table__
+            db.execute(
+                history.update()
+                .where(history.c.question_bank_id == bindparam("old_id"))
+                .values(question_bank_id=bindparam("new_id")),
+                [{"old_id": old, "new_id": new} for old, new in replaced_by.items()],
+            )
+            removed = list(replaced_by)
+            for start in range(0, len(removed), 500):
+                db.query(QuestionBank).filter(
+                    QuestionBank.id.in_(removed[start:start + 500])
+                ).delete(synchronize_session=False)
+        db.commit()
+        stats["topics"] += 1
+        stats["questions"] += len(rows)
+        stats["removed"] += len(replaced_by)
+    return stats
+
+if __name__ == "__main__":
+    from app.database import SessionLocal, engine
+    from app.migrations import run_migrations
+
+    parser = argparse.ArgumentParser(description="Near-duplicate questions in the question bank")
+    parser.add_argument("--compact", action="store_true", help="Delete near-duplicate bank questions, keeping the oldest")
+    parser.add_argument("--topic", type=int, action="append", help="Only this topic (repeatable)")
+    args = parser.parse_args()
+
+    if not args.compact:
+        parser.error("nothing to do (use --compact)")
+    run_migrations(engine)
+    db = SessionLocal()
+    try:
+        stats = compact_bank(db, args.topic)
+        print(f"Removed {stats['removed']} of {stats['questions']} questions across {stats['topics']} topics")
+    finally:
+        db.close()
@@ -0,0 +1,249 @@
+import threading
+from llama_index.core import Settings as LlamaSettings
+from llama_index.core import VectorStoreIndex
+from llama_index.core.query_engine import RetrieverQueryEngine
+from llama_index.vector_stores.chroma import ChromaVectorStore
+import chromadb
+from app.config import settings
+from app.lexical_index import HybridRetriever, LexicalIndex, LexicalRetriever, project_filters
+from app.topic_chunks import StaticRetriever
+from app.topic_dedup import ProjectTopics
+from app.vector_collections import (
+    FanOutRetriever, KB_COLLECTION, collection_name, kb_collection_names, project_of, split_shared_collection,
+)
+
+RETRIEVAL_MODES = ("vector", "hybrid", "lexical")
+
+class ResourceRegistry:
+    """
+    Application-scoped owner of the LLM, embedding model, Chroma client and the
+    index/query engine/retriever objects built on top of them.
+
+    Everything is created lazily on first use and then shared across requests,
+    so the API process holds one Chroma client per directory and never rebuilds
+    an index per request. Tests (and benchmarks) swap in fakes with `use()`.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._llm = None
+        self._embed_model = None
+        self._chroma_client = None
+        self._collections = {}
+        self._vector_stores = {}
+        self._indexes = {}
+        self._index_override = None
+        self._lexical_index = None
+        self._query_engines = {}
+        self._retrievers = {}
+        self._project_topics = {}
+
+    # Models
+
+    def _ensure_models(self):
+        with self._lock:
+            if self._llm is None:
+                from llama_index.llms.gemini import Gemini
+                self._llm = Gemini(api_key=settings.GEMINI_API_KEY, model_name=settings.LLM_MODEL_NAME)
+            if self._embed_model is None:
+                from llama_index.embeddings.gemini import GeminiEmbedding
+                self._embed_model = GeminiEmbedding(api_key=settings.GEMINI_API_KEY, model_name=settings.EMBED_MODEL_NAME)
+            # LlamaIndex components fall back to the global Settings when not given a model explicitly
+            LlamaSettings.llm = self._llm
+            LlamaSettings.embed_model = self._embed_model
+
+    @property
+    def llm(self):
+        self._ensure_models()
+        return self._llm
+
+    @property
+    def embed_model(self):
+        self._ensure_models()
+        return self._embed_model
+
+    # Vector store
+
+    @property
+    def chroma_client(self):
+        with self._lock:
+            if self._chroma_client is None:
+                self._chroma_client = chromadb.PersistentClient(path=settings.CHROMA_DB_DIR)
+            return self._chroma_client
+
+    def collection(self, name: str = KB_COLLECTION):
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = self.chroma_client.get_or_create_collection(name)
+            return self._collections[name]
+
+    def collection_names(self):
+        """The shared collection plus every project collection that exists."""
+        return sorted(set(kb_collection_names(self.chroma_client)) | {KB_COLLECTION})
+
+    def vector_store(self, project_id: int = None) -> ChromaVectorStore:
+        """Vector store of a project's collection (the shared one for documents without a project)."""
+        name = collection_name(project_id)
+        with self._lock:
+            if name not in self._vector_stores:
+                self._vector_stores[name] = ChromaVectorStore(chroma_collection=self.collection(name))
+            return self._vector_stores[name]
+
+    def index(self, project_id: int = None):
+        with self._lock:
+            if self._index_override is not None:
+                return self._index_override
+            name = collection_name(project_id)
+            if name not in self._indexes:
+                self._ensure_models()
+                self._indexes[name] = VectorStoreIndex.from_vector_store(vector_store=self.vector_store(project_id))
+            return self._indexes[name]
+
+    def lexical_index(self) -> LexicalIndex:
+        """Local BM25 index over the vector store's chunks; built from the collections the first time it's empty."""
+        with self._lock:
+            if self._lexical_index is None:
+                self._lexical_index = LexicalIndex(settings.LEXICAL_INDEX_PATH)
+                collections = [self.collection(name) for name in self.collection_names()]
+                if self._lexical_index.count() == 0 and any(c.count() for c in collections):
+                    indexed = self._lexical_index.rebuild_from_collections(collections)
+                    print(f"Built lexical index from {indexed} stored chunks")
+            return self._lexical_index
+
+    def query_engine(self, project_id: int = None, mode: str = None, **kwargs):
+        """
+        Shared query engine for a project (every project when None), retrieval
+        mode and engine options.
+        """
+        mode = mode or settings.RETRIEVAL_MODE
+        key = (project_id, mode, tuple(sorted(kwargs.items())))
+        with self._lock:
+            if key not in self._query_engines:
+                if self._index_override is not None:
+                    self._query_engines[key] = self.index(project_id).as_query_engine(**kwargs)
+                else:
+                    top_k = kwargs.pop("similarity_top_k", 2) # as_query_engine's default
+                    self._query_engines[key] = RetrieverQueryEngine.from_args(
+                        self.retriever(top_k, mode, project_id), llm=self.llm, **kwargs
+                    )
+            return self._query_engines[key]
+
+    def context_query_engine(self, nodes):
+        """Query engine that answers from the given nodes instead of retrieving. Not shared: nodes differ per call."""
+        if self._index_override is not None:
+            return self._index_override.as_query_engine()
+        return RetrieverQueryEngine.from_args(StaticRetriever(nodes), llm=self.llm)
+
+    def retriever(self, similarity_top_k: int = 5, mode: str = None, project_id: int = None):
+        """
+        Shared retriever: "vector" (embeddings), "lexical" (local BM25, no
+        embedding call) or "hybrid" (both, fused). Defaults to RETRIEVAL_MODE.
+        Scoped to one project's collection, or across all of them when
+        `project_id` is None.
+        """
+        mode = mode or settings.RETRIEVAL_MODE
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode {mode!r}")
+        key = (similarity_top_k, mode, project_id)
+        with self._lock:
+            if key not in self._retrievers:
+                if mode == "vector":
+                    retriever = self._vector_retriever(similarity_top_k, project_id)
+                elif mode == "lexical":
+                    retriever = LexicalRetriever(self.lexical_index(), similarity_top_k, project_filters(project_id))
+                else:
+                    # Each side contributes twice as many candidates as are returned, so fusion has a choice
+                    candidates = similarity_top_k * 2
+                    retriever = HybridRetriever(
+                        self._vector_retriever(candidates, project_id),
+                        LexicalRetriever(self.lexical_index(), candidates, project_filters(project_id)),
+                        similarity_top_k,
+                    )
+                self._retrievers[key] = retriever
+            return self._retrievers[key]
+
+    def _vector_retriever(self, similarity_top_k: int, project_id: int = None):
+        # A project's own collection is a fan-out of one, for its off-the-event-loop `aretrieve`
+        if project_id:
+            retriever = self.index(project_id).as_retriever(similarity_top_k=similarity_top_k)
+            return FanOutRetriever(lambda: [retriever], self.embed_model, similarity_top_k)
+        return FanOutRetriever(
+            lambda: [
+                self.index(project_of(name)).as_retriever(similarity_top_k=similarity_top_k)
+                for name in self.collection_names()
+            ],
+            self.embed_model,
+            similarity_top_k,
+        )
+
+    def project_topics(self, project_id: int = None) -> ProjectTopics:
+        """Cached topic name embeddings of a project, for merging near-duplicate topics (see app/topic_dedup.py)."""
+        with self._lock:
+            if project_id not in self._project_topics:
+                self._project_topics[project_id] = ProjectTopics(project_id)
+            return self._project_topics[project_id]
+
+    # Lifecycle
+
+    def start(self, warmup: bool = False):
+        """
+        Called from the FastAPI lifespan. Opens the store eagerly, moves chunks
+        left in the shared collection by older versions into their project
+        collections, and optionally warms up.
+        """
+        self.collection()
+        split_shared_collection(self.chroma_client)
+        if warmup:
+            self.warmup()
+
+    def warmup(self):
+        # One retrieval loads the Chroma segment into memory and opens the embedding API connection,
+        # so the first real request doesn't pay for either
+        try:
+            self.query_engine()
+            self.retriever().retrieve("sales training warmup")
+        except Exception as e:
+            print(f"Warmup failed (continuing without it): {e}")
+
+    def use(self, llm=None, embed_model=None, chroma_client=None, index=None, lexical_index=None):
+        """Replaces resources (e.g. with in-memory fakes) and drops everything built from the old ones."""
+        with self._lock:
+            self.reset()
+            self._llm = llm
+            self._embed_model = embed_model
+            self._chroma_client = chroma_client
+            self._index_override = index
+            self._lexical_index = lexical_index
+            if llm is not None and embed_model is not None:
+                LlamaSettings.llm = llm
+                LlamaSettings.embed_model = embed_model
+
+    def use_in_memory(self, llm=None, embed_model=None):
+        """Ephemeral Chroma plus mock models: nothing touches disk or the network."""
+        from llama_index.core.embeddings import MockEmbedding
+        from llama_index.core.llms import MockLLM
+        self.use(
+            llm=llm or MockLLM(),
+            embed_model=embed_model or MockEmbedding(embed_dim=8),
+            chroma_client=chromadb.EphemeralClient(),
+            lexical_index=LexicalIndex(":memory:"),
+        )
+        # EphemeralClient instances share one in-process store, start from clean collections
+        for name in kb_collection_names(self._chroma_client):
+            self._chroma_client.delete_collection(name)
+
+    def reset(self):
+        with self._lock:
+            self._llm = None
+            self._embed_model = None
+            self._chroma_client = None
+            self._collections = {}
+            self._vector_stores = {}
+            self._indexes = {}
+            self._index_override = None
+            self._lexical_index = None
+            self._query_engines = {}
+            self._retrievers = {}
+            self._project_topics = {}
+
+registry = ResourceRegistry()
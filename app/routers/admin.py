@@ -1,12 +1,17 @@
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from typing import List, Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from datetime import datetime
 from app.database import get_db
-from app.models import ProcessingJob
-from app.ingestion import vector_store, process_pdf_document # Import vector_store to query directly if needed
-from llama_index.core import VectorStoreIndex
+from app.models import KnowledgeFile, ProcessingJob, QuestionHistory, JobMetric
+from app.ingest_checkpoints import list_checkpoints
+from app.ingestion import reprocess_document
+from app.pagination import keyset_page
+from sqlalchemy import func
+from app.resources import registry
+from app.llm_cache import get_llm_cache
+from app.metrics import span
 
 router = APIRouter()
 
@@ -21,52 +26,126 @@ class JobSchema(BaseModel):
     class Config:
         orm_mode = True
 
+class JobPage(BaseModel):
+    jobs: List[JobSchema]
+    next_cursor: Optional[int] = None # Pass back as ?cursor= for the next page
+
+class KnowledgeFileSchema(BaseModel):
+    id: int
+    project_id: Optional[int]
+    filename: str
+    status: str
+    content_hash: Optional[str]
+    size_bytes: Optional[int]
+    page_count: Optional[int]
+    chunk_count: Optional[int]
+    job_id: Optional[int]
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        orm_mode = True
+
+class KnowledgeFilePage(BaseModel):
+    files: List[KnowledgeFileSchema]
+    next_cursor: Optional[int] = None
+
+class CheckpointSchema(BaseModel):
+    stage: str
+    key: str # "<topic_id>:<level>" for generate
+    status: str
+    error: Optional[str]
+    job_id: Optional[int]
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        orm_mode = True
+
 class ReprocessRequest(BaseModel):
     filename: str
-    context: Optional[str] = None
+    project_id: Optional[int] = None
+    context: Optional[str] = None # Keeps the last job's context when omitted; "" clears it
 
-@router.get("/jobs", response_model=List[JobSchema])
-def list_jobs(db: Session = Depends(get_db)):
-    return db.query(ProcessingJob).order_by(ProcessingJob.created_at.desc()).all()
+@router.get("/jobs", response_model=JobPage)
+def list_jobs(status: Optional[str] = None, project_id: Optional[int] = None, cursor: Optional[int] = None,
+              limit: int = Query(50, ge=1, le=500), db: Session = Depends(get_db)):
+    query = db.query(ProcessingJob)
+    if status:
+        query = query.filter(ProcessingJob.status == status)
+    if project_id is not None:
+        query = query.filter(ProcessingJob.project_id == project_id)
+    jobs, next_cursor = keyset_page(query, ProcessingJob.id, cursor, limit)
+    return {"jobs": jobs, "next_cursor": next_cursor}
 
 @router.get("/jobs/{job_id}", response_model=JobSchema)
 def get_job(job_id: int, db: Session = Depends(get_db)):
     return db.query(ProcessingJob).filter(ProcessingJob.id == job_id).first()
 
-@router.get("/knowledge_base/files")
-def list_kb_files(db: Session = Depends(get_db)):
-    # In a real app, we'd query ChromaDB metadata or a separate Files table.
-    # For now, we'll return unique filenames from ProcessingJobs that completed successfully.
-    jobs = db.query(ProcessingJob).filter(ProcessingJob.status == "Completed").all()
-    filenames = list(set([job.filename for job in jobs]))
-    return {"files": filenames}
+@router.get("/jobs/{job_id}/metrics")
+def get_job_metrics(job_id: int, db: Session = Depends(get_db)):
+    metrics = db.query(JobMetric).filter(JobMetric.job_id == job_id).order_by(JobMetric.id).all()
+    return {metric.name: metric.value for metric in metrics}
+
+@router.get("/knowledge_base/files", response_model=KnowledgeFilePage)
+def list_kb_files(status: Optional[str] = "Indexed", project_id: Optional[int] = None, cursor: Optional[int] = None,
+                  limit: int = Query(50, ge=1, le=500), db: Session = Depends(get_db)):
+    # Defaults to what is in the vector store; pass an empty status for every registered file
+    query = db.query(KnowledgeFile)
+    if status:
+        query = query.filter(KnowledgeFile.status == status)
+    if project_id is not None:
+        query = query.filter(KnowledgeFile.project_id == project_id)
+    files, next_cursor = keyset_page(query, KnowledgeFile.id, cursor, limit)
+    return {"files": files, "next_cursor": next_cursor}
 
 @router.get("/knowledge_base/search")
-def search_kb(query: str):
-    # Simple debug search
-    index = VectorStoreIndex.from_vector_store(vector_store=vector_store)
-    retriever = index.as_retriever(similarity_top_k=5)
-    nodes = retriever.retrieve(query)
+def search_kb(query: str, mode: Optional[Literal["vector", "hybrid", "lexical"]] = None, project_id: Optional[int] = None):
+    # Simple debug search; mode defaults to RETRIEVAL_MODE ("lexical" needs no embedding call).
+    # Without a project it searches every project's collection and merges the results.
+    with span("retrieval", "kb_search"):
+        nodes = registry.retriever(similarity_top_k=5, mode=mode, project_id=project_id).retrieve(query)
     results = []
     for node in nodes:
         results.append({
             "text": node.text[:200] + "...",
             "score": node.score,
-            "filename": node.metadata.get("filename", "Unknown")
+            "filename": node.metadata.get("filename", "Unknown"),
+            "project_id": int(node.metadata["project_id"]) if node.metadata.get("project_id") else None,
         })
     return results
 
+@router.get("/llm_cache/stats")
+def llm_cache_stats():
+    # Per call site hit/miss counters since process start, plus the current number of cached entries
+    return get_llm_cache().stats()
+
+@router.delete("/llm_cache")
+def clear_llm_cache():
+    get_llm_cache().clear()
+    return {"message": "LLM cache cleared"}
+
+@router.get("/answer_matching/stats")
+def answer_matching_stats(db: Session = Depends(get_db)):
+    # How often each matcher tier made the call, and how often it accepted the answer
+    rows = db.query(
+        QuestionHistory.match_tier,
+        func.count(QuestionHistory.id),
+        func.sum(QuestionHistory.is_correct),
+        func.avg(QuestionHistory.match_score),
+    ).filter(QuestionHistory.match_tier.isnot(None)).group_by(QuestionHistory.match_tier).all()
+    return {
+        tier: {"decisions": count, "accepted": int(accepted or 0), "avg_score": avg_score}
+        for tier, count, accepted, avg_score in rows
+    }
+
+@router.get("/knowledge_base/files/{file_id}/stages", response_model=List[CheckpointSchema])
+def list_file_stages(file_id: int, db: Session = Depends(get_db)):
+    # Which ingestion stages (and generation batches) are done or failed for the file
+    if db.get(KnowledgeFile, file_id) is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    return list_checkpoints(db, file_id)
+
 @router.post("/knowledge_base/reprocess")
-async def reprocess_file(request: ReprocessRequest, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
-    # This is a bit tricky because we don't have the original file content stored unless we kept it.
-    # For this demo, we'll assume the user re-uploads or we just can't reprocess without the file.
-    # WAIT - the requirement implies we can reprocess. 
-    # If we didn't save the file, we can't reprocess.
-    # Let's assume for this "Simulator" we only support reprocessing if the file is re-uploaded via the main endpoint,
-    # OR we can update the upload endpoint to allow context.
-    
-    # Actually, let's just update the upload endpoint to take context, 
-    # and here we can return a message saying "Please re-upload the file with the new context".
-    # OR, we can try to find the file in temp if we didn't delete it (but we did).
-    
-    return {"message": "To reprocess with new context, please use the Upload PDF endpoint and provide the context."}
+def reprocess_file(request: ReprocessRequest, db: Session = Depends(get_db)):
+    # Requeues the stored upload; stages still valid for the new job's inputs are skipped
+    return reprocess_document(db, request.filename, request.project_id, request.context)
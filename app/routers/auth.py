@@ -1,25 +1,18 @@
-from datetime import datetime, timedelta
-from typing import Optional
+from datetime import timedelta
 from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from jose import JWTError, jwt
-from passlib.context import CryptContext
-from sqlalchemy.orm import Session
+from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
-from app.database import get_db
+from app.database import get_async_db
 from app.models import User
 from app.config import settings
+from app.password_hashing import PasswordHashingBusy, password_hasher
+from app.security import CurrentUser, create_access_token, get_current_user
 
 router = APIRouter()
 
-# Security Config
-SECRET_KEY = "YOUR_SUPER_SECRET_KEY_CHANGE_IN_PROD" # Move to config
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
-
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
-
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -28,48 +21,64 @@ class UserCreate(BaseModel):
     username: str
     password: str
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+class UserOut(BaseModel):
+    id: int
+    username: str
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+def hashing_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many logins at once, please retry",
+        headers={"Retry-After": "1"},
+    )
 
-def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
-    to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.utcnow() + expires_delta
-    else:
-        expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
+def username_taken() -> HTTPException:
+    return HTTPException(status_code=400, detail="Username already registered")
 
+# argon2 runs on the hashing process pool (see app/password_hashing.py); these handlers only await it
 @router.post("/register", response_model=Token)
-def register(user: UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.username == user.username).first()
+async def register(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    db_user = await db.scalar(select(User.id).where(User.username == user.username))
     if db_user:
-        raise HTTPException(status_code=400, detail="Username already registered")
-    
-    hashed_password = get_password_hash(user.password)
+        raise username_taken()
+
+    try:
+        hashed_password = await password_hasher.hash(user.password)
+    except PasswordHashingBusy:
+        raise hashing_busy()
     new_user = User(username=user.username, password_hash=hashed_password)
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-    
+    try:
+        await db.commit()
+    except IntegrityError:
+        # A concurrent registration took the name between the check and the insert
+        await db.rollback()
+        raise username_taken()
+
     access_token = create_access_token(data={"sub": new_user.username})
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.post("/token", response_model=Token)
-def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.password_hash):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
+    password_hash = await db.scalar(select(User.password_hash).where(User.username == form_data.username))
+    # Ends the read before the (possibly queued) verify, so the connection goes back to the pool
+    await db.commit()
+    try:
+        verified = password_hash is not None and await password_hasher.verify(form_data.password, password_hash)
+    except PasswordHashingBusy:
+        raise hashing_busy()
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data={"sub": form_data.username}, expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
+
+@router.get("/me", response_model=UserOut)
+async def read_current_user(user: CurrentUser = Depends(get_current_user)):
+    return {"id": user.id, "username": user.username}
@@ -0,0 +1,32 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+from app.database import get_db
+from app.aggregates import GLOBAL_SCOPE, leaderboard, proficiency_summary, topic_summaries
+
+# Manager dashboards, served from the aggregate tables maintained by
+# submit_answer (see app/aggregates.py); no endpoint here scans answer history.
+
+router = APIRouter()
+
+def scope_of(project_id: Optional[int], topic_id: Optional[int]):
+    if topic_id is not None:
+        return "topic", topic_id
+    if project_id is not None:
+        return "project", project_id
+    return GLOBAL_SCOPE
+
+@router.get("/proficiency")
+def get_proficiency(project_id: Optional[int] = None, topic_id: Optional[int] = None, db: Session = Depends(get_db)):
+    """Answer accuracy and proficiency distribution for a topic, a project, or everything."""
+    return proficiency_summary(db, *scope_of(project_id, topic_id))
+
+@router.get("/projects/{project_id}/topics")
+def get_project_topics(project_id: int, db: Session = Depends(get_db)):
+    return topic_summaries(db, project_id)
+
+@router.get("/leaderboard")
+def get_leaderboard(project_id: Optional[int] = None, topic_id: Optional[int] = None,
+                    limit: int = Query(10, ge=1, le=100), db: Session = Depends(get_db)):
+    scope, scope_id = scope_of(project_id, topic_id)
+    return {"scope": scope, "scope_id": scope_id, "entries": leaderboard(db, scope, scope_id, limit)}
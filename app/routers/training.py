@@ -1,10 +1,14 @@
+import json
 from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, BackgroundTasks
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.async_assessment import agenerate_question, asubmit_answer
+from app.database import get_async_db, get_db
 from app.ingestion import process_pdf_document
-from app.assessment import start_new_session, generate_question, submit_answer
+from app.assessment import start_new_session, submit_answer, submit_answers_bulk, resolve_pending_answers
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
 router = APIRouter()
 
@@ -18,26 +22,77 @@ class AnswerRequest(BaseModel):
     question_text: str
     user_answer: str
 
+class BulkAnswerItem(BaseModel):
+    question_text: str
+    user_answer: str
+
+class BulkAnswerRequest(BaseModel):
+    session_id: int
+    answers: List[BulkAnswerItem]
+
 from typing import Optional
 from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, BackgroundTasks, Form
 
 @router.post("/upload_pdf")
 async def upload_pdf(
-    background_tasks: BackgroundTasks, 
     file: UploadFile = File(...), 
     context: Optional[str] = Form(None),
     project_id: Optional[int] = Form(None)
 ):
-    return await process_pdf_document(file, background_tasks, context, project_id)
+    return await process_pdf_document(file, context, project_id)
 
 @router.post("/start_assessment")
 def start_assessment(request: StartSessionRequest, db: Session = Depends(get_db)):
     return start_new_session(db, request.user_id, request.project_id, request.topic_id)
 
+# The two per-question endpoints run on the event loop, so slow LLM calls don't hold threadpool workers
 @router.get("/get_question/{session_id}")
-def get_next_question(session_id: int, db: Session = Depends(get_db)):
-    return generate_question(db, session_id)
+async def get_next_question(session_id: int, db: AsyncSession = Depends(get_async_db)):
+    return await agenerate_question(db, session_id)
 
 @router.post("/submit_answer")
-def submit_assessment_answer(request: AnswerRequest, db: Session = Depends(get_db)):
-    return submit_answer(db, request.session_id, request.user_answer, request.question_text)
+async def submit_assessment_answer(request: AnswerRequest, db: AsyncSession = Depends(get_async_db)):
+    return await asubmit_answer(db, request.session_id, request.user_answer, request.question_text)
+
+@router.post("/submit_answers")
+def submit_assessment_answers(request: BulkAnswerRequest, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    """
+    Grades a whole batch (e.g. a timed quiz) in one transaction. LLM-graded
+    answers and missing explanations are finished in the background; their
+    results show up in the session history.
+    """
+    result = submit_answers_bulk(db, request.session_id, [item.model_dump() for item in request.answers])
+    if "error" in result:
+        return result
+    deferred = [r["history_id"] for r in result["results"] if r["status"] == "deferred"]
+    explain = [r["history_id"] for r in result["results"] if r.get("explanation_pending")]
+    if deferred or explain:
+        background_tasks.add_task(resolve_pending_answers, request.session_id, deferred, explain)
+    return result
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def feedback_events(result: dict):
+    """Grading result first, then explanation tokens, then the final feedback text."""
+    explanation_stream = result.pop("explanation_stream", None)
+    yield sse_event("result", result)
+    feedback = result["feedback"]
+    if explanation_stream is not None:
+        chunks = []
+        for token in explanation_stream:
+            chunks.append(token)
+            yield sse_event("token", token)
+        feedback = "".join(chunks)
+    yield sse_event("done", {"feedback": feedback})
+
+@router.post("/submit_answer/stream")
+def submit_assessment_answer_stream(request: AnswerRequest, db: Session = Depends(get_db)):
+    """
+    Same grading as /submit_answer, sent as server-sent events so the score
+    shows up immediately and the explanation streams in as it's generated.
+    """
+    result = submit_answer(db, request.session_id, request.user_answer, request.question_text, stream=True)
+    if "error" in result:
+        return result
+    return StreamingResponse(feedback_events(result), media_type="text/event-stream")
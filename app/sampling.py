@@ -0,0 +1,63 @@
+import random
+from typing import Optional
+from sqlalchemy import and_, exists, func, or_
+from sqlalchemy.orm import Session
+from app.models import QuestionBank, QuestionHistory, Topic
+
+# Random selection without materializing the candidate set.
+#
+# Both samplers draw a random pivot between the smallest and largest id in
+# the scope and take the first eligible row at or after it (wrapping around
+# to the start). With the composite indexes on (scope..., id) every step is
+# an index seek, so the cost does not grow with the number of rows. Rows that
+# follow a gap in the ids are slightly more likely to be picked, which is
+# fine for spreading questions across a bank.
+
+def _first_id(query, model, condition):
+    # Uncorrelated, so the subquery keeps its own FROM when the outer query reads the same table
+    statement = query.filter(condition).with_entities(model.id).order_by(model.id).limit(1).statement
+    return statement.correlate(None).scalar_subquery()
+
+def _pick_from_pivot(scope, model, eligible=None):
+    """
+    `scope` bounds the pivot; the row is taken from `eligible` (defaults to the
+    whole scope). Two statements: the id range, then the pick with its
+    wrap-around folded into one COALESCE of index seeks.
+    """
+    db = scope.session
+    low, high = db.query(
+        scope.with_entities(func.min(model.id)).scalar_subquery(),
+        scope.with_entities(func.max(model.id)).scalar_subquery(),
+    ).one()
+    if low is None:
+        return None
+    pivot = random.randint(low, high)
+    eligible = eligible if eligible is not None else scope
+    picked = func.coalesce(_first_id(eligible, model, model.id >= pivot), _first_id(eligible, model, model.id < pivot))
+    return db.query(model).filter(model.id == picked).first()
+
+def pick_random_topic(db: Session, project_id: int = None) -> Optional[Topic]:
+    query = db.query(Topic)
+    if project_id:
+        query = query.filter(Topic.project_id == project_id)
+    return _pick_from_pivot(query, Topic)
+
+def sample_unseen_question(db: Session, session_id: int, topic_id: int, difficulty: str,
+                           exclude_ids=()) -> Optional[QuestionBank]:
+    """
+    Picks a random bank question for (topic, difficulty) that this session has
+    not been asked yet. `exclude_ids` skips a few more (e.g. already prefetched).
+    """
+    seen = exists().where(
+        QuestionHistory.session_id == session_id,
+        or_(
+            QuestionHistory.question_bank_id == QuestionBank.id,
+            # History rows written before question_bank_id existed only carry the text
+            and_(QuestionHistory.question_bank_id.is_(None), QuestionHistory.question_text == QuestionBank.question_text),
+        ),
+    )
+    scope = db.query(QuestionBank).filter(QuestionBank.topic_id == topic_id, QuestionBank.difficulty == difficulty)
+    eligible = scope.filter(~seen)
+    if exclude_ids:
+        eligible = eligible.filter(QuestionBank.id.notin_(list(exclude_ids)))
+    return _pick_from_pivot(scope, QuestionBank, eligible)
@@ -0,0 +1,106 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
+from fastapi import Depends, HTTPException, status
+from fastapi.security import OAuth2PasswordBearer
+from jose import JWTError, jwt
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.database import get_async_db
+from app.metrics import AUTH_CACHE_LOOKUPS
+from app.models import User
+
+# Access tokens and the dependency that authenticates a request.
+#
+# Tokens carry only the username (`sub`), so authenticating one means a JWT
+# decode and a User lookup. `get_current_user` keeps the result per token in
+# a small LRU cache for AUTH_CACHE_TTL_SECONDS (never past the token's own
+# expiry), so a rep's requests in a burst cost one lookup.
+
+ALGORITHM = "HS256"
+
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/token")
+
+class CurrentUser(NamedTuple):
+    id: int
+    username: str
+    claims: dict
+
+def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
+    to_encode = data.copy()
+    if expires_delta:
+        expire = datetime.utcnow() + expires_delta
+    else:
+        expire = datetime.utcnow() + timedelta(minutes=15)
+    to_encode.update({"exp": expire})
+    return jwt.encode(to_encode, settings.JWT_SECRET_KEY, algorithm=ALGORITHM)
+
+class TokenCache:
+    """Verified tokens -> CurrentUser, least recently used first out, each entry with its own expiry."""
+
+    def __init__(self, ttl_seconds: float = None, max_entries: int = None):
+        self._ttl_seconds = ttl_seconds
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict() # token -> (expires_at, CurrentUser)
+
+    @property
+    def ttl_seconds(self) -> float:
+        return self._ttl_seconds if self._ttl_seconds is not None else settings.AUTH_CACHE_TTL_SECONDS
+
+    @property
+    def max_entries(self) -> int:
+        return self._max_entries if self._max_entries is not None else settings.AUTH_CACHE_MAX_ENTRIES
+
+    def get(self, token: str) -> Optional[CurrentUser]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return entry[1]
+
+    def put(self, token: str, user: CurrentUser, token_expires_at: float = None):
+        expires_at = time.time() + self.ttl_seconds
+        if token_expires_at is not None:
+            expires_at = min(expires_at, token_expires_at)
+        with self._lock:
+            self._entries[token] = (expires_at, user)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+token_cache = TokenCache()
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)) -> CurrentUser:
+    """Dependency for protected routes: the user the bearer token was issued to."""
+    user = token_cache.get(token)
+    AUTH_CACHE_LOOKUPS.labels("hit" if user else "miss").inc()
+    if user:
+        return user
+
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    try:
+        claims = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        raise credentials_exception
+    row = (await db.execute(select(User.id, User.username).where(User.username == claims.get("sub")))).first()
+    if row is None:
+        raise credentials_exception
+    user = CurrentUser(row.id, row.username, claims)
+    token_cache.put(token, user, claims.get("exp"))
+    return user
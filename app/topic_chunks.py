@@ -0,0 +1,166 @@
+from typing import Dict, List
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+from app.chunk_sync import NON_CONTENT_METADATA_KEYS
+from app.config import settings
+from app.generation import LEVELS, build_bank_prompt
+from app.metrics import estimate_tokens
+from app.models import Topic, TopicChunk
+
+# Topic -> chunk index.
+#
+# Ingestion records which of the file's chunks support each extracted topic
+# (`map_topic_chunks`), scoring the topic name against the chunk embeddings
+# already in the vector store, so the only embedding call is one batch of
+# topic names. Question generation then answers from that chunk set
+# (`topic_context`), trimmed to GENERATION_CONTEXT_TOKENS, instead of running
+# a similarity search on the generation prompt, which matches the prompt's
+# boilerplate as much as the topic.
+
+# Chunks a shared query engine retrieves per call (as_query_engine's default),
+# the baseline generation is compared against
+RETRIEVAL_TOP_K = 2
+
+def map_topic_chunks(db: Session, topics, filename: str, project_id, collection, node_ids, embed_model,
+                     per_topic: int = None, topic_embeddings: dict = None) -> dict:
+    """
+    Replaces the file's topic -> chunk rows for `topics` ((id, name) pairs)
+    with the `per_topic` chunks of `node_ids` closest to each topic name.
+    Names are embedded with `embed_model` unless `topic_embeddings` (topic id
+    -> embedding) already covers them.
+
+    Returns the number of rows written and the file's average chunk size in
+    (estimated) tokens.
+    """
+    per_topic = per_topic or settings.TOPIC_CHUNKS_PER_TOPIC
+    stored = collection.get(ids=list(node_ids), include=["embeddings", "documents"]) if node_ids else {"ids": []}
+
+    # Topics can come back from extraction twice under the same id; keep one row per (topic, chunk)
+    rows = {}
+    if topics and stored["ids"]:
+        if topic_embeddings and all(topic_id in topic_embeddings for topic_id, _ in topics):
+            names = [topic_embeddings[topic_id] for topic_id, _ in topics]
+        else:
+            # Embedded before any write: the embedding rate limiter commits through its own session
+            names = embed_model.get_text_embedding_batch([name for _, name in topics])
+        similarities = _normalized(np.asarray(names, dtype=float)) @ _normalized(
+            np.asarray(stored["embeddings"], dtype=float)
+        ).T
+        for (topic_id, _), scores in zip(topics, similarities):
+            for i in np.argsort(-scores)[:per_topic]:
+                rows[topic_id, stored["ids"][i]] = TopicChunk(
+                    topic_id=topic_id, node_id=stored["ids"][i], filename=filename, score=float(scores[i])
+                )
+
+    project_topics = select(Topic.id).where(
+        Topic.project_id == project_id if project_id else Topic.project_id.is_(None)
+    )
+    db.query(TopicChunk).filter(
+        TopicChunk.filename == filename, TopicChunk.topic_id.in_(project_topics)
+    ).delete(synchronize_session=False)
+    db.add_all(rows.values())
+    db.commit()
+    return {
+        "mappings": len(rows),
+        "avg_chunk_tokens": (
+            sum(estimate_tokens(text or "") for text in stored["documents"]) / len(stored["ids"])
+            if stored["ids"] else 0.0
+        ),
+    }
+
+def _normalized(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+def topic_context(db: Session, topic_ids, collection, token_budget: int = None) -> Dict[int, List[NodeWithScore]]:
+    """
+    The recorded chunks of each topic, best first and trimmed to
+    `token_budget` (GENERATION_CONTEXT_TOKENS by default, 0 for no limit).
+    Topics without recorded chunks (or whose chunks are gone) are left out.
+    """
+    return contexts_from_rows(topic_chunk_rows(db, topic_ids), collection, token_budget)
+
+def topic_chunk_rows(db: Session, topic_ids) -> list:
+    """(topic_id, node_id, score) of each topic's recorded chunks, best first."""
+    return (
+        db.query(TopicChunk.topic_id, TopicChunk.node_id, TopicChunk.score)
+        .filter(TopicChunk.topic_id.in_(list(topic_ids)))
+        .order_by(TopicChunk.topic_id, TopicChunk.score.desc())
+        .all()
+    )
+
+def contexts_from_rows(rows, collection, token_budget: int = None) -> Dict[int, List[NodeWithScore]]:
+    """The vector store half of `topic_context`: reads the rows' chunks from `collection`, no database access."""
+    token_budget = settings.GENERATION_CONTEXT_TOKENS if token_budget is None else token_budget
+    if not rows:
+        return {}
+    stored = collection.get(ids=list({row.node_id for row in rows}), include=["documents", "metadatas"])
+    nodes = {
+        node_id: TextNode(
+            id_=node_id, text=text or "", metadata=metadata or {},
+            excluded_embed_metadata_keys=list(NON_CONTENT_METADATA_KEYS),
+            excluded_llm_metadata_keys=["chunk_hash"],
+        )
+        for node_id, text, metadata in zip(stored["ids"], stored["documents"], stored["metadatas"])
+    }
+
+    context = {}
+    for row in rows:
+        if row.node_id in nodes:
+            context.setdefault(row.topic_id, []).append(NodeWithScore(node=nodes[row.node_id], score=row.score))
+    return {topic_id: fit_to_budget(results, token_budget) for topic_id, results in context.items()}
+
+def fit_to_budget(results: List[NodeWithScore], token_budget: int) -> List[NodeWithScore]:
+    """Keeps results in order while they fit; the first one is cut down rather than dropped."""
+    if not token_budget:
+        return results
+    kept, used = [], 0
+    for result in results:
+        tokens = estimate_tokens(result.node.get_content())
+        if used + tokens > token_budget:
+            if not kept:
+                node = result.node.model_copy()
+                node.set_content(node.get_content()[:token_budget * 4])
+                kept.append(NodeWithScore(node=node, score=result.score))
+            break
+        kept.append(result)
+        used += tokens
+    return kept
+
+def context_tokens(results: List[NodeWithScore]) -> int:
+    return sum(estimate_tokens(result.node.get_content()) for result in results)
+
+class StaticRetriever(BaseRetriever):
+    """Hands back a fixed set of nodes, so a query engine answers from exactly that context."""
+
+    def __init__(self, nodes: List[NodeWithScore]):
+        super().__init__()
+        self.nodes = nodes
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        return list(self.nodes)
+
+def bank_prompt_tokens(topics, contexts: Dict[int, List[NodeWithScore]], avg_chunk_tokens: float) -> dict:
+    """
+    Estimated prompt tokens of bank generation for the topics answered from
+    their recorded chunks, next to what a similarity search per prompt would
+    have sent (RETRIEVAL_TOP_K chunks of the file's average size). Job metrics.
+    """
+    scoped = unscoped = 0.0
+    for topic_id, topic_name in dict(topics).items():
+        if topic_id not in contexts:
+            continue
+        for level in LEVELS:
+            instructions = estimate_tokens(build_bank_prompt(topic_name, level))
+            scoped += instructions + context_tokens(contexts[topic_id])
+            unscoped += instructions + RETRIEVAL_TOP_K * avg_chunk_tokens
+    if not unscoped:
+        return {}
+    return {
+        "gen_prompt_tokens": scoped,
+        "gen_prompt_tokens_unscoped": unscoped,
+        "gen_prompt_token_reduction": 1 - scoped / unscoped,
+    }
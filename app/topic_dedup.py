@@ -0,0 +1,169 @@
+import json
+import threading
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from nltk.stem import PorterStemmer
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.answer_matching import tokenize
+from app.config import settings
+from app.generation import LEVELS
+from app.models import Topic
+
+# Near-duplicate topic resolution for ingestion.
+#
+# Topic extraction returns free-form names, so the same subject comes back as
+# "Objection Handling", "Handling Objections" or "Overcoming objections", and
+# every variant would get its own topic and its own bank generation calls.
+# `resolve_topics` maps each extracted name onto an existing topic when its
+# normalized name matches (word order, plurals, stopwords) or its embedding is
+# within TOPIC_MERGE_SIMILARITY of one, and only creates topics for the rest.
+#
+# Name embeddings are stored on the topic, and each process keeps a matrix of
+# them per project (`ProjectTopics`, held by the resource registry), refreshed
+# incrementally when other processes add topics. Only names without a
+# normalized match are embedded.
+
+_stemmer = PorterStemmer()
+
+def topic_key(name: str) -> str:
+    """Order-, case- and inflection-insensitive form of a topic name."""
+    return " ".join(sorted({_stemmer.stem(word) for word in tokenize(name)}))
+
+def _unit(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=float)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+class ProjectTopics:
+    """A project's topics with their normalized names and a matrix of unit name embeddings."""
+
+    def __init__(self, project_id: Optional[int]):
+        self.project_id = project_id
+        self.ids: List[int] = []
+        self.names: Dict[int, str] = {}
+        self.keys: Dict[str, int] = {}
+        self.vectors: Dict[int, np.ndarray] = {}
+        self._matrix = None # Rows in `ids` order, rebuilt lazily after additions
+        self.max_id = 0
+        self.lock = threading.Lock()
+
+    def _project_filter(self):
+        return Topic.project_id == self.project_id if self.project_id else Topic.project_id.is_(None)
+
+    def refresh(self, db: Session, embed_model):
+        """Loads topics added since the last refresh (by any process); reloads everything if some were removed."""
+        count, max_id = db.query(func.count(Topic.id), func.max(Topic.id)).filter(self._project_filter()).one()
+        if count == len(self.ids) and (max_id or 0) == self.max_id:
+            return
+        if count < len(self.ids) or (max_id or 0) < self.max_id:
+            self.__init__(self.project_id)
+        rows = (
+            db.query(Topic.id, Topic.name, Topic.name_embedding)
+            .filter(self._project_filter(), Topic.id > self.max_id)
+            .order_by(Topic.id)
+            .all()
+        )
+        # Topics from before name embeddings were stored get them now, in one batch
+        missing = [(topic_id, name) for topic_id, name, embedding in rows if not embedding]
+        if missing:
+            vectors = embed_model.get_text_embedding_batch([name for _, name in missing])
+            for (topic_id, _), vector in zip(missing, vectors):
+                db.query(Topic).filter(Topic.id == topic_id).update(
+                    {Topic.name_embedding: json.dumps(list(vector))}, synchronize_session=False
+                )
+            db.commit()
+        fresh = dict(zip((topic_id for topic_id, _ in missing), vectors)) if missing else {}
+        for topic_id, name, embedding in rows:
+            self.add(topic_id, name, fresh[topic_id] if topic_id in fresh else json.loads(embedding))
+
+    def add(self, topic_id: int, name: str, vector):
+        if topic_id in self.names:
+            return
+        self.ids.append(topic_id)
+        self.names[topic_id] = name
+        if topic_key(name): # Names made only of stopwords match nothing by name
+            self.keys.setdefault(topic_key(name), topic_id)
+        self.vectors[topic_id] = _unit(vector)
+        self.max_id = max(self.max_id, topic_id)
+        self._matrix = None
+
+    def nearest(self, vector) -> Tuple[Optional[int], float]:
+        if not self.ids:
+            return None, 0.0
+        if self._matrix is None:
+            self._matrix = np.vstack([self.vectors[topic_id] for topic_id in self.ids])
+        similarities = self._matrix @ _unit(vector)
+        best = int(np.argmax(similarities))
+        return self.ids[best], float(similarities[best])
+
+    def embeddings(self, topic_ids) -> Dict[int, np.ndarray]:
+        """Unit name embeddings of known topics (e.g. to map topics to chunks without embedding them again)."""
+        with self.lock:
+            return {topic_id: self.vectors[topic_id] for topic_id in topic_ids if topic_id in self.vectors}
+
+def resolve_topics(db: Session, names, index: ProjectTopics, embed_model, description: str = None,
+                   threshold: float = None):
+    """
+    Maps extracted topic names onto `index`'s project topics, creating topics
+    only for names that match none: first by normalized name, then by
+    embedding similarity (`threshold`, TOPIC_MERGE_SIMILARITY by default)
+    against the project's topics and those created earlier in the same call.
+
+    Returns ([(topic_id, topic_name)] without repeats, stats). Stats count the
+    names merged into another topic and the bank generation calls that saves
+    (one per level for every name that would otherwise have been its own topic).
+    """
+    threshold = settings.TOPIC_MERGE_SIMILARITY if threshold is None else threshold
+    names = [name.strip() for name in names if name and name.strip()]
+    project_id = index.project_id
+    with index.lock:
+        index.refresh(db, embed_model)
+
+        # Only the first wording of each normalized name without a match is embedded, all in one
+        # batch and before any write (the embedding rate limiter commits through its own session)
+        pending = {}
+        for name in names:
+            key = topic_key(name)
+            if key not in index.keys:
+                pending.setdefault(key or name, name)
+        embedded = embed_model.get_text_embedding_batch(list(pending.values())) if pending else []
+        vectors = dict(zip(pending, embedded))
+
+        resolved = {}
+        merged = 0
+        for name in names:
+            key = topic_key(name)
+            topic_id = index.keys.get(key)
+            if topic_id is None:
+                vector = vectors[key or name]
+                candidate, similarity = index.nearest(vector)
+                if candidate is not None and similarity >= threshold:
+                    topic_id = candidate
+                    if key:
+                        index.keys[key] = topic_id # Later repeats of this wording match by name
+            if topic_id is None:
+                topic_id = _create_topic(db, name, project_id, description, vector)
+                index.add(topic_id, name, vector)
+            elif index.names[topic_id] != name:
+                merged += 1
+            resolved.setdefault(topic_id, index.names[topic_id])
+
+    topics = list(resolved.items())
+    return topics, {
+        "topics_extracted": len(names),
+        "topics_merged": merged,
+        "gen_calls_saved": (len(names) - len(topics)) * len(LEVELS),
+    }
+
+def _create_topic(db: Session, name: str, project_id: Optional[int], description: str, vector) -> int:
+    topic = Topic(name=name, description=description, project_id=project_id, name_embedding=json.dumps(list(vector)))
+    db.add(topic)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another ingestion created the same name first
+        db.rollback()
+        return db.query(Topic.id).filter(Topic.name == name, Topic.project_id == project_id).scalar()
+    return topic.id
@@ -0,0 +1,125 @@
+import argparse
+import asyncio
+from typing import Callable, List, Optional
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle
+
+# One Chroma collection per project.
+#
+# Project-scoped queries (sessions, ingestion) search only their project's
+# collection, so they no longer filter a shared collection that grows with
+# every tenant. Documents uploaded without a project stay in the original
+# collection. Queries with no project fan out to every collection and merge
+# the results (`FanOutRetriever`).
+
+KB_COLLECTION = "sales_knowledge_base"
+PROJECT_COLLECTION_PREFIX = f"{KB_COLLECTION}_project_"
+
+def collection_name(project_id: Optional[int] = None) -> str:
+    return f"{PROJECT_COLLECTION_PREFIX}{project_id}" if project_id else KB_COLLECTION
+
+def project_of(name: str) -> Optional[int]:
+    """Project id of a knowledge base collection name, None for the shared collection or unrelated names."""
+    if name.startswith(PROJECT_COLLECTION_PREFIX):
+        suffix = name[len(PROJECT_COLLECTION_PREFIX):]
+        return int(suffix) if suffix.isdigit() else None
+    return None
+
+def kb_collection_names(client) -> List[str]:
+    names = [c if isinstance(c, str) else c.name for c in client.list_collections()]
+    return sorted(name for name in names if name == KB_COLLECTION or project_of(name) is not None)
+
+class FanOutRetriever(BaseRetriever):
+    """
+    Runs one query against several vector retrievers and keeps the best
+    `similarity_top_k` by score. The query is embedded once and the embedding
+    is reused for every collection (they all use the same embedding model, so
+    the similarity scores are comparable).
+
+    `retrievers` is called per query, so collections created after this
+    retriever (new projects) are searched too.
+
+    Async retrieval awaits the query embedding and runs the collection queries
+    in worker threads: Chroma's client is synchronous, and its vector store's
+    `aquery` just calls `query` on the event loop.
+    """
+
+    def __init__(self, retrievers: Callable[[], list], embed_model, similarity_top_k: int = 5):
+        super().__init__()
+        self.retrievers = retrievers
+        self.embed_model = embed_model
+        self.similarity_top_k = similarity_top_k
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        retrievers = self.retrievers()
+        if len(retrievers) == 1:
+            return retrievers[0].retrieve(query_bundle)
+        if query_bundle.embedding is None:
+            query_bundle.embedding = self.embed_model.get_agg_embedding_from_queries(query_bundle.embedding_strs)
+        return self._best([retriever.retrieve(query_bundle) for retriever in retrievers])
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        retrievers = await asyncio.to_thread(self.retrievers) # Lists the collections
+        if query_bundle.embedding is None:
+            query_bundle.embedding = await self.embed_model.aget_agg_embedding_from_queries(query_bundle.embedding_strs)
+        results = await asyncio.gather(*(asyncio.to_thread(retriever.retrieve, query_bundle) for retriever in retrievers))
+        return self._best(results)
+
+    def _best(self, result_lists) -> List[NodeWithScore]:
+        results = [result for results in result_lists for result in results]
+        results.sort(key=lambda result: result.score or 0.0, reverse=True)
+        return results[:self.similarity_top_k]
+
+# Chunks stored with a project (metadata "project_id" is only set for those)
+PROJECT_CHUNKS = {"project_id": {"$ne": ""}}
+
+def split_shared_collection(client, batch_size: int = 500) -> dict:
+    """
+    Moves chunks tagged with a project out of the shared collection into that
+    project's collection, embeddings included (nothing is re-embedded).
+    Only reads project chunks, so once done it costs one empty query. Safe to
+    run again; returns the number of chunks moved per project.
+    """
+    try:
+        shared = client.get_collection(KB_COLLECTION)
+    except Exception:
+        return {}
+
+    moved = {}
+    while True:
+        # Moved chunks are deleted from the shared collection, so this always reads the next batch
+        batch = shared.get(where=PROJECT_CHUNKS, include=["embeddings", "documents", "metadatas"], limit=batch_size)
+        if not batch["ids"]:
+            break
+        by_project = {}
+        for i, metadata in enumerate(batch["metadatas"]):
+            project_id = str(metadata.get("project_id") or "")
+            if project_id.isdigit():
+                by_project.setdefault(int(project_id), []).append(i)
+        if not by_project:
+            break # Only malformed project ids left; leave them where they are
+        for project_id, rows in by_project.items():
+            target = client.get_or_create_collection(collection_name(project_id))
+            target.upsert(
+                ids=[batch["ids"][i] for i in rows],
+                embeddings=[batch["embeddings"][i] for i in rows],
+                documents=[batch["documents"][i] for i in rows],
+                metadatas=[batch["metadatas"][i] for i in rows],
+            )
+            moved[project_id] = moved.get(project_id, 0) + len(rows)
+        shared.delete(ids=[batch["ids"][i] for rows in by_project.values() for i in rows])
+    for project_id, count in sorted(moved.items()):
+        print(f"Moved {count} chunks of project {project_id} to {collection_name(project_id)}")
+    return moved
+
+if __name__ == "__main__":
+    from app.resources import registry
+
+    parser = argparse.ArgumentParser(description="Per-project knowledge base collections")
+    parser.add_argument("--split", action="store_true", help="Move project chunks out of the shared collection")
+    args = parser.parse_args()
+
+    if not args.split:
+        parser.error("nothing to do (use --split)")
+    moved = split_shared_collection(registry.chroma_client)
+    print(f"Moved {sum(moved.values())} chunks into {len(moved)} project collection(s)")
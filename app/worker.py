@@ -0,0 +1,134 @@
+"""
+Ingestion worker pool.
+
+Workers run in their own processes so PDF parsing, embedding and question
+generation never compete with the API for CPU or threadpool slots. Each
+worker claims jobs from the `processing_jobs` table (see app/job_queue.py)
+and runs up to `concurrency` of them at once.
+
+    python -m app.worker --workers 2 --concurrency 2
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+from app.config import settings
+from app.database import SessionLocal
+from app.job_queue import claim_next_job, complete_job, fail_job, heartbeat, requeue_stale_jobs
+from app.models import ProcessingJob
+
+async def _heartbeat_loop(job_id: int, worker_id: str):
+    """Returns once the job is no longer ours (requeued as stale, possibly claimed by another worker)."""
+    while True:
+        await asyncio.sleep(settings.INGEST_HEARTBEAT_SECONDS)
+        db = SessionLocal()
+        try:
+            if not heartbeat(db, job_id, worker_id):
+                return
+        except Exception as e:
+            # A missed beat isn't lost ownership; the job is only requeued after INGEST_HEARTBEAT_TIMEOUT_SECONDS
+            print(f"[{worker_id}] Heartbeat for job {job_id} failed: {e}")
+        finally:
+            db.close()
+
+async def run_job(job_id: int, worker_id: str):
+    # Imported here so the LLM/vector store clients are only created inside worker processes
+    from app.ingestion import process_pdf_background
+
+    db = SessionLocal()
+    job = db.query(ProcessingJob).filter(ProcessingJob.id == job_id).first()
+    processing = asyncio.create_task(
+        process_pdf_background(job.file_path, job.filename, job.id, job.context, job.project_id)
+    )
+    heartbeat_task = asyncio.create_task(_heartbeat_loop(job_id, worker_id))
+    try:
+        await asyncio.wait({processing, heartbeat_task}, return_when=asyncio.FIRST_COMPLETED)
+        if not processing.done():
+            # Another worker owns the job now: stop writing stage checkpoints and chunks alongside it
+            processing.cancel()
+            await asyncio.gather(processing, return_exceptions=True)
+            print(f"[{worker_id}] Lost ownership of job {job_id}, stopped processing it")
+            return
+        try:
+            released = complete_job(db, job, worker_id, processing.result())
+        except Exception as e:
+            db.rollback()
+            print(f"[{worker_id}] Job {job_id} failed (attempt {job.attempts}): {e}")
+            released = fail_job(db, job, worker_id, str(e))
+        if not released:
+            print(f"[{worker_id}] Lost ownership of job {job_id}, dropped its result")
+    finally:
+        heartbeat_task.cancel()
+        processing.cancel()
+        db.close()
+
+async def run_worker(worker_id: str, concurrency: int):
+    slots = asyncio.Semaphore(max(1, concurrency))
+    while True:
+        await slots.acquire()
+        db = SessionLocal()
+        try:
+            requeue_stale_jobs(db)
+            job = claim_next_job(db, worker_id)
+        except Exception as e:
+            print(f"[{worker_id}] Failed to poll the queue: {e}")
+            job = None
+        finally:
+            db.close()
+
+        if job is None:
+            slots.release()
+            await asyncio.sleep(settings.INGEST_POLL_SECONDS)
+            continue
+
+        print(f"[{worker_id}] Claimed job {job.id} ({job.filename}), attempt {job.attempts}")
+        task = asyncio.create_task(run_job(job.id, worker_id))
+        task.add_done_callback(lambda _: slots.release())
+
+def _worker_main(index: int, concurrency: int):
+    worker_id = f"{socket.gethostname()}-{os.getpid()}-{index}"
+    asyncio.run(run_worker(worker_id, concurrency))
+
+class WorkerPool:
+    def __init__(self, workers: int = None, concurrency: int = None):
+        self.workers = workers if workers is not None else settings.INGEST_WORKERS
+        self.concurrency = concurrency or settings.INGEST_WORKER_CONCURRENCY
+        self.processes = []
+
+    def start(self):
+        ctx = multiprocessing.get_context("spawn")
+        for index in range(self.workers):
+            process = ctx.Process(target=_worker_main, args=(index, self.concurrency), daemon=True)
+            process.start()
+            self.processes.append(process)
+
+    def join(self):
+        for process in self.processes:
+            process.join()
+
+    def stop(self, timeout: float = 5.0):
+        # Interrupted jobs stop heartbeating and are picked up again by the next worker
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.join(timeout)
+        self.processes = []
+
+if __name__ == "__main__":
+    from app.database import engine
+    from app.migrations import run_migrations
+
+    parser = argparse.ArgumentParser(description="Run ingestion workers")
+    parser.add_argument("--workers", type=int, default=settings.INGEST_WORKERS)
+    parser.add_argument("--concurrency", type=int, default=settings.INGEST_WORKER_CONCURRENCY)
+    args = parser.parse_args()
+
+    run_migrations(engine)
+    pool = WorkerPool(args.workers, args.concurrency)
+    pool.start()
+    print(f"Started {args.workers} ingestion worker(s), {args.concurrency} job(s) each")
+    try:
+        pool.join()
+    except KeyboardInterrupt:
+        pool.stop()
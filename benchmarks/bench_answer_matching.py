@@ -0,0 +1,102 @@
+"""
+Offline accuracy and throughput of the local answer matcher (app/answer_matching.py).
+
+Runs a small labeled set of (canonical answer, rep answer, same meaning?) pairs
+through the exact/lexical/embedding tiers and reports, per tier, how many
+pairs it decided and how many of those it got right. Pairs left AMBIGUOUS
+would go to the LLM. The embedding tier uses the deterministic bag-of-words
+FakeEmbedding, so it measures the tier plumbing and lexical overlap, not
+Gemini embedding quality; tune the embedding thresholds against real
+embeddings (or recorded `match_tier`/`match_score` history) before changing them.
+
+    python -m benchmarks.bench_answer_matching --embed-accept 0.85
+"""
+import argparse
+import time
+from collections import defaultdict
+from app.answer_matching import AnswerMatcher, AMBIGUOUS, MATCH
+from app.config import settings
+from benchmarks.fakes import FakeEmbedding
+
+LABELED_PAIRS = [
+    ("Active listening", "active listening", True),
+    ("Active listening", "Active listenning", True),
+    ("Active listening", "listening actively", True),
+    ("Active listening", "Talking about features", False),
+    ("Ask open-ended questions", "ask open ended questions", True),
+    ("Ask open-ended questions", "Ask questions that are open-ended", True),
+    ("Ask open-ended questions", "Ask yes or no questions", False),
+    ("Ask open-ended questions", "Ask closed questions", False),
+    ("Acknowledge the objection", "acknowledge the customer's objection", True),
+    ("Acknowledge the objection", "Ignore the objection", False),
+    ("Acknowledge the objection", "Dismiss the concern quickly", False),
+    ("Offer a discount only after establishing value", "Only offer a discount once value is established", True),
+    ("Offer a discount only after establishing value", "Never offer a discount", False),
+    ("Offer a discount only after establishing value", "Offer a discount immediately", False),
+    ("Identify the decision maker", "Find out who makes the decision", True),
+    ("Identify the decision maker", "identify decision maker", True),
+    ("Identify the decision maker", "Send the contract", False),
+    ("Summarize the customer's needs", "Summarise the customers needs", True),
+    ("Summarize the customer's needs", "Summarize your product features", False),
+    ("Return on investment", "ROI", True),
+    ("Return on investment", "return on investment", True),
+    ("Return on investment", "Total cost of ownership", False),
+    ("Build rapport", "build rapport with the client", True),
+    ("Build rapport", "Build a relationship of trust", True),
+    ("Build rapport", "Close the deal", False),
+    ("Use the customer's name", "use customers name", True),
+    ("Use the customer's name", "Do not use the customer's name", False),
+    ("Qualify the lead", "Qualify lead", True),
+    ("Qualify the lead", "Disqualify the lead", False),
+    ("Follow up within 24 hours", "follow up within 24 hours", True),
+    ("Follow up within 24 hours", "Follow up within a day", True),
+    ("Follow up within 24 hours", "Follow up next month", False),
+    ("Increase the price by ten percent", "Decrease the price by ten percent", False),
+    ("Increase the price by ten percent", "Increase the price by 10 percent", True),
+    ("Send the proposal on Tuesday", "Send the proposal on Thursday", False),
+    ("Send the proposal on Tuesday", "Send the proposal on Tuesdya", True),
+]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--token-accept", type=float, default=settings.ANSWER_MATCH_TOKEN_ACCEPT)
+    parser.add_argument("--edit-accept", type=float, default=settings.ANSWER_MATCH_EDIT_ACCEPT)
+    parser.add_argument("--embed-accept", type=float, default=settings.ANSWER_MATCH_EMBED_ACCEPT)
+    parser.add_argument("--embed-reject", type=float, default=settings.ANSWER_MATCH_EMBED_REJECT)
+    parser.add_argument("--repeat", type=int, default=200, help="Passes over the set for the throughput figure")
+    args = parser.parse_args()
+
+    settings.ANSWER_MATCH_TOKEN_ACCEPT = args.token_accept
+    settings.ANSWER_MATCH_EDIT_ACCEPT = args.edit_accept
+    settings.ANSWER_MATCH_EMBED_ACCEPT = args.embed_accept
+    settings.ANSWER_MATCH_EMBED_REJECT = args.embed_reject
+    matcher = AnswerMatcher(embed_model=FakeEmbedding())
+
+    decided = defaultdict(int)
+    correct = defaultdict(int)
+    ambiguous = 0
+    for canonical, answer, same in LABELED_PAIRS:
+        decision = matcher.evaluate(answer, canonical)
+        if decision.verdict == AMBIGUOUS:
+            ambiguous += 1
+            continue
+        decided[decision.tier] += 1
+        correct[decision.tier] += (decision.verdict == MATCH) == same
+
+    print(f"{'tier':>10} {'decided':>8} {'correct':>8} {'accuracy':>9}")
+    for tier in ["exact", "lexical", "embedding"]:
+        accuracy = correct[tier] / decided[tier] if decided[tier] else float("nan")
+        print(f"{tier:>10} {decided[tier]:>8} {correct[tier]:>8} {accuracy:>9.2%}")
+    total = len(LABELED_PAIRS)
+    print(f"Resolved locally: {total - ambiguous}/{total} ({(total - ambiguous) / total:.0%}), "
+          f"sent to LLM: {ambiguous}")
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        for canonical, answer, _ in LABELED_PAIRS:
+            matcher.evaluate(answer, canonical)
+    elapsed = time.perf_counter() - start
+    print(f"Throughput: {args.repeat * total / elapsed:,.0f} evaluations/sec (embeddings cached)")
+
+if __name__ == "__main__":
+    main()
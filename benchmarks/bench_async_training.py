@@ -0,0 +1,217 @@
+"""
+Fast-path latency of /get_question and /submit_answer while slow LLM calls
+are in flight, for the async handlers (app/async_assessment.py) and for the
+same endpoints served by the sync service in the threadpool, as before.
+
+  fast reps   answer bank questions by picking a choice: no LLM call, a few DB statements
+  slow reps   keep asking for questions on a topic with an empty bank: every request
+              waits on a fallback generation of --llm-latency seconds
+
+Each mode runs the fast reps alone (idle) and again next to --slow-reps slow
+ones (loaded). With the sync handlers every slow request holds one of the
+threadpool's --threads workers, so once they are all taken fast requests
+queue behind the LLM; the async handlers keep the fast path flat.
+
+By default the fake LLM answers without retrieval. With --retrieval-mode the
+generations retrieve first, through the app's retriever for that mode over an
+in-memory Chroma and lexical index seeded with --chunks chunks, with the
+query embedding taking --embed-latency seconds. This is what shows whether
+retrieval blocks the event loop.
+
+    python -m benchmarks.bench_async_training --slow-reps 60 --llm-latency 1.0 --output async.json
+    python -m benchmarks.bench_async_training --retrieval-mode hybrid --output async_hybrid.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+import uuid
+
+# Point the app at a scratch database before it is imported; the API process must not start workers
+_workdir = tempfile.mkdtemp(prefix="bench_async_training_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_workdir, 'bench.db')}"
+os.environ["INGEST_RUN_WORKERS_WITH_API"] = "false"
+os.environ["LLM_CACHE_ENABLED"] = "false"
+os.environ["PREFETCH_LOOKAHEAD"] = "0" # Every slow request waits on the LLM itself
+os.environ["LEXICAL_INDEX_PATH"] = os.path.join(_workdir, "lexical_index.db")
+
+import anyio.to_thread
+import chromadb
+import httpx
+from fastapi import Depends, FastAPI
+from llama_index.core import Document
+from llama_index.core.llms import MockLLM
+from llama_index.core.node_parser import SentenceSplitter
+from sqlalchemy.orm import Session
+from app.assessment import generate_question, submit_answer
+from app.chunk_sync import sync_document_chunks
+from app.config import settings
+from app.database import SessionLocal, engine, get_db
+from app.generation import LEVELS
+from app.main import app
+from app.migrations import run_migrations
+from app.models import AssessmentSession, QuestionBank, Topic, User
+from app.resources import registry
+from app.routers.training import AnswerRequest
+from benchmarks.bench_load import summarize
+from benchmarks.fakes import FakeEmbedding, FakeIndex, FakeLLM, FakeQueryEngine
+
+CHOICES = ["Listen first", "Talk about price", "Ignore it", "Change the subject"]
+
+# The pre-async handlers, for comparison
+sync_app = FastAPI()
+
+@sync_app.get("/api/v1/get_question/{session_id}")
+def sync_get_question(session_id: int, db: Session = Depends(get_db)):
+    return generate_question(db, session_id)
+
+@sync_app.post("/api/v1/submit_answer")
+def sync_submit_answer(request: AnswerRequest, db: Session = Depends(get_db)):
+    return submit_answer(db, request.session_id, request.user_answer, request.question_text)
+
+def seed(fast_reps: int, slow_reps: int, bank_size: int):
+    """Sessions on a topic with a bank (fast) and on one without (slow); returns their ids."""
+    db = SessionLocal()
+    banked, empty = Topic(name="Objection handling", description="bench"), Topic(name="Closing", description="bench")
+    db.add_all([banked, empty])
+    db.commit()
+    # Every level has questions, so fast reps stay on the bank as they level up
+    db.add_all([
+        QuestionBank(topic_id=banked.id, question_text=f"How do you answer {level} objection {i}?",
+                     choices=json.dumps(CHOICES), correct_answer=CHOICES[0], difficulty=level,
+                     explanations=json.dumps({c: "Listen first." for c in CHOICES[1:]}))
+        for level in LEVELS for i in range(bank_size)
+    ])
+    # One rep per user, as in production
+    sessions = {}
+    for kind, topic, reps in (("fast", banked, fast_reps), ("slow", empty, slow_reps)):
+        users = [User(username=f"bench_{topic.id}_{rep}") for rep in range(reps)]
+        db.add_all(users)
+        db.flush()
+        sessions[kind] = [
+            AssessmentSession(user_id=user.id, topic_id=topic.id, current_level="Beginner", score=0.0) for user in users
+        ]
+    db.add_all(sessions["fast"] + sessions["slow"])
+    db.commit()
+    ids = {kind: [s.id for s in rows] for kind, rows in sessions.items()}
+    db.close()
+    return ids
+
+async def fast_rep(client: httpx.AsyncClient, session_id: int, questions: int, latencies: dict, errors: list):
+    for i in range(questions):
+        start = time.perf_counter()
+        response = await client.get(f"/api/v1/get_question/{session_id}")
+        latencies["get_question"].append(time.perf_counter() - start)
+        body = response.json()
+        if response.status_code != 200 or not body or "error" in body:
+            errors.append(body)
+            return
+        start = time.perf_counter()
+        # Alternate right and wrong picks; wrong ones are explained from the stored explanations
+        response = await client.post("/api/v1/submit_answer", json={
+            "session_id": session_id, "question_text": body["question"], "user_answer": "AB"[i % 2]})
+        latencies["submit_answer"].append(time.perf_counter() - start)
+        if response.status_code != 200 or "error" in response.json():
+            errors.append(response.json())
+
+async def slow_rep(client: httpx.AsyncClient, session_id: int, stop: asyncio.Event, timings: list):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await client.get(f"/api/v1/get_question/{session_id}")
+        timings.append(time.perf_counter() - start)
+
+def seed_chunks(chunks: int):
+    """A playbook of `chunks` short chunks in the shared collection and the lexical index."""
+    documents = [
+        Document(text=f"Playbook section {i}: close by agreeing on next step {i} and a date for follow-up {i}.",
+                 metadata={"filename": "playbook.pdf"})
+        for i in range(chunks)
+    ]
+    sync_document_chunks(documents, registry.vector_store(), "playbook.pdf", None, registry.embed_model,
+                         node_parser=SentenceSplitter(chunk_size=64, chunk_overlap=0),
+                         lexical_index=registry.lexical_index())
+
+async def run_phase(target, fast_ids, slow_ids, questions: int, llm):
+    latencies = {"get_question": [], "submit_answer": []}
+    slow_timings, errors = [], []
+    stop = asyncio.Event()
+    calls_before = llm.calls
+    transport = httpx.ASGITransport(app=target)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+        slow = [asyncio.create_task(slow_rep(client, session_id, stop, slow_timings)) for session_id in slow_ids]
+        if slow:
+            # Let the slow requests reach the LLM first
+            while llm.calls - calls_before < len(slow_ids) and not all(task.done() for task in slow):
+                await asyncio.sleep(0.01)
+        start = time.perf_counter()
+        await asyncio.gather(*[fast_rep(client, session_id, questions, latencies, errors) for session_id in fast_ids])
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await asyncio.gather(*slow)
+    return {
+        "seconds": round(elapsed, 3),
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "endpoints": {name: summarize(samples) for name, samples in latencies.items()},
+        "slow_get_question": summarize(slow_timings),
+    }
+
+async def run(args):
+    run_migrations(engine)
+    # Random words, so no generated question is a near-duplicate of an earlier one
+    respond = lambda prompt: json.dumps({
+        "question_text": f"Closing question {uuid.uuid4().hex[:8]} {uuid.uuid4().hex[:8]}?",
+        "choices": CHOICES, "correct_answer": CHOICES[0],
+    })
+    if args.retrieval_mode:
+        settings.RETRIEVAL_MODE = args.retrieval_mode
+        llm = FakeLLM(latency=args.llm_latency, respond=respond)
+        registry.use(llm=llm, embed_model=FakeEmbedding(latency=args.embed_latency),
+                     chroma_client=chromadb.EphemeralClient())
+        seed_chunks(args.chunks)
+    else:
+        llm = FakeQueryEngine(latency=args.llm_latency, respond=respond)
+        registry.use(llm=MockLLM(), embed_model=FakeEmbedding(), chroma_client=chromadb.EphemeralClient(),
+                     index=FakeIndex(llm))
+    # Starlette runs sync handlers through anyio's default limiter; size it like a deployment would
+    anyio.to_thread.current_default_thread_limiter().total_tokens = args.threads
+
+    results = {"config": vars(args), "modes": {}}
+    for mode, target in (("sync", sync_app), ("async", app)):
+        phases = {}
+        for phase, slow_reps in (("idle", 0), ("loaded", args.slow_reps)):
+            ids = seed(args.fast_reps, slow_reps, args.questions + 5)
+            phases[phase] = await run_phase(target, ids["fast"], ids["slow"], args.questions, llm)
+        idle, loaded = (phases[p]["endpoints"]["get_question"] for p in ("idle", "loaded"))
+        phases["get_question_p95_slowdown"] = round(loaded["p95_ms"] / idle["p95_ms"], 2) if idle.get("p95_ms") else None
+        results["modes"][mode] = phases
+    return results
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="Fake LLM latency per fallback generation (seconds)")
+    parser.add_argument("--fast-reps", type=int, default=8, help="Concurrent reps answering bank questions")
+    parser.add_argument("--slow-reps", type=int, default=60, help="Concurrent reps waiting on fallback generation")
+    parser.add_argument("--questions", type=int, default=10, help="Questions answered per fast rep")
+    parser.add_argument("--threads", type=int, default=40, help="Threadpool size for sync handlers (Starlette's default)")
+    parser.add_argument("--retrieval-mode", choices=("vector", "hybrid", "lexical"),
+                        help="Retrieve before each generation with this mode (default: no retrieval)")
+    parser.add_argument("--chunks", type=int, default=500, help="Chunks in the knowledge base with --retrieval-mode")
+    parser.add_argument("--embed-latency", type=float, default=0.05,
+                        help="Query embedding latency with --retrieval-mode (seconds)")
+    parser.add_argument("--output", help="Also write the JSON results to this file")
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING) # One INFO line per request otherwise
+
+    results = asyncio.run(run(args))
+    report = json.dumps(results, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+
+if __name__ == "__main__":
+    main()
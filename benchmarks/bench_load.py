@@ -0,0 +1,231 @@
+"""
+End-to-end load benchmark: the real FastAPI app, SQLite and Chroma, with the
+Gemini LLM and embedding model replaced by deterministic fakes that sleep a
+configurable latency per call.
+
+  ingestion     synthetic PDFs through the worker pipeline: pages/sec, LLM calls and generation prompt tokens per document,
+                then each one reprocessed unchanged and with a new context (stages still valid are skipped)
+  training      N concurrent reps looping /get_question + /submit_answer: latency percentiles
+  kb_search     /admin/knowledge_base/search latency percentiles per retrieval mode
+
+Everything runs against a throwaway database and an in-memory vector store.
+Results are printed as JSON and optionally written to --output for comparing runs.
+
+    python -m benchmarks.bench_load --reps 20 --llm-latency 0.2 --output bench.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import tempfile
+import time
+
+# Point the app at a scratch database before it is imported; the API process must not start workers
+_workdir = tempfile.mkdtemp(prefix="bench_load_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_workdir, 'bench.db')}"
+os.environ["INGEST_RUN_WORKERS_WITH_API"] = "false"
+os.environ["LLM_CACHE_ENABLED"] = "false"
+os.environ["BLOB_DIR"] = os.path.join(_workdir, "blobs")
+
+import httpx
+from app.assessment import prefetcher
+from app.blob_store import store_blob
+from app.database import SessionLocal, engine
+from app.ingestion import process_pdf_background
+from app.job_queue import claim_next_job, complete_job, enqueue_job
+from app.main import app
+from app.migrations import run_migrations
+from app.models import JobMetric
+from app.resources import registry
+from benchmarks.fakes import FakeEmbedding, FakeLLM, write_pdf
+
+SEARCH_QUERIES = ["how to handle price objections", "discovery call questions", "closing techniques",
+                  "negotiation tactics", "follow up after a demo"]
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def summarize(samples):
+    if not samples:
+        return {"count": 0}
+    return {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 2),
+        "p95_ms": round(percentile(samples, 95) * 1000, 2),
+        "p99_ms": round(percentile(samples, 99) * 1000, 2),
+        "mean_ms": round(statistics.mean(samples) * 1000, 2),
+        "max_ms": round(max(samples) * 1000, 2),
+    }
+
+def document_pages(doc: int, pages: int):
+    topics = ["discovery", "objection handling", "negotiation", "closing", "account planning"]
+    return [
+        "\n".join(
+            f"Document {doc} page {page}: when {topics[(page + line) % len(topics)]} comes up, "
+            f"reps should listen, ask one clarifying question and tie the answer to the buyer's goal {line}."
+            for line in range(30)
+        )
+        for page in range(pages)
+    ]
+
+async def ingest(llm: FakeLLM, filename: str, path: str, context: str = None):
+    """Runs one job through the pipeline. Returns (seconds, LLM calls, texts embedded, job metrics)."""
+    db = SessionLocal()
+    enqueue_job(db, filename, path, context)
+    job = claim_next_job(db, "bench")
+    calls_before, embedded_before = llm.calls, registry.embed_model.texts_embedded
+    start = time.perf_counter()
+    message = await process_pdf_background(path, job.filename, job.id, context)
+    seconds = time.perf_counter() - start
+    complete_job(db, job, "bench", message)
+    metrics = {m.name: m.value for m in db.query(JobMetric).filter(JobMetric.job_id == job.id)}
+    db.close()
+    return seconds, llm.calls - calls_before, registry.embed_model.texts_embedded - embedded_before, metrics
+
+async def bench_ingestion(llm: FakeLLM, documents: int, pages: int):
+    timings, calls, job_metrics, uploads = [], [], [], []
+    for doc in range(documents):
+        path = os.path.join(_workdir, f"playbook_{doc}.pdf")
+        write_pdf(path, document_pages(doc, pages))
+        # Stored like an upload, so reprocessing reads it back from the blob store
+        with open(path, "rb") as source:
+            _, _, blob = store_blob(source, os.path.basename(path))
+        uploads.append((os.path.basename(path), blob))
+        seconds, llm_calls, _, metrics = await ingest(llm, os.path.basename(path), blob)
+        timings.append(seconds)
+        calls.append(llm_calls)
+        job_metrics.append(metrics)
+
+    # Each file again with the same inputs (a retry, or reprocessing without changes), then with a new context
+    reprocessed = {}
+    for scenario, context in (("reprocess_unchanged", None), ("reprocess_new_context", "Enterprise renewals")):
+        runs = [await ingest(llm, filename, blob, context) for filename, blob in uploads]
+        reprocessed[scenario] = {
+            "per_document": summarize([seconds for seconds, _, _, _ in runs]),
+            "llm_calls_per_document": statistics.mean(llm_calls for _, llm_calls, _, _ in runs) if runs else 0,
+            "texts_embedded_per_document": statistics.mean(embedded for _, _, embedded, _ in runs) if runs else 0,
+            "stages_reused_per_document": statistics.mean(m.get("stages_reused", 0) for _, _, _, m in runs) if runs else 0,
+        }
+    total = sum(timings)
+    return {
+        "documents": documents,
+        "pages_per_document": pages,
+        "seconds": round(total, 3),
+        "pages_per_sec": round(documents * pages / total, 2) if total else None,
+        "llm_calls_per_document": statistics.mean(calls) if calls else 0,
+        "gen_prompt_tokens_per_document": round(statistics.mean(t.get("gen_prompt_tokens", 0) for t in job_metrics), 1) if job_metrics else 0,
+        "gen_calls_saved_by_topic_merging": sum(t.get("gen_calls_saved", 0) for t in job_metrics),
+        "gen_prompt_tokens_unscoped_per_document": round(statistics.mean(t.get("gen_prompt_tokens_unscoped", 0) for t in job_metrics), 1) if job_metrics else 0,
+        "per_document": summarize(timings),
+        # New context: parsing is skipped and no chunk is embedded again, topics and questions are regenerated
+        **reprocessed,
+    }
+
+async def simulate_rep(client: httpx.AsyncClient, user_id: int, questions: int, free_text_ratio: float,
+                       latencies: dict, errors: list):
+    async def call(name, method, url, **kwargs):
+        start = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        latencies[name].append(time.perf_counter() - start)
+        body = response.json()
+        if response.status_code != 200 or (isinstance(body, dict) and "error" in body):
+            errors.append({"endpoint": name, "status": response.status_code, "body": str(body)[:200]})
+            return None
+        return body
+
+    session = await call("start_assessment", "POST", "/api/v1/start_assessment", json={"user_id": user_id})
+    if session is None:
+        return
+    for _ in range(questions):
+        question = await call("get_question", "GET", f"/api/v1/get_question/{session['id']}")
+        if question is None:
+            return
+        if random.random() < free_text_ratio:
+            answer = "I would lower the price right away"
+        else:
+            answer = random.choice(question["options"])["key"]
+        await call("submit_answer", "POST", "/api/v1/submit_answer", json={
+            "session_id": session["id"], "question_text": question["question"], "user_answer": answer})
+
+async def bench_training(llm: FakeLLM, reps: int, questions: int, free_text_ratio: float):
+    latencies = {"start_assessment": [], "get_question": [], "submit_answer": []}
+    errors = []
+    calls_before = llm.calls
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*[
+            simulate_rep(client, 10_000 + rep, questions, free_text_ratio, latencies, errors) for rep in range(reps)
+        ])
+        elapsed = time.perf_counter() - start
+    requests = sum(len(samples) for samples in latencies.values())
+    return {
+        "reps": reps,
+        "questions_per_rep": questions,
+        "seconds": round(elapsed, 3),
+        "requests_per_sec": round(requests / elapsed, 2) if elapsed else None,
+        "llm_calls": llm.calls - calls_before,
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "endpoints": {name: summarize(samples) for name, samples in latencies.items()},
+    }
+
+async def bench_kb_search(searches: int):
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+        for mode in ("vector", "hybrid", "lexical"):
+            timings = []
+            for i in range(searches):
+                start = time.perf_counter()
+                response = await client.get("/api/v1/admin/knowledge_base/search",
+                                            params={"query": SEARCH_QUERIES[i % len(SEARCH_QUERIES)], "mode": mode})
+                timings.append(time.perf_counter() - start)
+                response.raise_for_status()
+            results[mode] = summarize(timings)
+    return results
+
+async def run(args):
+    llm = FakeLLM(latency=args.llm_latency)
+    registry.use_in_memory(llm=llm, embed_model=FakeEmbedding(latency=args.embed_latency))
+    run_migrations(engine)
+    random.seed(args.seed)
+
+    results = {
+        "config": {**vars(args), "python": platform.python_version(), "workdir": _workdir},
+        "ingestion": await bench_ingestion(llm, args.documents, args.pages),
+        "training": await bench_training(llm, args.reps, args.questions, args.free_text_ratio),
+        "kb_search": await bench_kb_search(args.searches),
+    }
+    prefetcher.shutdown()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Fake LLM latency per call (seconds)")
+    parser.add_argument("--embed-latency", type=float, default=0.001, help="Fake embedding latency per text (seconds)")
+    parser.add_argument("--documents", type=int, default=3)
+    parser.add_argument("--pages", type=int, default=5, help="Pages per synthetic PDF")
+    parser.add_argument("--reps", type=int, default=10, help="Concurrent simulated reps")
+    parser.add_argument("--questions", type=int, default=10, help="Questions answered per rep")
+    parser.add_argument("--free-text-ratio", type=float, default=0.1, help="Share of answers typed instead of picked")
+    parser.add_argument("--searches", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the JSON results to this file")
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING) # One INFO line per request otherwise
+
+    results = asyncio.run(run(args))
+    report = json.dumps(results, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+Login storm: a burst of /auth/token logins while reps are answering bank
+questions, with argon2 inline in the request thread (the old sync login
+handler) and on the hashing process pool (app/password_hashing.py).
+
+Reports login latency and rejections, the deepest the hashing queue got,
+/get_question latency before and during the storm, and /auth/me latency
+for a token's first request (decode + user lookup) and repeat requests
+(served from the token cache).
+
+    python -m benchmarks.bench_login_storm --logins 100 --workers 2 --output login.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+
+# Point the app at a scratch database before it is imported; the API process must not start workers
+_workdir = tempfile.mkdtemp(prefix="bench_login_storm_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_workdir, 'bench.db')}"
+os.environ["INGEST_RUN_WORKERS_WITH_API"] = "false"
+os.environ["LLM_CACHE_ENABLED"] = "false"
+os.environ["PREFETCH_LOOKAHEAD"] = "0"
+
+import httpx
+from fastapi import Depends, FastAPI, HTTPException
+from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import SessionLocal, engine, get_db
+from app.generation import LEVELS
+from app.main import app
+from app.migrations import run_migrations
+from app.models import AssessmentSession, QuestionBank, Topic, User
+from app.password_hashing import password_hasher, pwd_context
+from app.security import create_access_token, token_cache
+from benchmarks.bench_load import summarize
+
+CHOICES = ["Listen first", "Talk about price", "Ignore it", "Change the subject"]
+PASSWORD = "correct horse battery staple"
+
+# The login handler before the hashing pool, for comparison: argon2 inline in a threadpool worker
+inline_app = FastAPI()
+
+@inline_app.post("/api/v1/auth/token")
+def inline_login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+    user = db.query(User).filter(User.username == form_data.username).first()
+    if not user or not pwd_context.verify(form_data.password, user.password_hash):
+        raise HTTPException(status_code=401, detail="Incorrect username or password")
+    return {"access_token": create_access_token({"sub": user.username}), "token_type": "bearer"}
+
+def seed(users: int, reps: int, questions: int, tag: str):
+    """Users with passwords (one hash, shared) and reps with sessions on a bank-backed topic."""
+    db = SessionLocal()
+    hashed = pwd_context.hash(PASSWORD)
+    db.add_all([User(username=f"{tag}_user_{i}", password_hash=hashed) for i in range(users)])
+    topic = Topic(name=f"Objection handling {tag}", description="bench")
+    db.add(topic)
+    db.commit()
+    db.add_all([
+        QuestionBank(topic_id=topic.id, question_text=f"[{tag}] How do you answer {level} objection {i}?",
+                     choices=json.dumps(CHOICES), correct_answer=CHOICES[0], difficulty=level,
+                     explanations=json.dumps({c: "Listen first." for c in CHOICES[1:]}))
+        for level in LEVELS for i in range(questions + 5)
+    ])
+    rep_users = [User(username=f"{tag}_rep_{i}") for i in range(reps)]
+    db.add_all(rep_users)
+    db.flush()
+    sessions = [AssessmentSession(user_id=u.id, topic_id=topic.id, current_level="Beginner", score=0.0) for u in rep_users]
+    db.add_all(sessions)
+    db.commit()
+    session_ids = [s.id for s in sessions]
+    db.close()
+    return session_ids
+
+async def rep(client: httpx.AsyncClient, session_id: int, questions: int, latencies: list):
+    for i in range(questions):
+        start = time.perf_counter()
+        question = (await client.get(f"/api/v1/get_question/{session_id}")).json()
+        latencies.append(time.perf_counter() - start)
+        await client.post("/api/v1/submit_answer", json={
+            "session_id": session_id, "question_text": question["question"], "user_answer": "AB"[i % 2]})
+
+async def login(client: httpx.AsyncClient, username: str, latencies: list, statuses: dict):
+    start = time.perf_counter()
+    response = await client.post("/api/v1/auth/token", data={"username": username, "password": PASSWORD})
+    latencies.append(time.perf_counter() - start)
+    statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+    return response.json().get("access_token") if response.status_code == 200 else None
+
+async def sample_queue(stop: asyncio.Event, depths: list):
+    while not stop.is_set():
+        depths.append(password_hasher.queue_depth)
+        await asyncio.sleep(0.01)
+
+async def run_mode(mode: str, login_app, args):
+    tag = f"{mode}"
+    idle_ids = seed(0, args.reps, args.questions, f"{tag}_idle")
+    storm_ids = seed(args.logins, args.reps, args.questions, tag)
+    api = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=600)
+    logins = httpx.AsyncClient(transport=httpx.ASGITransport(app=login_app), base_url="http://bench", timeout=600)
+    async with api, logins:
+        idle = []
+        await asyncio.gather(*[rep(api, session_id, args.questions, idle) for session_id in idle_ids])
+
+        login_latencies, statuses, depths, during = [], {}, [], []
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(sample_queue(stop, depths))
+        start = time.perf_counter()
+        storm = asyncio.gather(*[login(logins, f"{tag}_user_{i}", login_latencies, statuses) for i in range(args.logins)])
+        await asyncio.sleep(0.05) # Logins first, then reps keep answering through the storm
+        await asyncio.gather(*[rep(api, session_id, args.questions, during) for session_id in storm_ids])
+        tokens = [token for token in await storm if token]
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await sampler
+
+        # The same tokens twice: first requests decode and look the user up, repeats come from the cache
+        token_cache.clear()
+        me = {"first": [], "repeat": []}
+        for kind in ("first", "repeat"):
+            for token in tokens[:args.me_requests]:
+                start_me = time.perf_counter()
+                await api.get("/api/v1/auth/me", headers={"Authorization": f"Bearer {token}"})
+                me[kind].append(time.perf_counter() - start_me)
+
+    return {
+        "storm_seconds": round(elapsed, 3),
+        "login": {"statuses": {str(code): count for code, count in sorted(statuses.items())}, **summarize(login_latencies)},
+        "max_hash_queue_depth": max(depths, default=0),
+        "get_question_idle": summarize(idle),
+        "get_question_during_storm": summarize(during),
+        "auth_me_first": summarize(me["first"]),
+        "auth_me_cached": summarize(me["repeat"]),
+    }
+
+async def run(args):
+    run_migrations(engine)
+    results = {"config": vars(args), "modes": {}}
+    settings.PASSWORD_HASH_WORKERS = args.workers
+    settings.PASSWORD_HASH_MAX_QUEUE = args.max_queue
+    password_hasher.start()
+    try:
+        for mode, login_app in (("inline", inline_app), ("pool", app)):
+            results["modes"][mode] = await run_mode(mode, login_app, args)
+    finally:
+        password_hasher.shutdown()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=60, help="Logins fired at once")
+    parser.add_argument("--workers", type=int, default=2, help="Hashing processes (PASSWORD_HASH_WORKERS)")
+    parser.add_argument("--max-queue", type=int, default=256, help="PASSWORD_HASH_MAX_QUEUE")
+    parser.add_argument("--reps", type=int, default=4, help="Reps answering questions through the storm")
+    parser.add_argument("--questions", type=int, default=10, help="Questions per rep")
+    parser.add_argument("--me-requests", type=int, default=20, help="Tokens used for the /auth/me comparison")
+    parser.add_argument("--output", help="Also write the JSON results to this file")
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING) # One INFO line per request otherwise
+
+    results = asyncio.run(run(args))
+    report = json.dumps(results, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Benchmark for the concurrent question bank fan-out in app/generation.py.
+
+Uses a fake query engine with a fixed injected latency, so wall time should be
+roughly ceil(topics * 3 / concurrency) * latency: it scales with the
+concurrency limit, not with the number of topics.
+
+    python -m benchmarks.bench_question_generation --latency 0.2
+"""
+import argparse
+import asyncio
+import time
+from app.config import settings
+from app.generation import generate_question_bank, LEVELS
+from benchmarks.fakes import FakeQueryEngine
+
+async def run_once(topic_count: int, concurrency: int, latency: float):
+    engine = FakeQueryEngine(latency=latency)
+    topics = [(i, f"Topic {i}") for i in range(topic_count)]
+    saved = []
+    start = time.perf_counter()
+    stats = await generate_question_bank(
+        engine, topics, lambda topic_id, level, qs: saved.extend(qs), concurrency=concurrency
+    )
+    elapsed = time.perf_counter() - start
+    return elapsed, stats, engine.max_in_flight, len(saved)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.1, help="Fake LLM latency per call (seconds)")
+    parser.add_argument("--topics", type=int, nargs="+", default=[10, 20, 40])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    args = parser.parse_args()
+    # Every run must actually hit the fake LLM
+    settings.LLM_CACHE_ENABLED = False
+
+    print(f"{'topics':>6} {'calls':>6} {'limit':>6} {'peak':>6} {'wall (s)':>9} {'serial (s)':>11} {'speedup':>8}")
+    for topic_count in args.topics:
+        serial = topic_count * len(LEVELS) * args.latency
+        for concurrency in args.concurrency:
+            elapsed, stats, peak, _ = asyncio.run(run_once(topic_count, concurrency, args.latency))
+            calls = stats["succeeded"] + stats["failed"]
+            print(f"{topic_count:>6} {calls:>6} {concurrency:>6} {peak:>6} {elapsed:>9.2f} {serial:>11.2f} {serial / elapsed:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Latency of picking the next bank question as the bank grows.
+
+Compares the indexed sampler in app/sampling.py with the previous approach
+(NOT IN over answered texts, then materializing every candidate row for
+random.choice). The session has already answered `--answered` questions.
+
+    python -m benchmarks.bench_question_selection
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from app.models import AssessmentSession, Base, QuestionBank, QuestionHistory, Topic, User
+from app.sampling import sample_unseen_question
+
+def legacy_pick(db, session_id, topic_id, difficulty):
+    answered = [a[0] for a in db.query(QuestionHistory.question_text).filter(QuestionHistory.session_id == session_id).all()]
+    query = db.query(QuestionBank).filter(QuestionBank.topic_id == topic_id, QuestionBank.difficulty == difficulty)
+    if answered:
+        query = query.filter(QuestionBank.question_text.notin_(answered))
+    candidates = query.all()
+    return random.choice(candidates) if candidates else None
+
+def build_db(rows: int, answered: int):
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    topics = [Topic(name=f"Topic {i}", description="bench") for i in range(4)]
+    user = User(username="bench")
+    db.add_all(topics + [user])
+    db.commit()
+    levels = ["Beginner", "Intermediate", "Advanced"]
+    db.execute(insert(QuestionBank), [
+        {"topic_id": topics[i % 4].id, "difficulty": levels[(i // 4) % 3], "question_text": f"Question {i}?",
+         "choices": '["A", "B", "C", "D"]', "correct_answer": "A"}
+        for i in range(rows)
+    ])
+    session = AssessmentSession(user_id=user.id, current_level="Beginner", score=0.0)
+    db.add(session)
+    db.commit()
+    target = topics[0].id
+    for _ in range(answered):
+        q = sample_unseen_question(db, session.id, target, "Beginner")
+        if q is None:
+            break
+        db.add(QuestionHistory(session_id=session.id, topic_id=target, question_bank_id=q.id,
+                               question_text=q.question_text, correct_answer=q.correct_answer, is_correct=1))
+        db.commit()
+    return db, session.id, target
+
+def time_calls(fn, calls):
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[100, 1000, 10000, 100000])
+    parser.add_argument("--answered", type=int, default=50)
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'bank rows':>10} {'indexed p50 (ms)':>17} {'legacy p50 (ms)':>16}")
+    for rows in args.rows:
+        db, session_id, topic_id = build_db(rows, args.answered)
+        indexed = time_calls(lambda: sample_unseen_question(db, session_id, topic_id, "Beginner"), args.calls)
+        legacy = time_calls(lambda: legacy_pick(db, session_id, topic_id, "Beginner"), max(5, args.calls // 20))
+        print(f"{rows:>10} {indexed:>17.3f} {legacy:>16.3f}")
+        db.close()
+
+if __name__ == "__main__":
+    main()
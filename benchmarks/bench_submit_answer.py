@@ -0,0 +1,85 @@
+"""
+Latency of `submit_answer` for wrong answers, with and without precomputed
+per-distractor explanations.
+
+  precomputed  wrong choice on a bank question that has stored explanations (no LLM call)
+  live         wrong choice on a bank question without explanations (1 LLM call)
+  free_text    free-text wrong answer (LLM equivalence check + explanation, 2 LLM calls)
+
+    python -m benchmarks.bench_submit_answer --latency 0.5 --requests 50
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app import assessment
+from app.config import settings
+from app.resources import registry
+from benchmarks.fakes import FakeIndex, FakeQueryEngine
+from app.models import AssessmentSession, Base, QuestionBank, QuestionHistory, Topic, User
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def run_mode(SessionLocal, mode: str, requests: int):
+    db = SessionLocal()
+    topic = Topic(name=f"Topic {mode}", description="bench")
+    user = User(username=f"bench_{mode}")
+    db.add_all([topic, user])
+    db.commit()
+    session = AssessmentSession(user_id=user.id, current_level="Beginner", score=0.0)
+    db.add(session)
+    db.commit()
+
+    choices = ["Listen first", "Talk about price", "Ignore it", "Change the subject"]
+    explanations = None
+    if mode != "live":
+        explanations = json.dumps({c: f"'{c}' misses the point: listen first." for c in choices[1:]})
+
+    timings = []
+    for i in range(requests):
+        text = f"[{mode}] How should you respond to objection {i}?"
+        db.add(QuestionBank(topic_id=topic.id, question_text=text, choices=json.dumps(choices),
+                            correct_answer=choices[0], explanations=explanations, difficulty="Beginner"))
+        db.add(QuestionHistory(session_id=session.id, topic_id=topic.id, question_text=text,
+                               correct_answer=choices[0], is_correct=0))
+        db.commit()
+
+        answer = "Just keep pitching harder" if mode == "free_text" else "B"
+        start = time.perf_counter()
+        result = assessment.submit_answer(db, session.id, answer, text)
+        timings.append(time.perf_counter() - start)
+        assert result["correct"] is False
+    db.close()
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.3, help="Fake LLM latency per call (seconds)")
+    parser.add_argument("--requests", type=int, default=30)
+    args = parser.parse_args()
+
+    settings.LLM_CACHE_ENABLED = False
+    engine = FakeQueryEngine(latency=args.latency, respond=lambda prompt: "NO")
+    registry.use(index=FakeIndex(engine))
+
+    db_path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    db_engine = create_engine(f"sqlite:///{db_path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=db_engine)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=db_engine)
+
+    print(f"{'mode':>12} {'p50 (ms)':>9} {'p95 (ms)':>9} {'mean (ms)':>10} {'LLM calls/req':>14}")
+    for mode in ["precomputed", "live", "free_text"]:
+        calls_before = engine.calls
+        timings = run_mode(SessionLocal, mode, args.requests)
+        calls = (engine.calls - calls_before) / args.requests
+        print(f"{mode:>12} {percentile(timings, 50) * 1000:>9.1f} {percentile(timings, 95) * 1000:>9.1f} "
+              f"{statistics.mean(timings) * 1000:>10.1f} {calls:>14.1f}")
+
+if __name__ == "__main__":
+    main()
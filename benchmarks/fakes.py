@@ -0,0 +1,199 @@
+"""Deterministic stand-ins for the Gemini-backed LlamaIndex objects, with injected latency."""
+import asyncio
+import hashlib
+import json
+import math
+import re
+import time
+from typing import Any
+from llama_index.core.embeddings import BaseEmbedding
+from llama_index.core.llms import CompletionResponse, CustomLLM, LLMMetadata
+from llama_index.core.llms.callbacks import llm_completion_callback
+
+def fake_bank_response(prompt: str) -> str:
+    questions = [
+        {
+            "question_text": f"Question {i} for: {prompt[:60]}",
+            "choices": ["A", "B", "C", "D"],
+            "correct_answer": "A",
+            "explanations": {c: f"{c} is not right because the material says A." for c in ["B", "C", "D"]},
+        }
+        for i in range(3)
+    ]
+    return json.dumps(questions)
+
+class FakeStreamingResponse:
+    """Mimics LlamaIndex's StreamingResponse: `response_gen` yields the answer word by word."""
+
+    def __init__(self, text: str, token_latency: float = 0.0):
+        self.text = text
+        self.token_latency = token_latency
+
+    @property
+    def response_gen(self):
+        for i, word in enumerate(self.text.split(" ")):
+            if self.token_latency:
+                time.sleep(self.token_latency)
+            yield word if i == 0 else " " + word
+
+    def __str__(self):
+        return self.text
+
+class FakeQueryEngine:
+    """
+    Mimics `index.as_query_engine()`: every call sleeps `latency` seconds then answers.
+    With `stream=True`, `query` returns a FakeStreamingResponse instead of a string.
+    """
+
+    def __init__(self, latency: float = 0.05, respond=fake_bank_response, stream: bool = False, token_latency: float = 0.0):
+        self.latency = latency
+        self.respond = respond
+        self.stream = stream
+        self.token_latency = token_latency
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def query(self, prompt):
+        self.calls += 1
+        time.sleep(self.latency)
+        if self.stream:
+            return FakeStreamingResponse(self.respond(str(prompt)), self.token_latency)
+        return self.respond(str(prompt))
+
+    async def aquery(self, prompt):
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            return self.respond(str(prompt))
+        finally:
+            self.in_flight -= 1
+
+class FakeIndex:
+    """Stands in for a VectorStoreIndex; every query engine it hands out shares the same fake LLM."""
+
+    def __init__(self, engine: FakeQueryEngine):
+        self.engine = engine
+
+    def as_query_engine(self, **kwargs):
+        return self.engine
+
+class FakeEmbedding(BaseEmbedding):
+    """Deterministic bag-of-words hashing embedding that counts how many texts it embedded."""
+
+    dim: int = 64
+    latency: float = 0.0
+    texts_embedded: int = 0
+
+    def _vector(self, text: str):
+        vector = [0.0] * self.dim
+        for token in text.lower().split():
+            vector[int(hashlib.md5(token.encode("utf-8")).hexdigest(), 16) % self.dim] += 1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def _get_text_embedding(self, text: str):
+        self.texts_embedded += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return self._vector(text)
+
+    def _get_query_embedding(self, query: str):
+        return self._get_text_embedding(query)
+
+    async def _aget_query_embedding(self, query: str):
+        # Awaits its latency like a real client's async call, instead of sleeping on the event loop
+        self.texts_embedded += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._vector(query)
+
+def fake_llm_response(prompt: str) -> str:
+    """Answers each of the app's prompts (matched on their instructions) with a well-formed response."""
+    digest = hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:8]
+    topic = re.search(r"about '([^']+)'", prompt)
+    topic = topic.group(1) if topic else "sales"
+    choices = [f"Best practice for {topic}", f"Discount {topic}", f"Skip {topic}", f"Rush {topic}"]
+    if "comma-separated list of topic names" in prompt:
+        # Real extraction replies repeat topics under different wordings
+        return "Discovery Calls, Objection Handling, Handling Objections, Negotiation, Closing Techniques, Closing Technique"
+    if "Return a JSON array" in prompt:
+        return json.dumps([
+            {
+                "question_text": f"What is step {i} of {topic}? ({digest})",
+                "choices": choices,
+                "correct_answer": choices[0],
+                "explanations": {c: f"{c} skips the step the material describes." for c in choices[1:]},
+            }
+            for i in range(3)
+        ])
+    if "multiple-choice question about" in prompt:
+        return json.dumps({"question_text": f"Which approach fits {topic}? ({digest})",
+                           "choices": choices, "correct_answer": choices[0]})
+    if "Return ONLY 'YES' or 'NO'" in prompt:
+        return "NO"
+    return "That answer misses the key point: start from the buyer's goals, then tie the offer back to them."
+
+class FakeLLM(CustomLLM):
+    """LlamaIndex LLM that answers through `fake_llm_response` after `latency` seconds, counting calls."""
+
+    latency: float = 0.05
+    calls: int = 0
+    respond: Any = fake_llm_response
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(model_name="fake-llm")
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs) -> CompletionResponse:
+        self.calls += 1
+        time.sleep(self.latency)
+        return CompletionResponse(text=self.respond(prompt))
+
+    @llm_completion_callback()
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs) -> CompletionResponse:
+        # CustomLLM's default acomplete calls complete(), which would block the event loop
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return CompletionResponse(text=self.respond(prompt))
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency)
+        text = ""
+        for word in self.respond(prompt).split(" "):
+            delta = word if not text else " " + word
+            text += delta
+            yield CompletionResponse(text=text, delta=delta)
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def write_pdf(path: str, pages):
+    """Writes a minimal text-only PDF with one page per string (lines split on newlines)."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for text in pages:
+        lines = " T* ".join(f"({_pdf_escape(line)}) Tj" for line in text.split("\n"))
+        stream = f"BT /F1 11 Tf 14 TL 72 720 Td {lines} ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        page_ids.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {len(page_ids)} >>"
+
+    out = "%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out.encode("latin-1")))
+        out += f"{number} 0 obj\n{body}\nendobj\n"
+    xref = len(out.encode("latin-1"))
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n"
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+    with open(path, "wb") as f:
+        f.write(out.encode("latin-1"))
@@ -1,36 +1,88 @@
+import argparse
 import chromadb
 from app.config import settings
+from app.database import SessionLocal, engine
+from app.lexical_index import LexicalIndex
+from app.migrations import run_migrations
+from app.models import IngestCheckpoint, KnowledgeFile, Topic, TopicChunk
+from app.vector_collections import collection_name, kb_collection_names
 import shutil
 import os
 
+def forget_files(project_id=None, all_projects=False):
+    # The files registry and the lexical index describe what the vector store holds, so they go too
+    lexical_index = LexicalIndex(settings.LEXICAL_INDEX_PATH)
+    run_migrations(engine)
+    db = SessionLocal()
+    try:
+        files = db.query(KnowledgeFile)
+        topic_chunks = db.query(TopicChunk)
+        if all_projects:
+            lexical_index.clear()
+        else:
+            lexical_index.delete_project(project_id)
+            files = files.filter(KnowledgeFile.project_id == project_id)
+            topic_chunks = topic_chunks.filter(
+                TopicChunk.topic_id.in_(db.query(Topic.id).filter(Topic.project_id == project_id).scalar_subquery())
+            )
+        topic_chunks.delete(synchronize_session=False)
+        # Checkpoints say which stages' output is in the vector store; without it every stage has to run again
+        db.query(IngestCheckpoint).filter(
+            IngestCheckpoint.file_id.in_(files.with_entities(KnowledgeFile.id).scalar_subquery())
+        ).delete(synchronize_session=False)
+        print(f"Removed {files.delete(synchronize_session=False)} file(s) from the files registry.")
+        db.commit()
+    finally:
+        db.close()
+
 def reset_chroma():
     print(f"Connecting to ChromaDB at {settings.CHROMA_DB_DIR}...")
-    
-    # Option 1: Delete the collection using the client
+
+    # Option 1: Delete the collections using the client
     try:
         client = chromadb.PersistentClient(path=settings.CHROMA_DB_DIR)
-        collection_name = "sales_knowledge_base"
-        try:
+        collection_names = kb_collection_names(client)
+        if not collection_names:
+            print("No knowledge base collections exist.")
+        for collection_name in collection_names:
             client.delete_collection(collection_name)
             print(f"Collection '{collection_name}' deleted successfully.")
-        except ValueError:
-            print(f"Collection '{collection_name}' does not exist.")
-            
+
     except Exception as e:
         print(f"Error using ChromaDB client: {e}")
         print("Attempting hard reset by deleting directory...")
-        
+
         # Option 2: Hard reset if client fails or for deep clean
         if os.path.exists(settings.CHROMA_DB_DIR):
             shutil.rmtree(settings.CHROMA_DB_DIR)
             print(f"Deleted directory: {settings.CHROMA_DB_DIR}")
         else:
             print(f"Directory {settings.CHROMA_DB_DIR} does not exist.")
+    forget_files(all_projects=True)
+
+def reset_project(project_id: int):
+    # Each project has its own collection, so this is one collection drop rather than a filtered delete
+    client = chromadb.PersistentClient(path=settings.CHROMA_DB_DIR)
+    name = collection_name(project_id)
+    if name in kb_collection_names(client):
+        client.delete_collection(name)
+        print(f"Collection '{name}' deleted successfully.")
+    else:
+        print(f"Collection '{name}' does not exist.")
+    forget_files(project_id)
 
 if __name__ == "__main__":
-    confirm = input("Are you sure you want to reset the ChromaDB knowledge base? This cannot be undone. (y/n): ")
+    parser = argparse.ArgumentParser(description="Reset the ChromaDB knowledge base")
+    parser.add_argument("--project", type=int, help="Only drop this project's documents")
+    args = parser.parse_args()
+
+    target = f"project {args.project}'s documents" if args.project else "the ChromaDB knowledge base"
+    confirm = input(f"Are you sure you want to reset {target}? This cannot be undone. (y/n): ")
     if confirm.lower() == 'y':
-        reset_chroma()
+        if args.project:
+            reset_project(args.project)
+        else:
+            reset_chroma()
         print("Reset complete.")
     else:
         print("Operation cancelled.")
@@ -1,18 +1,46 @@
+import os
+import tempfile
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool, StaticPool
 from sqlalchemy.orm import sessionmaker
+from app.config import settings
 from app.main import app
-from app.database import get_db
+from app.resources import registry
+from app.security import token_cache
+from app.database import async_url, configure_sqlite, get_async_db, get_db
+from app.metrics import instrument_engine
 from app.models import Base
 from unittest.mock import MagicMock, patch
+from benchmarks.fakes import FakeEmbedding, FakeIndex, FakeQueryEngine
 
-# Use in-memory SQLite for testing
-SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+# Never serve test LLM calls from (or write them to) the on-disk response cache
+settings.LLM_CACHE_ENABLED = False
+# Query engines come from the fake index; hybrid and lexical retrieval are tested on their own
+settings.RETRIEVAL_MODE = "vector"
+settings.LEXICAL_INDEX_PATH = ":memory:"
+# Tests drive the prefetcher synchronously instead of through its background threads
+settings.PREFETCH_LOOKAHEAD = 0
+# argon2 runs inline; the hashing process pool is tested on its own
+settings.PASSWORD_HASH_WORKERS = 0
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+# A throwaway SQLite file rather than :memory:, so the async engine (the /get_question and
+# /submit_answer path) opens the same database as the sync one
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='sales_training_tests_'), 'test.db')}"
+
+# StaticPool: every sync session (and the TestClient's worker thread) shares one connection
+engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+configure_sqlite(engine)
+instrument_engine(engine) # Same db_query spans as the app's engine
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_engine(async_url(SQLALCHEMY_DATABASE_URL), poolclass=NullPool)
+configure_sqlite(async_engine.sync_engine)
+instrument_engine(async_engine.sync_engine)
+TestingAsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 @pytest.fixture(scope="function")
 def db_session():
     Base.metadata.create_all(bind=engine)
@@ -30,6 +58,88 @@ def client(db_session):
             yield db_session
         finally:
             db_session.close()
+
+    async def override_get_async_db():
+        async with TestingAsyncSessionLocal() as db:
+            yield db
     
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    token_cache.clear() # Ids restart with every test database
     yield TestClient(app)
+
+@pytest.fixture
+def async_session_factory(db_session):
+    """Sessions on the test database through the asyncio engine (tables created by db_session)."""
+    return TestingAsyncSessionLocal
+
+@pytest.fixture(autouse=True)
+def own_sessions(monkeypatch):
+    # Work that outlives the request (streamed explanations, background grading) opens its own session
+    monkeypatch.setattr("app.assessment.SessionLocal", TestingSessionLocal)
+    return TestingSessionLocal
+
+@pytest.fixture(autouse=True)
+def blob_dir(tmp_path, monkeypatch):
+    # Uploads and parsed pages go to a per-test directory instead of ./blobs
+    monkeypatch.setattr(settings, "BLOB_DIR", str(tmp_path / "blobs"))
+    return settings.BLOB_DIR
+
+@pytest.fixture(autouse=True)
+def in_memory_resources():
+    # Ephemeral Chroma and mock models instead of ./chroma_db and Gemini
+    registry.use_in_memory(embed_model=FakeEmbedding())
+    yield registry
+    registry.reset()
+
+@pytest.fixture
+def fake_llm(in_memory_resources):
+    """Routes every query engine handed out by the registry to one fake LLM."""
+    from llama_index.core.llms import MockLLM
+    engine = FakeQueryEngine(latency=0, respond=lambda prompt: "")
+    # Keep mock models in place so nothing falls back to building Gemini clients
+    in_memory_resources.use(llm=MockLLM(), embed_model=FakeEmbedding(), index=FakeIndex(engine))
+    return engine
+
+class QueryCounter:
+    """Records every SQL statement sent to the test engines while active."""
+
+    def __init__(self, engine, *engines):
+        self.engine = engine
+        self.engines = (engine, *engines)
+        self.statements = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append((statement, parameters))
+
+    def __enter__(self):
+        self.statements = []
+        for engine in self.engines:
+            event.listen(engine, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, *exc):
+        for engine in self.engines:
+            event.remove(engine, "before_cursor_execute", self._record)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def full_scans(self, tables):
+        """SELECTs whose plan reads one of `tables` front to back instead of through an index."""
+        scans = []
+        with self.engine.connect() as conn:
+            for statement, parameters in self.statements:
+                if not statement.lstrip().upper().startswith("SELECT"):
+                    continue
+                plan = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+                for row in plan:
+                    detail = row[-1]
+                    if any(detail == f"SCAN {table}" for table in tables):
+                        scans.append((detail, statement))
+        return scans
+
+@pytest.fixture
+def query_counter():
+    return QueryCounter(engine, async_engine.sync_engine)
@@ -0,0 +1,108 @@
+import json
+from app.aggregates import leaderboard, proficiency_summary, rebuild_aggregates
+from app.assessment import submit_answer, submit_answers_bulk
+from app.models import AssessmentSession, LeaderboardScore, ProficiencyStat, Project, QuestionBank, QuestionHistory, Topic, User
+
+CHOICES = ["Ask about their goals", "Quote the price", "Skip discovery", "Send a brochure"]
+
+def seed(db):
+    projects = [Project(name="Enterprise"), Project(name="SMB")]
+    db.add_all(projects)
+    db.commit()
+    topics = [Topic(name="Discovery", project_id=projects[0].id), Topic(name="Closing", project_id=projects[0].id),
+              Topic(name="Discovery", project_id=projects[1].id)]
+    users = [User(username="ana"), User(username="ben")]
+    db.add_all(topics + users)
+    db.commit()
+    return projects, topics, users
+
+def ask(db, user, topic, count):
+    """Starts a session for `user` with `count` bank questions on `topic` already asked; returns (session, texts)."""
+    session = AssessmentSession(user_id=user.id, topic_id=topic.id, current_level="Beginner", score=0.0)
+    db.add(session)
+    db.commit()
+    texts = []
+    for i in range(count):
+        text = f"{topic.id}-{user.id}-{i}?"
+        bank = QuestionBank(topic_id=topic.id, question_text=text, choices=json.dumps(CHOICES),
+                            correct_answer=CHOICES[0], difficulty="Beginner",
+                            explanations=json.dumps({c: "Discovery first." for c in CHOICES[1:]}))
+        db.add(bank)
+        db.commit()
+        db.add(QuestionHistory(session_id=session.id, topic_id=topic.id, question_bank_id=bank.id,
+                               question_text=text, correct_answer=CHOICES[0], is_correct=0))
+        texts.append(text)
+    db.commit()
+    return session, texts
+
+def snapshot(db):
+    stats = {(r.scope, r.scope_id): (r.project_id, r.answers_total, r.answers_correct, r.beginner, r.intermediate, r.advanced)
+             for r in db.query(ProficiencyStat)}
+    scores = {(r.scope, r.scope_id, r.user_id): (r.score, r.answers_total, r.answers_correct)
+              for r in db.query(LeaderboardScore)}
+    return stats, scores
+
+def test_incremental_updates_match_a_rebuild(db_session):
+    projects, topics, users = seed(db_session)
+    session, texts = ask(db_session, users[0], topics[0], 4)
+    for text in texts[:3]:
+        submit_answer(db_session, session.id, "A", text)
+    submit_answer(db_session, session.id, "B", texts[3])
+    submit_answer(db_session, session.id, "A", texts[3]) # Regraded: moves the correct count only
+
+    session, texts = ask(db_session, users[1], topics[1], 3)
+    submit_answers_bulk(db_session, session.id, [{"question_text": t, "user_answer": a} for t, a in zip(texts, "ABA")])
+    session, texts = ask(db_session, users[1], topics[2], 1)
+    submit_answer(db_session, session.id, "C", texts[0])
+
+    incremental = snapshot(db_session)
+    rebuild_aggregates(db_session)
+    db_session.commit()
+    assert snapshot(db_session) == incremental
+
+    stats, scores = incremental
+    assert stats[("topic", topics[0].id)] == (projects[0].id, 4, 4, 0, 1, 0) # 40 points: Intermediate
+    assert stats[("project", projects[0].id)][1:] == (7, 6, 1, 1, 0)
+    assert stats[("global", 0)][1:] == (8, 6, 1, 1, 0)
+    assert scores[("global", 0, users[1].id)] == (20.0, 4, 2)
+
+def test_proficiency_moves_between_levels(db_session):
+    _, topics, users = seed(db_session)
+    session, texts = ask(db_session, users[0], topics[0], 6)
+    levels = []
+    for text in texts:
+        submit_answer(db_session, session.id, "A", text)
+        summary = proficiency_summary(db_session, "topic", topics[0].id)
+        levels.append([level for level, count in summary["proficiency"].items() if count])
+    assert levels == [["Beginner"]] * 2 + [["Intermediate"]] * 3 + [["Advanced"]]
+    assert summary["accuracy"] == 1.0
+
+def test_dashboard_endpoints(client, db_session):
+    projects, topics, users = seed(db_session)
+    for user, correct in ((users[0], 1), (users[1], 3)):
+        session, texts = ask(db_session, user, topics[0], 3)
+        for i, text in enumerate(texts):
+            submit_answer(db_session, session.id, "A" if i < correct else "B", text)
+    project_ids, topic_id = [p.id for p in projects], topics[0].id # The client closes db_session
+
+    board = client.get("/api/v1/dashboard/leaderboard", params={"project_id": project_ids[0]}).json()
+    assert [(e["username"], e["score"], e["rank"]) for e in board["entries"]] == [("ben", 30.0, 1), ("ana", 10.0, 2)]
+    assert board["entries"][1]["accuracy"] == round(1 / 3, 4)
+    assert client.get("/api/v1/dashboard/leaderboard", params={"limit": 1}).json()["entries"][0]["username"] == "ben"
+
+    summary = client.get("/api/v1/dashboard/proficiency", params={"topic_id": topic_id}).json()
+    assert summary["answers_total"] == 6 and summary["answers_correct"] == 4
+    assert summary["proficiency"] == {"Beginner": 1, "Intermediate": 1, "Advanced": 0}
+
+    per_topic = client.get(f"/api/v1/dashboard/projects/{project_ids[0]}/topics").json()
+    assert [t["topic_id"] for t in per_topic] == [topic_id]
+
+    empty = client.get("/api/v1/dashboard/proficiency", params={"project_id": project_ids[1]}).json()
+    assert empty["answers_total"] == 0 and empty["accuracy"] is None
+
+def test_leaderboard_reads_do_not_scan(db_session, query_counter):
+    _, topics, users = seed(db_session)
+    with query_counter:
+        leaderboard(db_session, "topic", topics[0].id, limit=5)
+        proficiency_summary(db_session, "topic", topics[0].id)
+    assert query_counter.full_scans(("leaderboard_scores", "proficiency_stats")) == []
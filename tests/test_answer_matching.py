@@ -0,0 +1,41 @@
+from app.answer_matching import AnswerMatcher, MATCH, NO_MATCH, AMBIGUOUS, edit_similarity
+from benchmarks.fakes import FakeEmbedding
+
+def test_exact_and_lexical_tiers_need_no_embeddings():
+    embed = FakeEmbedding()
+    matcher = AnswerMatcher(embed_model=embed)
+
+    assert matcher.evaluate("Active Listening.", "active listening") == (MATCH, "exact", 1.0)
+    assert matcher.evaluate("Active listenning", "Active listening").tier == "lexical"
+    assert matcher.evaluate("the value of the product", "product value").verdict == MATCH
+    assert embed.texts_embedded == 0
+
+def test_negation_is_never_accepted_lexically():
+    matcher = AnswerMatcher(embed_model=FakeEmbedding())
+    decision = matcher.evaluate("Never offer a discount early", "Offer a discount early")
+    assert decision.verdict != MATCH
+
+def test_edit_distance_only_accepts_typos():
+    matcher = AnswerMatcher(embed_model=FakeEmbedding())
+    # Whole-string edit similarity is above the accept threshold for both, but a word changed meaning
+    for answer, canonical in [
+        ("Decrease the price by ten percent", "Increase the price by ten percent"),
+        ("Send the proposal on Thursday", "Send the proposal on Tuesday"),
+    ]:
+        assert edit_similarity(answer, canonical) >= 0.9
+        assert matcher.evaluate(answer, canonical, use_embeddings=False).verdict == AMBIGUOUS
+    assert matcher.evaluate("Summarise the customers needs", "Summarize the customer's needs").verdict == MATCH
+
+def test_embedding_tier_rejects_unrelated_answers_and_caches_canonical():
+    embed = FakeEmbedding()
+    matcher = AnswerMatcher(embed_model=embed)
+
+    first = matcher.evaluate("quarterly revenue forecast", "build rapport with the buyer")
+    matcher.evaluate("talk about shipping dates", "build rapport with the buyer")
+
+    assert first.verdict == NO_MATCH and first.tier == "embedding"
+    assert embed.texts_embedded == 3 # Canonical answer embedded once
+
+def test_edit_similarity():
+    assert edit_similarity("closing", "closing") == 1.0
+    assert 0.8 < edit_similarity("negotiation", "negotiaton") < 1.0
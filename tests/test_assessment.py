@@ -0,0 +1,112 @@
+import itertools
+import json
+from app import llm_cache
+from app.assessment import generate_question, record_correct_answer, start_new_session, submit_answer
+from app.config import settings
+from app.models import AssessmentSession, QuestionBank, QuestionHistory, Topic, TopicScore, User
+
+CHOICES = ["Listen first", "Talk about price", "Ignore it", "Change the subject"]
+
+def seed_question(db, explanations=None):
+    topic = Topic(name="Objections", description="Test Topic")
+    user = User(username="rep")
+    db.add_all([topic, user])
+    db.commit()
+    session = AssessmentSession(user_id=user.id, current_level="Beginner", score=0.0)
+    db.add(session)
+    db.add(QuestionBank(topic_id=topic.id, question_text="First step?", choices=json.dumps(CHOICES),
+                        correct_answer=CHOICES[0], explanations=explanations, difficulty="Beginner"))
+    db.commit()
+    db.add(QuestionHistory(session_id=session.id, topic_id=topic.id, question_text="First step?",
+                           correct_answer=CHOICES[0], is_correct=0))
+    db.commit()
+    return session
+
+def test_wrong_choice_uses_precomputed_explanation(db_session, fake_llm):
+    session = seed_question(db_session, json.dumps({"Talk about price": "Price comes later."}))
+    fake_llm.respond = lambda prompt: "live explanation"
+
+    result = submit_answer(db_session, session.id, "B", "First step?")
+
+    assert result["correct"] is False
+    assert result["feedback"] == "Price comes later."
+    assert fake_llm.calls == 0
+
+def test_wrong_choice_without_stored_explanation_asks_llm_once(db_session, fake_llm):
+    session = seed_question(db_session)
+    fake_llm.respond = lambda prompt: "live explanation"
+
+    result = submit_answer(db_session, session.id, "Talk about price", "First step?")
+
+    assert result["feedback"] == "live explanation"
+    assert fake_llm.calls == 1 # No YES/NO equivalence check for a picked choice
+
+def test_stream_defers_llm_explanation_and_persists_it(db_session, fake_llm):
+    session = seed_question(db_session)
+    fake_llm.stream = True
+    fake_llm.respond = lambda prompt: "Listening comes before pricing."
+
+    result = submit_answer(db_session, session.id, "B", "First step?", stream=True)
+
+    assert result["correct"] is False
+    assert result["feedback"] is None
+    assert fake_llm.calls == 0 # Nothing generated until the stream is consumed
+    tokens = list(result["explanation_stream"])
+    assert len(tokens) > 1
+    assert "".join(tokens) == "Listening comes before pricing."
+    history = db_session.query(QuestionHistory).filter(QuestionHistory.session_id == session.id).one()
+    assert history.feedback == "Listening comes before pricing."
+
+def test_stream_endpoint_sends_score_before_explanation(client, db_session, fake_llm):
+    session = seed_question(db_session)
+    fake_llm.stream = True
+    fake_llm.respond = lambda prompt: "Listen first, then price."
+
+    response = client.post("/api/v1/submit_answer/stream",
+                           json={"session_id": session.id, "question_text": "First step?", "user_answer": "C"})
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [block.split("\n") for block in response.text.strip().split("\n\n")]
+    names = [lines[0].removeprefix("event: ") for lines in events]
+    assert names[0] == "result" and names[-1] == "done"
+    assert set(names[1:-1]) == {"token"}
+    result = json.loads(events[0][1].removeprefix("data: "))
+    assert result["correct"] is False and result["current_score"] == 0
+    assert json.loads(events[-1][1].removeprefix("data: "))["feedback"] == "Listen first, then price."
+    history = db_session.query(QuestionHistory).filter(QuestionHistory.session_id == session.id).one()
+    assert history.feedback == "Listen first, then price."
+
+def test_first_correct_answers_on_a_topic_share_one_score_row(db_session, own_sessions):
+    session = seed_question(db_session)
+    topic_id = db_session.query(Topic.id).scalar()
+    first, second = own_sessions(), own_sessions()
+
+    # Both requests look for the row before either has committed
+    for db in (first, second):
+        record_correct_answer(db, db.get(AssessmentSession, session.id), topic_id)
+    first.commit()
+    second.commit()
+
+    scores = db_session.query(TopicScore).filter(TopicScore.topic_id == topic_id).all()
+    assert len(scores) == 1 and scores[0].score == 20 # Points are added in SQL, so neither answer is lost
+
+def test_fallback_questions_are_never_served_from_the_llm_cache(db_session, fake_llm, tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_cache, "_cache", llm_cache.LLMCache(str(tmp_path / "cache.db"), ttl_seconds=60, max_entries=100))
+    monkeypatch.setattr(settings, "LLM_CACHE_ENABLED", True)
+    topic = Topic(name="Objections", description="Test Topic")
+    db_session.add(topic)
+    db_session.commit()
+    numbers = itertools.count()
+    fake_llm.respond = lambda prompt: json.dumps({
+        "question_text": f"Generated question {next(numbers)}?", "choices": CHOICES, "correct_answer": CHOICES[0],
+    })
+
+    asked = []
+    for user_id in (1, 2): # Two sessions on the same topic and level
+        session = start_new_session(db_session, user_id, topic_id=topic.id)
+        for _ in range(4):
+            question = generate_question(db_session, session.id)
+            assert "error" not in question
+            asked.append(question["question"])
+
+    assert len(set(asked)) == 8 and fake_llm.calls == 8
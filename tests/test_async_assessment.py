@@ -0,0 +1,180 @@
+import asyncio
+import json
+import threading
+from chromadb.api.models.Collection import Collection
+from llama_index.core import Document
+from llama_index.core.node_parser import SentenceSplitter
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from app.async_assessment import agenerate_question, asubmit_answer
+from app.chunk_sync import sync_document_chunks
+from app.config import settings
+from app.lexical_index import LexicalIndex
+from app.models import AssessmentSession, Project, QuestionBank, QuestionHistory, Topic, TopicChunk, TopicScore, User
+from app.vector_collections import collection_name
+from benchmarks.fakes import FakeEmbedding, FakeLLM
+
+CHOICES = ["Listen first", "Talk about price", "Ignore it", "Change the subject"]
+
+def seed_sessions(db):
+    """One session on a topic with a bank question, one on a topic without (LLM fallback)."""
+    banked, empty = Topic(name="Objections", description="t"), Topic(name="Closing", description="t")
+    user = User(username="rep")
+    db.add_all([banked, empty, user])
+    db.commit()
+    db.add(QuestionBank(topic_id=banked.id, question_text="How do you handle a price objection?",
+                        choices=json.dumps(CHOICES), correct_answer=CHOICES[0], difficulty="Beginner"))
+    fast = AssessmentSession(user_id=user.id, topic_id=banked.id, current_level="Beginner", score=0.0)
+    slow = AssessmentSession(user_id=user.id, topic_id=empty.id, current_level="Beginner", score=0.0)
+    db.add_all([fast, slow])
+    db.commit()
+    return fast.id, slow.id
+
+async def request(session_factory, coroutine_fn, *args):
+    async with session_factory() as db:
+        return await coroutine_fn(db, *args)
+
+def test_bank_question_is_not_held_up_by_slow_generation(db_session, async_session_factory, fake_llm):
+    fast_id, slow_id = seed_sessions(db_session)
+    fake_llm.respond = lambda prompt: json.dumps(
+        {"question_text": "When do you ask for the close?", "choices": CHOICES, "correct_answer": CHOICES[0]}
+    )
+    answer = fake_llm.aquery
+
+    async def run():
+        # The generation call only returns once the fast request is done, so finishing at all proves they overlapped
+        release, waiting = asyncio.Event(), []
+
+        async def held_aquery(prompt):
+            waiting.append(prompt)
+            await release.wait()
+            return await answer(prompt)
+        fake_llm.aquery = held_aquery
+
+        # One pooled connection: the slow request must not hold it while it waits on the LLM
+        engine = create_async_engine(async_session_factory.kw["bind"].url, pool_size=1, max_overflow=0)
+        sessions = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+        slow = asyncio.create_task(request(sessions, agenerate_question, slow_id))
+        while not waiting:
+            await asyncio.sleep(0.001)
+        fast = await asyncio.wait_for(request(sessions, agenerate_question, fast_id), timeout=10)
+        slow_pending = not slow.done()
+        release.set()
+        result = fast, slow_pending, await slow
+        await engine.dispose()
+        return result
+
+    fast, slow_pending, slow = asyncio.run(run())
+    assert fast["question"] == "How do you handle a price objection?"
+    assert slow_pending
+    assert slow["question"] == "When do you ask for the close?"
+    assert db_session.query(QuestionHistory).count() == 2
+
+def test_async_submit_scores_like_the_sync_path(db_session, async_session_factory, fake_llm):
+    fast_id, _ = seed_sessions(db_session)
+    fake_llm.respond = lambda prompt: "YES" if "Return ONLY 'YES' or 'NO'" in prompt else "Listen before pricing."
+
+    async def run():
+        async with async_session_factory() as db:
+            question = await agenerate_question(db, fast_id)
+            return await asubmit_answer(db, fast_id, "I would listen to them first", question["question"])
+
+    result = asyncio.run(run())
+    assert result["correct"] is True
+    assert result["current_score"] == 10
+    assert result["topic_score"] == 10
+    assert fake_llm.calls == 1 # The free-text answer needed the equivalence check
+
+    db_session.expire_all()
+    history = db_session.query(QuestionHistory).one()
+    assert (history.is_correct, history.match_tier, history.feedback) == (1, "llm", "Correct!")
+    assert db_session.query(TopicScore).one().score == 10
+
+def test_concurrent_submits_waiting_on_the_llm_both_score(db_session, async_session_factory, fake_llm):
+    fast_id, _ = seed_sessions(db_session)
+    session = db_session.get(AssessmentSession, fast_id)
+    for text in ("First step?", "Second step?"):
+        db_session.add(QuestionHistory(session_id=fast_id, topic_id=session.topic_id, question_text=text,
+                                       correct_answer=CHOICES[0], is_correct=0))
+    db_session.commit()
+    fake_llm.respond = lambda prompt: "YES"
+    answer = fake_llm.aquery
+
+    async def run():
+        # Both equivalence checks return only once both requests have read the session and are waiting
+        both_waiting, waiting = asyncio.Event(), []
+
+        async def held_aquery(prompt):
+            waiting.append(prompt)
+            if len(waiting) == 2:
+                both_waiting.set()
+            await both_waiting.wait()
+            return await answer(prompt)
+        fake_llm.aquery = held_aquery
+
+        return await asyncio.gather(*[
+            request(async_session_factory, asubmit_answer, fast_id, "I would listen to them first", text)
+            for text in ("First step?", "Second step?")
+        ])
+
+    results = asyncio.run(run())
+    assert all(result["correct"] for result in results)
+    assert sorted(result["current_score"] for result in results) == [10, 20]
+    db_session.expire_all()
+    assert db_session.get(AssessmentSession, fast_id).score == 20
+    assert db_session.query(TopicScore).one().score == 20
+
+def test_async_submit_awaits_llm_explanation(db_session, async_session_factory, fake_llm):
+    fast_id, _ = seed_sessions(db_session)
+    fake_llm.respond = lambda prompt: "Price talk comes after discovery."
+
+    async def run():
+        async with async_session_factory() as db:
+            question = await agenerate_question(db, fast_id)
+            return await asubmit_answer(db, fast_id, "B", question["question"])
+
+    result = asyncio.run(run())
+    assert result["correct"] is False
+    assert result["feedback"] == "Price talk comes after discovery."
+    assert fake_llm.max_in_flight == 1 # Went through aquery
+
+def test_hybrid_retrieval_and_chunk_reads_stay_off_the_event_loop(db_session, async_session_factory,
+                                                                  in_memory_resources, monkeypatch):
+    # The default retrieval mode, against a real (in-memory) Chroma and lexical index
+    monkeypatch.setattr(settings, "RETRIEVAL_MODE", "hybrid")
+    in_memory_resources.use_in_memory(llm=FakeLLM(latency=0), embed_model=FakeEmbedding())
+    docs = [Document(text=text, metadata={"filename": "playbook.pdf", "project_id": "1"}) for text in (
+        "Close by agreeing on next steps and a date for the follow-up meeting.",
+        "When a buyer pushes back on price, restate the value before discussing discounts.",
+    )]
+    sync_document_chunks(docs, in_memory_resources.vector_store(1), "playbook.pdf", 1, in_memory_resources.embed_model,
+                         node_parser=SentenceSplitter(chunk_size=64, chunk_overlap=0),
+                         lexical_index=in_memory_resources.lexical_index())
+    topic, user = Topic(name="Closing", description="t", project_id=1), User(username="rep")
+    db_session.add_all([Project(id=1, name="Acme"), topic, user])
+    db_session.commit()
+    for node_id in in_memory_resources.collection(collection_name(1)).get()["ids"]:
+        db_session.add(TopicChunk(topic_id=topic.id, node_id=node_id, filename="playbook.pdf", score=0.5))
+    session = AssessmentSession(user_id=user.id, project_id=1, topic_id=topic.id, current_level="Beginner", score=0.0)
+    db_session.add(session)
+    db_session.commit()
+
+    blocking_calls = []
+    def record(name, method):
+        def wrapper(*args, **kwargs):
+            blocking_calls.append((name, threading.current_thread() is threading.main_thread()))
+            return method(*args, **kwargs)
+        return wrapper
+    monkeypatch.setattr(LexicalIndex, "search", record("fts5", LexicalIndex.search))
+    monkeypatch.setattr(Collection, "query", record("chroma_query", Collection.query))
+    monkeypatch.setattr(Collection, "get", record("chroma_get", Collection.get))
+
+    async def run():
+        async with async_session_factory() as db:
+            # No bank questions: generated from the topic's chunks, then a wrong answer is explained after a search
+            question = await agenerate_question(db, session.id)
+            return await asubmit_answer(db, session.id, "B", question["question"])
+
+    result = asyncio.run(run())
+    assert result["correct"] is False and result["feedback"]
+    assert {name for name, _ in blocking_calls} == {"fts5", "chroma_query", "chroma_get"}
+    assert not any(on_loop for _, on_loop in blocking_calls)
@@ -0,0 +1,73 @@
+import asyncio
+import time
+from app.password_hashing import PasswordHasher, PasswordHashingBusy
+from app.models import User
+from app.security import CurrentUser, TokenCache
+
+def register(client, username="rep", password="s3cret"):
+    response = client.post("/api/v1/auth/register", json={"username": username, "password": password})
+    assert response.status_code == 200
+    return response.json()["access_token"]
+
+def test_login_and_cached_current_user(client, db_session, query_counter):
+    register(client)
+    assert client.post("/api/v1/auth/token", data={"username": "rep", "password": "wrong"}).status_code == 401
+    response = client.post("/api/v1/auth/token", data={"username": "rep", "password": "s3cret"})
+    assert response.status_code == 200
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    with query_counter:
+        first = client.get("/api/v1/auth/me", headers=headers)
+    assert first.json()["username"] == "rep"
+    assert query_counter.count == 1
+    with query_counter:
+        second = client.get("/api/v1/auth/me", headers=headers)
+    assert second.json() == first.json()
+    assert query_counter.count == 0 # Claims and user row come from the cache
+
+    assert client.get("/api/v1/auth/me", headers={"Authorization": "Bearer nonsense"}).status_code == 401
+
+def test_register_race_returns_username_taken(client, db_session, monkeypatch):
+    async def hash_while_another_request_registers(password):
+        # The other registration commits after this one checked the name
+        db_session.add(User(username="rep", password_hash="x"))
+        db_session.commit()
+        return "hashed"
+
+    monkeypatch.setattr("app.routers.auth.password_hasher.hash", hash_while_another_request_registers)
+    response = client.post("/api/v1/auth/register", json={"username": "rep", "password": "s3cret"})
+    assert response.status_code == 400 and response.json()["detail"] == "Username already registered"
+    assert db_session.query(User).filter(User.username == "rep").count() == 1
+
+def test_token_cache_expiry_and_eviction():
+    cache = TokenCache(ttl_seconds=60, max_entries=2)
+    user = CurrentUser(1, "rep", {})
+    cache.put("a", user)
+    cache.put("expiring", user, token_expires_at=time.time() - 1) # Never outlives the token
+    assert cache.get("expiring") is None
+    cache.put("b", user)
+    cache.get("a")
+    cache.put("c", user) # Evicts "b", the least recently used
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (user, None, user)
+
+def test_hashing_queue_rejects_beyond_its_bound():
+    hasher = PasswordHasher(workers=0, max_queue=0) # One job at a time, none waiting
+
+    async def storm():
+        return await asyncio.gather(*[hasher.hash("pw") for _ in range(3)], return_exceptions=True)
+
+    results = asyncio.run(storm())
+    assert isinstance(results[0], str)
+    assert all(isinstance(result, PasswordHashingBusy) for result in results[1:])
+    assert hasher.in_flight == 0
+
+def test_process_pool_hashes_and_verifies():
+    hasher = PasswordHasher(workers=1)
+    try:
+        async def round_trip():
+            hashed = await hasher.hash("s3cret")
+            return await hasher.verify("s3cret", hashed), await hasher.verify("wrong", hashed)
+
+        assert asyncio.run(round_trip()) == (True, False)
+    finally:
+        hasher.shutdown()
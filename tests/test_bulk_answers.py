@@ -0,0 +1,94 @@
+import json
+from app.assessment import submit_answers_bulk
+from app.config import settings
+from app.models import AssessmentSession, QuestionBank, QuestionHistory, Topic, User
+
+CHOICES = ["Ask about their goals", "Quote the price", "Skip discovery", "Send a brochure"]
+
+def seed(db, count=6):
+    topic = Topic(name="Discovery", description="Test Topic")
+    user = User(username="rep")
+    db.add_all([topic, user])
+    db.commit()
+    session = AssessmentSession(user_id=user.id, current_level="Beginner", score=0.0)
+    db.add(session)
+    db.commit()
+    texts = []
+    for i in range(count):
+        bank = QuestionBank(topic_id=topic.id, question_text=f"Q{i}?", choices=json.dumps(CHOICES),
+                            correct_answer=CHOICES[0], difficulty="Beginner",
+                            explanations=json.dumps({CHOICES[1]: "Price comes after discovery."}))
+        db.add(bank)
+        db.commit()
+        db.add(QuestionHistory(session_id=session.id, topic_id=topic.id, question_bank_id=bank.id,
+                               question_text=bank.question_text, correct_answer=CHOICES[0], is_correct=0))
+        texts.append(bank.question_text)
+    db.commit()
+    return session, texts
+
+def test_bulk_applies_score_and_level_in_order(db_session):
+    session, texts = seed(db_session)
+    answers = [{"question_text": text, "user_answer": "A"} for text in texts[:5]]
+    answers.append({"question_text": texts[5], "user_answer": "B"})
+    answers.append({"question_text": "Never asked?", "user_answer": "A"})
+
+    result = submit_answers_bulk(db_session, session.id, answers)
+
+    levels = [r.get("current_level") for r in result["results"]]
+    assert levels[:6] == ["Beginner"] * 4 + ["Intermediate"] * 2
+    assert result["results"][5]["correct"] is False
+    assert result["results"][5]["feedback"] == "Price comes after discovery."
+    assert result["results"][6]["status"] == "error"
+    assert result["current_score"] == 50
+    assert db_session.query(QuestionHistory).filter(QuestionHistory.is_correct == 1).count() == 5
+
+def test_repeated_question_is_graded_once_with_its_last_answer(db_session):
+    session, texts = seed(db_session, count=2)
+
+    result = submit_answers_bulk(db_session, session.id, [
+        {"question_text": texts[0], "user_answer": "A"},
+        {"question_text": texts[1], "user_answer": "A"},
+        {"question_text": texts[0], "user_answer": "B"},
+    ])
+
+    assert [r["status"] for r in result["results"]] == ["duplicate", "graded", "graded"]
+    assert result["results"][2]["correct"] is False
+    assert result["current_score"] == 10
+    history = db_session.query(QuestionHistory).filter(QuestionHistory.question_text == texts[0]).one()
+    assert history.user_answer == "B" and history.is_correct == 0
+
+def test_bulk_query_count_is_independent_of_batch_size(db_session, query_counter):
+    session, texts = seed(db_session, count=14)
+
+    submit_answers_bulk(db_session, session.id, [{"question_text": texts[0], "user_answer": "A"}]) # Creates the topic score
+
+    counts = []
+    for batch in (texts[1:5], texts[5:14]): # Each moves the session up one level (50 and 100 points)
+        with query_counter:
+            submit_answers_bulk(db_session, session.id, [{"question_text": t, "user_answer": "A"} for t in batch])
+        counts.append(query_counter.count)
+
+    assert counts[0] == counts[1]
+
+def test_llm_items_are_deferred_and_resolved_in_background(client, db_session, fake_llm, monkeypatch):
+    monkeypatch.setattr(settings, "ANSWER_MATCH_USE_EMBEDDINGS", False) # Free text goes straight to the LLM
+    session, texts = seed(db_session, count=3)
+    session_id = session.id
+    fake_llm.respond = lambda prompt: "YES" if "Return ONLY" in prompt else "Because discovery comes first."
+
+    response = client.post("/api/v1/submit_answers", json={"session_id": session_id, "answers": [
+        {"question_text": texts[0], "user_answer": "A"},
+        {"question_text": texts[1], "user_answer": "learn what the buyer wants to achieve"},
+        {"question_text": texts[2], "user_answer": "C"},
+    ]}).json()
+
+    statuses = [r["status"] for r in response["results"]]
+    assert statuses == ["graded", "deferred", "graded"]
+    assert response["results"][2]["explanation_pending"] is True
+    assert response["current_score"] == 10
+
+    # TestClient runs background tasks before returning
+    rows = {h.question_text: h for h in db_session.query(QuestionHistory)}
+    assert rows[texts[1]].match_tier == "llm" and rows[texts[1]].is_correct == 1
+    assert rows[texts[2]].feedback == "Because discovery comes first."
+    assert db_session.get(AssessmentSession, session_id).score == 20
@@ -0,0 +1,49 @@
+import uuid
+import chromadb
+from llama_index.core import Document
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.vector_stores.chroma import ChromaVectorStore
+from app.chunk_sync import sync_document_chunks
+from benchmarks.fakes import FakeEmbedding
+
+PARAGRAPHS = [f"Paragraph {i} explains sales technique number {i} in detail." for i in range(6)]
+
+def make_store():
+    client = chromadb.EphemeralClient()
+    return ChromaVectorStore(chroma_collection=client.create_collection(f"test_{uuid.uuid4().hex}"))
+
+def make_docs(paragraphs, context=None):
+    metadata = {"filename": "deck.pdf", "project_id": "1"}
+    if context:
+        metadata["context"] = context
+    return [Document(text=p, metadata=dict(metadata)) for p in paragraphs]
+
+def sync(store, docs, embed):
+    return sync_document_chunks(
+        docs, store, "deck.pdf", project_id=1, embed_model=embed,
+        node_parser=SentenceSplitter(chunk_size=64, chunk_overlap=0),
+    )
+
+def test_reupload_only_embeds_changed_chunks():
+    store, embed = make_store(), FakeEmbedding()
+
+    first = sync(store, make_docs(PARAGRAPHS), embed)
+    assert first["added"] == 6 and embed.texts_embedded == 6
+
+    edited = PARAGRAPHS[:5] + ["A brand new closing paragraph."]
+    second = sync(store, make_docs(edited), embed)
+
+    assert second == {"added": 1, "unchanged": 5, "updated": 0, "removed": 1, "embedded": 1}
+    assert embed.texts_embedded == 7
+    assert store.client.count() == 6
+
+def test_context_change_costs_no_embeddings():
+    store, embed = make_store(), FakeEmbedding()
+    sync(store, make_docs(PARAGRAPHS), embed)
+
+    result = sync(store, make_docs(PARAGRAPHS, context="Objection handling"), embed)
+
+    assert result["updated"] == 6 and result["embedded"] == 0
+    assert embed.texts_embedded == 6
+    stored = store.client.get(include=["metadatas"])
+    assert {m["context"] for m in stored["metadatas"]} == {"Objection handling"}
@@ -0,0 +1,56 @@
+from app.embedding_pipeline import AdaptiveBatcher, EmbeddingPipeline, TokenBucket
+from benchmarks.fakes import FakeEmbedding
+from sqlalchemy.orm import sessionmaker
+
+class FlakyEmbedding(FakeEmbedding):
+    failures_left: int = 1
+
+    def get_text_embedding_batch(self, texts, **kwargs):
+        if self.failures_left:
+            self.failures_left -= 1
+            raise RuntimeError("429 Resource exhausted")
+        return super().get_text_embedding_batch(texts, **kwargs)
+
+def test_failed_batch_is_retried_smaller():
+    embed = FlakyEmbedding()
+    pipeline = EmbeddingPipeline(embed, rate_limiter=None, batcher=AdaptiveBatcher(initial=8, minimum=2, maximum=16),
+                                 backoff_seconds=0)
+
+    vectors = pipeline.get_text_embedding_batch([f"chunk {i}" for i in range(20)])
+
+    assert len(vectors) == 20
+    assert pipeline.stats["retries"] == 1
+    assert embed.texts_embedded == 20
+
+def test_batcher_grows_when_fast_and_shrinks_when_slow():
+    batcher = AdaptiveBatcher(initial=8, minimum=4, maximum=32, target_seconds=1.0)
+    batcher.on_success(8, 0.1)
+    assert batcher.size == 12
+    batcher.on_success(12, 2.0)
+    assert batcher.size == 6
+    batcher.on_error()
+    assert batcher.size == 4
+
+class FakeClock:
+    """Stands in for the `time` module: sleeping moves the clock forward instead of waiting."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+def test_token_bucket_throttles_once_burst_is_spent(db_session, monkeypatch):
+    # A fake clock, so a slow first acquire (e.g. a GC pause) can't refill the bucket behind the test's back
+    clock = FakeClock()
+    monkeypatch.setattr("app.embedding_pipeline.time", clock)
+    bucket = TokenBucket("test", rate_per_second=100, capacity=5, session_factory=sessionmaker(bind=db_session.get_bind()))
+    bucket.acquire(5)
+    assert clock.sleeps == [] # The burst is there right away
+    bucket.acquire(5)
+    assert abs(sum(clock.sleeps) - 0.05) < 1e-6 # Then 5 tokens take 50ms to refill
@@ -0,0 +1,50 @@
+import asyncio
+from app import llm_cache
+from app.config import settings
+from app.generation import generate_question_bank, parse_llm_json
+from benchmarks.fakes import FakeQueryEngine
+
+def test_parse_llm_json_strips_markdown_fences():
+    assert parse_llm_json('```json[{"a": 1}]```') == [{"a": 1}]
+
+def test_generation_respects_concurrency_cap():
+    engine = FakeQueryEngine(latency=0.01)
+    saved = []
+    topics = [(i, f"Topic {i}") for i in range(10)]
+
+    stats = asyncio.run(generate_question_bank(
+        engine, topics, lambda topic_id, level, qs: saved.append((topic_id, level)), concurrency=4
+    ))
+
+    assert stats == {"succeeded": 30, "failed": 0}
+    assert engine.max_in_flight == 4
+    assert len(set(saved)) == 30
+
+def test_generation_timeout_and_bad_json_are_isolated():
+    slow = FakeQueryEngine(latency=0.5)
+    stats = asyncio.run(generate_question_bank(
+        slow, [(1, "Slow")], lambda *args: None, concurrency=3, timeout=0.05
+    ))
+    assert stats == {"succeeded": 0, "failed": 3}
+
+    broken = FakeQueryEngine(latency=0, respond=lambda prompt: "not json")
+    stats = asyncio.run(generate_question_bank(broken, [(1, "Broken")], lambda *args: None))
+    assert stats == {"succeeded": 0, "failed": 3}
+
+def test_generation_uses_per_topic_engines():
+    shared, scoped = FakeQueryEngine(latency=0), FakeQueryEngine(latency=0)
+    stats = asyncio.run(generate_question_bank(
+        shared, [(1, "Scoped"), (2, "Shared")], lambda *args: None, query_engines={1: scoped}
+    ))
+    assert stats == {"succeeded": 6, "failed": 0}
+    assert (scoped.calls, shared.calls) == (3, 3)
+
+def test_regeneration_asks_the_llm_again_with_the_cache_on(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_cache, "_cache", llm_cache.LLMCache(str(tmp_path / "cache.db"), ttl_seconds=60, max_entries=100))
+    monkeypatch.setattr(settings, "LLM_CACHE_ENABLED", True)
+    engine = FakeQueryEngine(latency=0)
+
+    for _ in range(2): # e.g. a file reprocessed with unchanged chunks
+        asyncio.run(generate_question_bank(engine, [(1, "Pricing")], lambda *args: None))
+
+    assert engine.calls == 6
@@ -0,0 +1,126 @@
+import asyncio
+import functools
+import io
+import os
+from unittest.mock import patch
+import pytest
+from sqlalchemy.orm import sessionmaker
+from app.blob_store import blob_path, collect_garbage, store_blob, store_bytes
+from app.embedding_pipeline import EmbeddingPipeline
+from app.ingest_checkpoints import list_checkpoints
+from app.ingestion import process_pdf_background
+from app.job_queue import claim_next_job, complete_job, enqueue_job
+from app.knowledge_files import find_file
+from app.models import JobMetric, ProcessingJob, Project, QuestionBank
+from benchmarks.fakes import FakeEmbedding, FakeLLM, fake_llm_response
+
+PLAYBOOK = b"""Discovery calls start from the buyer's goals.
+Handle objections by listening first and asking one clarifying question.
+Negotiate on scope before price, and close by confirming the next step."""
+
+@pytest.fixture
+def pipeline(db_session, in_memory_resources, monkeypatch):
+    """Runs queued jobs through the real pipeline against the test database, fake models and no rate limiter."""
+    llm = FakeLLM(latency=0)
+    embed_model = FakeEmbedding()
+    in_memory_resources.use_in_memory(llm=llm, embed_model=embed_model)
+    monkeypatch.setattr("app.ingestion.SessionLocal", sessionmaker(bind=db_session.get_bind()))
+    monkeypatch.setattr("app.ingestion.EmbeddingPipeline", functools.partial(EmbeddingPipeline, rate_limiter=False))
+    db_session.add(Project(id=1, name="Acme"))
+    db_session.commit()
+
+    def run(context=None, job=None):
+        if job is None:
+            _, _, path = store_blob(io.BytesIO(PLAYBOOK), "playbook.txt")
+            job = enqueue_job(db_session, "playbook.txt", path, context, 1)
+        job = claim_next_job(db_session, "w")
+        message = asyncio.run(process_pdf_background(job.file_path, job.filename, job.id, job.context, job.project_id))
+        complete_job(db_session, job, "w", message)
+        metrics = {m.name: m.value for m in db_session.query(JobMetric).filter(JobMetric.job_id == job.id)}
+        return job, metrics
+
+    run.llm, run.embed_model = llm, embed_model
+    return run
+
+def stages(db_session):
+    record = find_file(db_session, "playbook.txt", 1)
+    return {(row.stage, row.key): row for row in list_checkpoints(db_session, record.id)}
+
+def test_rerun_with_the_same_inputs_skips_every_stage(db_session, pipeline):
+    first, metrics = pipeline()
+    assert metrics["embed_chunks"] > 0 and metrics["stages_reused"] == 0
+    assert {stage for stage, _ in stages(db_session)} == {"parse", "chunk", "embed", "topics", "generate"}
+    bank_size = db_session.query(QuestionBank).count()
+    calls, embedded = pipeline.llm.calls, pipeline.embed_model.texts_embedded
+
+    second, metrics = pipeline()
+
+    assert pipeline.llm.calls == calls and pipeline.embed_model.texts_embedded == embedded
+    assert metrics["stages_reused"] == 4 and metrics["gen_batches_reused"] == len(
+        [key for stage, key in stages(db_session) if stage == "generate"]
+    )
+    assert db_session.query(QuestionBank).count() == bank_size
+    assert "Unchanged since the last run" in second.message
+    # The upload stays in the blob store after the job completes
+    assert os.path.exists(first.file_path) and first.file_path == second.file_path
+
+def test_new_context_reruns_topics_and_generation_without_embedding(db_session, pipeline):
+    first, _ = pipeline()
+    parsed = stages(db_session)["parse", ""].job_id
+
+    prompts = []
+    pipeline.llm.respond = lambda prompt: prompts.append(prompt) or fake_llm_response(prompt)
+    second, metrics = pipeline(context="Enterprise renewals")
+
+    assert "embed_chunks" not in metrics # Chunk metadata is rewritten with the stored embeddings
+    assert stages(db_session)["parse", ""].job_id == parsed # Pages come back from the parse checkpoint
+    assert stages(db_session)["topics", ""].job_id == second.id
+    assert any("Focus specifically on: Enterprise renewals" in prompt for prompt in prompts)
+    assert metrics["gen_batches_reused"] == 0 and metrics["bank_questions_added"] + metrics["bank_duplicates_skipped"] > 0
+
+def test_reprocess_reruns_only_failed_generation_batches(db_session, pipeline, client):
+    def flaky(prompt):
+        if "Advanced level" in prompt and "Negotiation" in prompt:
+            return "not json"
+        return fake_llm_response(prompt)
+    pipeline.llm.respond = flaky
+    first, _ = pipeline(context="Q3 pricing")
+    path = first.file_path
+    failed = [key for (stage, key), row in stages(db_session).items() if row.status == "Failed"]
+    assert len(failed) == 1 and failed[0].endswith(":Advanced")
+    assert "reprocess the file to retry them" in first.message
+
+    pipeline.llm.respond = fake_llm_response
+    calls = pipeline.llm.calls
+    response = client.post("/api/v1/admin/knowledge_base/reprocess", json={"filename": "playbook.txt", "project_id": 1})
+    assert response.status_code == 200
+    job = db_session.get(ProcessingJob, response.json()["job_id"])
+    assert job.file_path == path and job.context == "Q3 pricing" # Context carried over
+    # Still queued: a second request is refused
+    assert client.post("/api/v1/admin/knowledge_base/reprocess",
+                       json={"filename": "playbook.txt", "project_id": 1}).status_code == 409
+
+    _, metrics = pipeline(job=job)
+
+    assert pipeline.llm.calls == calls + 1
+    assert all(row.status == "Done" for row in stages(db_session).values())
+    listed = client.get(f"/api/v1/admin/knowledge_base/files/{find_file(db_session, 'playbook.txt', 1).id}/stages").json()
+    assert [row["stage"] for row in listed][:4] == ["parse", "chunk", "embed", "topics"]
+
+def test_reprocess_needs_the_stored_upload(db_session, client):
+    assert client.post("/api/v1/admin/knowledge_base/reprocess", json={"filename": "missing.pdf"}).status_code == 404
+
+    with patch("app.ingestion.SessionLocal", sessionmaker(bind=db_session.get_bind())):
+        response = client.post("/api/v1/upload_pdf", files={"file": ("deck.pdf", b"%PDF deck", "application/pdf")})
+    job = db_session.get(ProcessingJob, response.json()["job_id"])
+    path = job.file_path
+    assert path == blob_path(find_file(db_session, "deck.pdf").content_hash, "deck.pdf")
+    complete_job(db_session, claim_next_job(db_session, "w"), "w", "done")
+
+    # Garbage collection keeps what the registry refers to and drops the rest
+    _, _, stray = store_bytes(b"an older version", "deck.pdf")
+    assert collect_garbage(db_session, min_age_seconds=0) == 1
+    assert os.path.exists(path) and not os.path.exists(stray)
+
+    os.remove(path)
+    assert client.post("/api/v1/admin/knowledge_base/reprocess", json={"filename": "deck.pdf"}).status_code == 410
@@ -0,0 +1,111 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy.orm import sessionmaker
+from app.blob_store import store_bytes
+from app.config import settings
+from app.job_queue import (
+    claim_next_job, complete_job, enqueue_job, fail_job, heartbeat, requeue_stale_jobs, QueueFullError,
+)
+from app.models import ProcessingJob
+from app.worker import run_job
+
+@pytest.fixture
+def upload(tmp_path):
+    path = tmp_path / "deck.pdf"
+    path.write_bytes(b"%PDF")
+    return str(path)
+
+def test_claim_is_exclusive(db_session, upload):
+    job = enqueue_job(db_session, "deck.pdf", upload)
+
+    claimed = claim_next_job(db_session, "worker-a")
+    assert claimed.id == job.id
+    assert claimed.status == "Processing" and claimed.locked_by == "worker-a" and claimed.attempts == 1
+    assert claim_next_job(db_session, "worker-b") is None
+    assert heartbeat(db_session, job.id, "worker-a")
+    assert not heartbeat(db_session, job.id, "worker-b")
+
+def test_failed_job_retries_with_backoff_then_fails(db_session, upload, monkeypatch):
+    monkeypatch.setattr(settings, "INGEST_MAX_ATTEMPTS", 2)
+    enqueue_job(db_session, "deck.pdf", upload)
+
+    job = claim_next_job(db_session, "w")
+    fail_job(db_session, job, "w", "quota exceeded")
+    assert job.status == "Pending" and job.next_run_at > datetime.utcnow()
+    assert claim_next_job(db_session, "w") is None # Still backing off
+
+    job.next_run_at = datetime.utcnow() - timedelta(seconds=1)
+    db_session.commit()
+    job = claim_next_job(db_session, "w")
+    fail_job(db_session, job, "w", "quota exceeded")
+    assert job.status == "Failed" and job.attempts == 2
+
+def test_completed_job_removes_upload_unless_stored_as_blob(db_session, upload):
+    enqueue_job(db_session, "deck.pdf", upload)
+    job = claim_next_job(db_session, "w")
+    complete_job(db_session, job, "w", "done")
+    assert job.status == "Completed"
+    assert not os.path.exists(upload)
+
+    # Blobs are kept for reprocessing
+    _, _, blob = store_bytes(b"%PDF", "deck.pdf")
+    enqueue_job(db_session, "deck.pdf", blob)
+    complete_job(db_session, claim_next_job(db_session, "w"), "w", "done")
+    assert os.path.exists(blob)
+
+def test_only_the_owner_can_complete_or_fail_a_job(db_session, upload):
+    enqueue_job(db_session, "deck.pdf", upload)
+    job = claim_next_job(db_session, "worker-a")
+    job.heartbeat_at = datetime.utcnow() - timedelta(seconds=settings.INGEST_HEARTBEAT_TIMEOUT_SECONDS + 1)
+    db_session.commit()
+    requeue_stale_jobs(db_session)
+    claim_next_job(db_session, "worker-b")
+
+    # worker-a comes back after its job was handed to worker-b
+    assert not complete_job(db_session, job, "worker-a", "done")
+    assert not fail_job(db_session, job, "worker-a", "timeout")
+    assert job.status == "Processing" and job.locked_by == "worker-b" and job.message is None
+    assert complete_job(db_session, job, "worker-b", "done") and job.status == "Completed"
+
+def test_worker_stops_a_job_it_no_longer_owns(db_session, upload, monkeypatch):
+    monkeypatch.setattr(settings, "INGEST_HEARTBEAT_SECONDS", 0.01)
+    monkeypatch.setattr("app.worker.SessionLocal", sessionmaker(bind=db_session.get_bind()))
+    stopped = []
+
+    async def process(*args):
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            stopped.append(True)
+            raise
+        return "done"
+    monkeypatch.setattr("app.ingestion.process_pdf_background", process)
+
+    job = enqueue_job(db_session, "deck.pdf", upload)
+    claim_next_job(db_session, "worker-a")
+    db_session.query(ProcessingJob).filter(ProcessingJob.id == job.id).update({ProcessingJob.locked_by: "worker-b"})
+    db_session.commit()
+
+    asyncio.run(asyncio.wait_for(run_job(job.id, "worker-a"), timeout=2))
+
+    assert stopped == [True]
+    db_session.refresh(job)
+    assert job.status == "Processing" and job.locked_by == "worker-b"
+
+def test_stale_jobs_are_requeued(db_session, upload):
+    enqueue_job(db_session, "deck.pdf", upload)
+    job = claim_next_job(db_session, "crashed-worker")
+    job.heartbeat_at = datetime.utcnow() - timedelta(seconds=settings.INGEST_HEARTBEAT_TIMEOUT_SECONDS + 1)
+    db_session.commit()
+
+    assert requeue_stale_jobs(db_session) == 1
+    assert job.status == "Pending"
+    assert claim_next_job(db_session, "w").id == job.id
+
+def test_enqueue_applies_backpressure(db_session, upload, monkeypatch):
+    monkeypatch.setattr(settings, "INGEST_QUEUE_MAX_PENDING", 1)
+    enqueue_job(db_session, "a.pdf", upload)
+    with pytest.raises(QueueFullError):
+        enqueue_job(db_session, "b.pdf", upload)
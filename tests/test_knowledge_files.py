@@ -0,0 +1,87 @@
+import hashlib
+import os
+from unittest.mock import patch
+import pytest
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+from app.config import settings
+from app.job_queue import claim_next_job, enqueue_job, fail_job
+from app.knowledge_files import register_file, update_file_for_job
+from app.models import KnowledgeFile, ProcessingJob, Project
+
+def upload(client, db_session, content, project_id=None):
+    with patch("app.ingestion.SessionLocal", sessionmaker(bind=db_session.get_bind())):
+        data = {"project_id": str(project_id)} if project_id else {}
+        response = client.post("/api/v1/upload_pdf", files={"file": ("deck.pdf", content, "application/pdf")}, data=data)
+    return response.json()["job_id"]
+
+def test_upload_registers_file_with_hash_and_size(client, db_session):
+    first_job = upload(client, db_session, b"version one")
+    second_job = upload(client, db_session, b"version two!")
+
+    files = db_session.query(KnowledgeFile).all()
+    assert len(files) == 1 # Same (project, filename): one entry, pointing at the latest job
+    assert files[0].status == "Queued" and files[0].job_id == second_job
+    assert files[0].content_hash == hashlib.sha256(b"version two!").hexdigest()
+    assert files[0].size_bytes == len(b"version two!")
+    for job in db_session.query(ProcessingJob).filter(ProcessingJob.id.in_([first_job, second_job])):
+        os.remove(job.file_path)
+
+def test_one_row_per_project_and_filename_including_no_project(db_session):
+    db_session.add(Project(id=1, name="Acme"))
+    db_session.commit()
+    shared = register_file(db_session, "deck.pdf", None, 1)
+    scoped = register_file(db_session, "deck.pdf", 1, 2)
+    assert register_file(db_session, "deck.pdf", None, 3, "Processing").id == shared.id
+    assert shared.id != scoped.id and db_session.query(KnowledgeFile).count() == 2
+
+    # Enforced by the database, so a concurrent find-then-insert can't add a second NULL-project row
+    db_session.add(KnowledgeFile(filename="deck.pdf", project_id=None))
+    with pytest.raises(IntegrityError):
+        db_session.commit()
+    db_session.rollback()
+
+def test_failed_job_marks_file_failed_unless_indexed(db_session, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "INGEST_MAX_ATTEMPTS", 1)
+    path = tmp_path / "deck.pdf"
+    for name, indexed in (("deck.pdf", False), ("guide.pdf", True)):
+        path.write_bytes(b"%PDF")
+        job = enqueue_job(db_session, name, str(path))
+        register_file(db_session, name, None, job.id)
+        if indexed:
+            update_file_for_job(db_session, job.id, status="Indexed", page_count=3, chunk_count=12)
+        fail_job(db_session, claim_next_job(db_session, "w"), "w", "question generation failed")
+
+    statuses = {f.filename: f.status for f in db_session.query(KnowledgeFile)}
+    assert statuses == {"deck.pdf": "Failed", "guide.pdf": "Indexed"}
+
+def test_keyset_pagination_with_filters(client, db_session):
+    project = Project(name="Acme")
+    db_session.add(project)
+    db_session.commit()
+    project_id = project.id
+    for i in range(7):
+        db_session.add(ProcessingJob(filename=f"f{i}.pdf", status="Completed" if i % 2 else "Failed",
+                                     project_id=project_id if i < 4 else None))
+        db_session.add(KnowledgeFile(filename=f"f{i}.pdf", status="Indexed" if i % 2 else "Failed"))
+    db_session.commit()
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 3, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/api/v1/admin/jobs", params=params).json()
+        seen += [job["filename"] for job in page["jobs"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == [f"f{i}.pdf" for i in reversed(range(7))]
+
+    page = client.get("/api/v1/admin/jobs", params={"status": "Completed", "project_id": project_id}).json()
+    assert [job["filename"] for job in page["jobs"]] == ["f3.pdf", "f1.pdf"]
+
+    files = client.get("/api/v1/admin/knowledge_base/files", params={"limit": 2}).json()
+    assert [f["filename"] for f in files["files"]] == ["f5.pdf", "f3.pdf"]
+    rest = client.get("/api/v1/admin/knowledge_base/files", params={"cursor": files["next_cursor"]}).json()
+    assert [f["filename"] for f in rest["files"]] == ["f1.pdf"] and rest["next_cursor"] is None
+    everything = client.get("/api/v1/admin/knowledge_base/files", params={"status": ""}).json()
+    assert len(everything["files"]) == 7
@@ -0,0 +1,76 @@
+from llama_index.core import Document
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import NodeWithScore, TextNode
+from llama_index.core.vector_stores import ExactMatchFilter, MetadataFilters
+from app.chunk_sync import sync_document_chunks
+from app.lexical_index import LexicalIndex, reciprocal_rank_fusion
+
+PARAGRAPHS = [
+    "Discovery calls start with open questions about the buyer's goals.",
+    "When a buyer pushes back on price, restate the value before discussing discounts.",
+    "The SKU-4471 bundle includes onboarding and premium support for one year.",
+    "Close by agreeing on next steps and a date for the follow-up meeting.",
+]
+
+def ingest(registry, paragraphs, filename="playbook.pdf", project_id=1):
+    docs = [Document(text=p, metadata={"filename": filename, "project_id": str(project_id)}) for p in paragraphs]
+    return sync_document_chunks(
+        docs, registry.vector_store(project_id), filename, project_id, registry.embed_model,
+        node_parser=SentenceSplitter(chunk_size=64, chunk_overlap=0), lexical_index=registry.lexical_index(),
+    )
+
+def texts(results):
+    return [result.node.get_content() for result in results]
+
+def test_ingestion_keeps_lexical_index_in_step(in_memory_resources):
+    ingest(in_memory_resources, PARAGRAPHS)
+    index = in_memory_resources.lexical_index()
+    assert index.count() == 4
+
+    ingest(in_memory_resources, PARAGRAPHS[:3] + ["Summarize the call in a short recap email."])
+    assert index.count() == 4
+    assert index.search("follow-up meeting date") == []
+    assert texts(index.search("recap email")) == ["Summarize the call in a short recap email."]
+
+def test_lexical_mode_matches_exact_terms_without_embedding(in_memory_resources):
+    ingest(in_memory_resources, PARAGRAPHS)
+    embedded = in_memory_resources.embed_model.texts_embedded
+
+    results = in_memory_resources.retriever(similarity_top_k=2, mode="lexical").retrieve("What is in SKU-4471?")
+
+    assert texts(results)[0] == PARAGRAPHS[2]
+    assert in_memory_resources.embed_model.texts_embedded == embedded
+
+def test_hybrid_fuses_lexical_and_vector_results(in_memory_resources):
+    ingest(in_memory_resources, PARAGRAPHS)
+    results = in_memory_resources.retriever(similarity_top_k=3, mode="hybrid").retrieve("SKU-4471 premium support")
+    assert texts(results)[0] == PARAGRAPHS[2]
+    assert len(results) == 3
+
+def test_filters_and_rebuild(in_memory_resources):
+    ingest(in_memory_resources, PARAGRAPHS, project_id=1)
+    ingest(in_memory_resources, ["Price objections in the SMB segment are about cash flow."], "smb.pdf", project_id=2)
+    only_two = MetadataFilters(filters=[ExactMatchFilter(key="project_id", value="2")])
+
+    index = in_memory_resources.lexical_index()
+    assert [r.node.metadata["filename"] for r in index.search("price", 5, only_two)] == ["smb.pdf"]
+
+    rebuilt = LexicalIndex(":memory:")
+    collections = [in_memory_resources.collection(name) for name in in_memory_resources.collection_names()]
+    assert rebuilt.rebuild_from_collections(collections, batch_size=2) == 5
+    assert texts(rebuilt.search("SKU-4471")) == [PARAGRAPHS[2]]
+
+def test_reciprocal_rank_fusion_prefers_agreement():
+    def ranked(*ids):
+        return [NodeWithScore(node=TextNode(id_=node_id, text=node_id), score=1.0) for node_id in ids]
+
+    fused = reciprocal_rank_fusion([ranked("a", "b", "c"), ranked("b", "d", "a")], top_k=3)
+    assert [result.node.node_id for result in fused] == ["b", "a", "d"]
+
+def test_kb_search_modes(client, in_memory_resources):
+    ingest(in_memory_resources, PARAGRAPHS)
+    for mode in ("lexical", "hybrid", "vector"):
+        response = client.get("/api/v1/admin/knowledge_base/search", params={"query": "SKU-4471", "mode": mode})
+        assert response.status_code == 200
+        assert response.json()[0]["filename"] == "playbook.pdf"
+    assert client.get("/api/v1/admin/knowledge_base/search", params={"query": "x", "mode": "fuzzy"}).status_code == 422
@@ -0,0 +1,57 @@
+import time
+import pytest
+from app.config import settings
+from app import llm_cache
+from app.llm_cache import LLMCache, cached_query, make_cache_key
+from benchmarks.fakes import FakeQueryEngine
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    test_cache = LLMCache(str(tmp_path / "cache.db"), ttl_seconds=60, max_entries=3)
+    monkeypatch.setattr(llm_cache, "_cache", test_cache)
+    monkeypatch.setattr(settings, "LLM_CACHE_ENABLED", True)
+    return test_cache
+
+def test_cached_query_hits_and_counts_per_call_site(cache):
+    engine = FakeQueryEngine(latency=0, respond=lambda prompt: f"answer to {prompt}")
+
+    assert cached_query(engine, "why?", "explanation") == "answer to why?"
+    assert cached_query(engine, "why?", "explanation") == "answer to why?"
+    cached_query(engine, "same?", "equivalence_check")
+
+    assert engine.calls == 2
+    assert cache.stats()["call_sites"] == {
+        "equivalence_check": {"hits": 0, "misses": 1},
+        "explanation": {"hits": 1, "misses": 1},
+    }
+
+def test_bypass_skips_cache(cache):
+    engine = FakeQueryEngine(latency=0, respond=lambda prompt: "x")
+    cached_query(engine, "p", "explanation", bypass=True)
+    cached_query(engine, "p", "explanation", bypass=True)
+    assert engine.calls == 2
+    assert cache.stats()["entries"] == 0
+
+def test_key_depends_on_retrieved_nodes():
+    assert make_cache_key("p", ["n1"]) != make_cache_key("p", ["n2"])
+    assert make_cache_key("p", ["n1"]) == make_cache_key("p", ["n1"])
+
+def test_ttl_and_lru_eviction(cache):
+    for i in range(3):
+        cache.set(f"k{i}", "site", f"v{i}")
+    cache.get("k0", "site") # k0 becomes most recently used
+    cache.set("k3", "site", "v3")
+
+    assert cache.stats()["entries"] == 3
+    assert cache.get("k1", "site") is None
+    assert cache.get("k0", "site") == "v0"
+
+    cache.ttl_seconds = 0
+    time.sleep(0.01)
+    assert cache.get("k0", "site") is None
+
+def test_replacing_an_entry_does_not_grow_the_count(cache):
+    cache.set("k", "site", "v1")
+    cache.set("k", "site", "v2")
+    assert cache.stats()["entries"] == 1
+    assert cache.get("k", "site") == "v2"
@@ -0,0 +1,48 @@
+from llama_index.core import Document
+from prometheus_client import REGISTRY
+from app.config import settings
+from app.metrics import span
+from app.models import AssessmentSession, Topic, User
+from benchmarks.fakes import FakeEmbedding, FakeLLM
+
+ENDPOINT = "/api/v1/get_question/{session_id}"
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+def test_span_records_duration_by_kind_and_call_site():
+    before = sample("sales_training_span_seconds_count", kind="retrieval", call_site="unit_test")
+    with span("retrieval", "unit_test") as timer:
+        pass
+    assert timer.seconds >= 0
+    assert sample("sales_training_span_seconds_count", kind="retrieval", call_site="unit_test") == before + 1
+
+def test_llm_calls_and_tokens_are_attributed_to_call_site_and_endpoint(client, db_session, in_memory_resources, monkeypatch):
+    monkeypatch.setattr(settings, "METRICS_TIMING_HEADER", True)
+    in_memory_resources.use_in_memory(llm=FakeLLM(latency=0), embed_model=FakeEmbedding())
+    in_memory_resources.index().insert(Document(text="Discovery calls start with open questions about goals."))
+    topic = Topic(name="Discovery", description="Test Topic")
+    user = User(username="rep")
+    db_session.add_all([topic, user])
+    db_session.commit()
+    session = AssessmentSession(user_id=user.id, topic_id=topic.id, current_level="Beginner", score=0.0)
+    db_session.add(session)
+    db_session.commit()
+    calls_before = sample("sales_training_llm_calls_total", call_site="fallback_generation", endpoint=ENDPOINT)
+    tokens_before = sample("sales_training_llm_tokens_total", call_site="fallback_generation", endpoint=ENDPOINT,
+                           direction="prompt")
+
+    response = client.get(f"/api/v1/get_question/{session.id}")
+
+    assert response.status_code == 200
+    assert "Discovery" in response.json()["question"] # No bank questions, so this came from the LLM fallback
+    assert sample("sales_training_llm_calls_total", call_site="fallback_generation", endpoint=ENDPOINT) == calls_before + 1
+    assert sample("sales_training_llm_tokens_total", call_site="fallback_generation", endpoint=ENDPOINT,
+                  direction="prompt") > tokens_before
+    timing = response.headers["Server-Timing"]
+    for kind in ("llm;", "retrieval;", "db_query;", "total;"):
+        assert kind in timing
+
+    metrics = client.get("/metrics")
+    assert metrics.status_code == 200
+    assert 'sales_training_http_request_seconds_count{endpoint="/api/v1/get_question/{session_id}"' in metrics.text
@@ -0,0 +1,79 @@
+from sqlalchemy import create_engine, inspect, text
+from app.database import configure_sqlite
+from app.migrations import run_migrations
+from app.models import Base
+
+def legacy_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        # As created before the unique indexes existed
+        conn.execute(text("DROP INDEX ix_topics_project_name"))
+        conn.execute(text("DROP INDEX ix_topic_scores_user_topic"))
+        conn.execute(text("DROP INDEX ix_question_bank_question_text"))
+        conn.execute(text("DROP INDEX ix_knowledge_files_project_filename_unique"))
+        conn.execute(text("CREATE INDEX ix_knowledge_files_project_filename ON knowledge_files (project_id, filename)"))
+        conn.execute(text("INSERT INTO projects (id, name) VALUES (1, 'Acme')"))
+        conn.execute(text("INSERT INTO topics (id, project_id, name) VALUES (1, 1, 'Pricing'), (2, 1, 'Pricing'), (3, 1, 'Demo')"))
+        conn.execute(text("INSERT INTO question_bank (id, topic_id, question_text, difficulty) VALUES (1, 2, 'Q?', 'Beginner')"))
+        conn.execute(text("INSERT INTO topic_scores (user_id, topic_id, score) VALUES (7, 1, 20), (7, 2, 20)"))
+        conn.execute(text(
+            "INSERT INTO knowledge_files (id, project_id, filename, job_id) VALUES "
+            "(1, NULL, 'deck.pdf', 4), (2, NULL, 'deck.pdf', 5), (3, 1, 'deck.pdf', 3)"
+        ))
+        conn.execute(text("INSERT INTO ingest_checkpoints (file_id, stage, key) VALUES (1, 'parse', ''), (2, 'parse', '')"))
+    return engine
+
+def test_migration_merges_duplicates_and_adds_indexes(tmp_path):
+    engine = legacy_engine(tmp_path)
+
+    run_migrations(engine)
+
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT id FROM topics ORDER BY id")).scalars().all() == [1, 3]
+        assert conn.execute(text("SELECT topic_id FROM question_bank")).scalar() == 1
+        scores = conn.execute(text("SELECT topic_id, score, proficiency_level FROM topic_scores")).all()
+        assert [tuple(row) for row in scores] == [(1, 40.0, "Intermediate")]
+    indexes = {index["name"]: index for index in inspect(engine).get_indexes("topics")}
+    assert indexes["ix_topics_project_name"]["unique"]
+    assert "ix_question_bank_question_text" in {index["name"] for index in inspect(engine).get_indexes("question_bank")}
+    with engine.connect() as conn:
+        # The latest upload of each (project, filename) is kept
+        assert conn.execute(text("SELECT id FROM knowledge_files ORDER BY id")).scalars().all() == [2, 3]
+        assert conn.execute(text("SELECT file_id FROM ingest_checkpoints")).scalars().all() == [2]
+        indexes = conn.execute(text("SELECT name FROM sqlite_master WHERE tbl_name = 'knowledge_files'")).scalars().all()
+    assert "ix_knowledge_files_project_filename_unique" in indexes
+    assert "ix_knowledge_files_project_filename" not in indexes
+
+    run_migrations(engine) # Idempotent
+
+def test_sqlite_connections_use_wal(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'wal.db'}")
+    configure_sqlite(engine)
+    with engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert conn.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+
+def test_migration_backfills_new_tables(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE knowledge_files"))
+        conn.execute(text("DROP TABLE proficiency_stats"))
+        conn.execute(text("DROP TABLE question_bands"))
+        conn.execute(text("INSERT INTO question_bank (id, topic_id, question_text, difficulty) VALUES (1, 1, 'Why qualify early?', 'Beginner')"))
+        conn.execute(text(
+            "INSERT INTO processing_jobs (id, filename, status) VALUES "
+            "(1, 'deck.pdf', 'Completed'), (2, 'deck.pdf', 'Completed'), (3, 'notes.pdf', 'Failed')"
+        ))
+        conn.execute(text("INSERT INTO topic_scores (user_id, topic_id, score, proficiency_level) VALUES (7, 1, 40, 'Intermediate')"))
+
+    run_migrations(engine)
+
+    with engine.connect() as conn:
+        files = conn.execute(text("SELECT filename, status, job_id FROM knowledge_files")).all()
+        assert [tuple(row) for row in files] == [("deck.pdf", "Indexed", 2)]
+        stat = conn.execute(text("SELECT intermediate FROM proficiency_stats WHERE scope = 'global'")).scalar()
+        assert stat == 1
+        assert conn.execute(text("SELECT COUNT(*) FROM question_bands WHERE question_id = 1")).scalar() == 16
+        assert conn.execute(text("SELECT minhash FROM question_bank")).scalar() is not None
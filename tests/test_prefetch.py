@@ -0,0 +1,83 @@
+import json
+from sqlalchemy.orm import sessionmaker
+from app.assessment import generate_question, prepare_question, submit_answer
+from app.models import AssessmentSession, QuestionBank, QuestionHistory, Topic, User
+from app.prefetch import SessionPrefetcher
+
+def seed_bank(db, per_level=5):
+    topic = Topic(name="Discovery", description="Test Topic")
+    user = User(username="rep")
+    db.add_all([topic, user])
+    db.commit()
+    for level in ("Beginner", "Intermediate"):
+        for i in range(per_level):
+            db.add(QuestionBank(topic_id=topic.id, question_text=f"{level} question {i}?",
+                                choices=json.dumps(["A1", "B1", "C1", "D1"]), correct_answer="A1", difficulty=level))
+    session = AssessmentSession(user_id=user.id, topic_id=topic.id, current_level="Beginner", score=0.0)
+    db.add(session)
+    db.commit()
+    return session
+
+def make_prefetcher(db_session, lookahead=3):
+    prefetcher = SessionPrefetcher(prepare_question, lookahead=lookahead,
+                                   session_factory=sessionmaker(bind=db_session.get_bind()))
+    # Refills are driven explicitly by the tests rather than the background pool
+    prefetcher.scheduled = []
+    prefetcher.schedule_refill = prefetcher.scheduled.append
+    return prefetcher
+
+def test_refill_buffers_distinct_unseen_questions(db_session):
+    session = seed_bank(db_session)
+    prefetcher = make_prefetcher(db_session)
+
+    assert prefetcher.refill(session.id) == 3
+    assert prefetcher.refill(session.id) == 0 # Already full
+
+    taken = [prefetcher.take(session.id, "Beginner") for _ in range(3)]
+    assert len({q["question_bank_id"] for q in taken}) == 3
+    assert all(q["level"] == "Beginner" for q in taken)
+    assert prefetcher.take(session.id, "Beginner") is None
+
+def test_take_ignores_buffer_for_other_level(db_session):
+    session = seed_bank(db_session)
+    prefetcher = make_prefetcher(db_session)
+    prefetcher.refill(session.id)
+
+    assert prefetcher.take(session.id, "Intermediate") is None
+    prefetcher.invalidate(session.id)
+    assert prefetcher.buffered(session.id) == 0
+
+def test_generate_question_serves_from_buffer_and_records_history(db_session, monkeypatch):
+    import app.assessment as assessment
+    session = seed_bank(db_session)
+    prefetcher = make_prefetcher(db_session, lookahead=2)
+    monkeypatch.setattr(assessment, "prefetcher", prefetcher)
+    prefetcher.refill(session.id)
+    buffered = prefetcher._buffers[session.id]["questions"][0]
+
+    result = generate_question(db_session, session.id)
+
+    assert result["question"] == buffered["question_text"]
+    assert prefetcher.stats["hits"] == 1
+    history = db_session.query(QuestionHistory).filter(QuestionHistory.session_id == session.id).one()
+    assert history.question_bank_id == buffered["question_bank_id"]
+
+def test_level_change_invalidates_buffer(db_session, monkeypatch):
+    import app.assessment as assessment
+    session = seed_bank(db_session)
+    prefetcher = make_prefetcher(db_session)
+    monkeypatch.setattr(assessment, "prefetcher", prefetcher)
+
+    session.score = 40.0
+    db_session.commit()
+    question = generate_question(db_session, session.id)
+    prefetcher.refill(session.id)
+    assert prefetcher.buffered(session.id) == 3
+
+    result = submit_answer(db_session, session.id, "A", question["question"])
+
+    assert result["current_level"] == "Intermediate"
+    assert prefetcher.buffered(session.id) == 0
+    assert prefetcher.scheduled[-1] == session.id
+    prefetcher.refill(session.id)
+    assert prefetcher.take(session.id, "Intermediate")["level"] == "Intermediate"
@@ -0,0 +1,56 @@
+import json
+from app.models import QuestionBank, Topic, User
+
+# Statement budgets per endpoint. A new query in a hot path (or an N+1 loop)
+# pushes the count over its budget; raise a budget only on purpose.
+HOT_TABLES = ("question_history", "question_bank", "topic_scores", "topics")
+START_BUDGET = 5
+GET_QUESTION_BUDGET = 5
+SUBMIT_ANSWER_BUDGET = 11 # Includes one upsert per dashboard aggregate table
+
+def seed(db, questions=20):
+    topic = Topic(name="Discovery", description="Test Topic")
+    user = User(username="rep")
+    db.add_all([topic, user])
+    db.commit()
+    for i in range(questions):
+        db.add(QuestionBank(topic_id=topic.id, question_text=f"Question {i}?",
+                            choices=json.dumps(["Right", "Wrong 1", "Wrong 2", "Wrong 3"]),
+                            correct_answer="Right", difficulty="Beginner"))
+    db.commit()
+    return topic, user
+
+def test_training_flow_query_budget(client, db_session, query_counter):
+    topic, user = seed(db_session)
+
+    with query_counter:
+        session = client.post("/api/v1/start_assessment", json={"user_id": user.id, "topic_id": topic.id}).json()
+    assert query_counter.count <= START_BUDGET
+    assert query_counter.full_scans(HOT_TABLES) == []
+
+    with query_counter:
+        question = client.get(f"/api/v1/get_question/{session['id']}").json()
+    assert query_counter.count <= GET_QUESTION_BUDGET
+    assert query_counter.full_scans(HOT_TABLES) == []
+
+    with query_counter:
+        result = client.post("/api/v1/submit_answer", json={
+            "session_id": session["id"], "question_text": question["question"], "user_answer": "A"}).json()
+    assert result["correct"] is True
+    assert query_counter.count <= SUBMIT_ANSWER_BUDGET
+    assert query_counter.full_scans(HOT_TABLES) == []
+
+def test_get_question_query_count_does_not_grow_with_history(client, db_session, query_counter):
+    topic, user = seed(db_session, questions=30)
+    session = client.post("/api/v1/start_assessment", json={"user_id": user.id, "topic_id": topic.id}).json()
+
+    counts = []
+    for _ in range(10):
+        with query_counter:
+            question = client.get(f"/api/v1/get_question/{session['id']}").json()
+        counts.append(query_counter.count)
+        client.post("/api/v1/submit_answer", json={
+            "session_id": session["id"], "question_text": question["question"], "user_answer": "B"})
+
+    # The sampler's wrap-around is part of its pick statement, so the count never varies
+    assert len(set(counts)) == 1
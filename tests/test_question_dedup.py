@@ -0,0 +1,88 @@
+import json
+from app.assessment import prepare_question
+from app.models import AssessmentSession, QuestionBand, QuestionBank, QuestionHistory, Topic, User
+from app.question_dedup import add_bank_questions, compact_bank, minhash, near_duplicate_of, similarity
+
+FIRST_STEP = "What is the first step of a discovery call?"
+REWORDED = "What's the first step in a discovery call?"
+PRICE = "How should a rep respond when a buyer says the price is too high?"
+PRICE_REORDERED = "When a buyer says the price is too high, how should the rep respond?"
+CLOSING = "Which closing technique fits a buyer who keeps delaying?"
+
+def bank_question(text):
+    return QuestionBank(question_text=text, choices=json.dumps(["A", "B", "C", "D"]), correct_answer="A")
+
+def seed_topic(db):
+    topic = Topic(name="Discovery")
+    db.add(topic)
+    db.commit()
+    return topic.id
+
+def test_rewordings_estimate_as_similar():
+    assert similarity(minhash(FIRST_STEP), minhash(REWORDED)) >= 0.7
+    assert similarity(minhash(PRICE), minhash(PRICE_REORDERED)) >= 0.7
+    assert similarity(minhash(FIRST_STEP), minhash(CLOSING)) < 0.3
+    assert near_duplicate_of(PRICE_REORDERED, [CLOSING, PRICE]) == PRICE
+    assert near_duplicate_of(CLOSING, [FIRST_STEP, PRICE]) is None
+
+def test_negated_question_is_not_a_duplicate():
+    negated = "Why should a rep not discount early in the deal?"
+    plain = "Why should a rep discount early in the deal?"
+    assert similarity(minhash(negated), minhash(plain)) < 0.7
+    assert near_duplicate_of(negated, [plain]) is None
+
+def test_bank_inserts_skip_near_duplicates(db_session):
+    topic_id = seed_topic(db_session)
+    stats = add_bank_questions(db_session, topic_id, "Beginner", [bank_question(FIRST_STEP), bank_question(REWORDED)])
+    db_session.commit()
+    assert stats == {"added": 1, "skipped": 1}
+
+    # Reprocessing the same document: rewordings at any level are skipped, new questions are indexed
+    stats = add_bank_questions(db_session, topic_id, "Advanced", [bank_question(REWORDED), bank_question(CLOSING)])
+    db_session.commit()
+    assert stats == {"added": 1, "skipped": 1}
+    assert [q.question_text for q in db_session.query(QuestionBank).order_by(QuestionBank.id)] == [FIRST_STEP, CLOSING]
+    assert db_session.query(QuestionBand).count() == 32
+
+    # Other topics have their own bank
+    other = seed_topic(db_session)
+    assert add_bank_questions(db_session, other, "Beginner", [bank_question(REWORDED)]) == {"added": 1, "skipped": 0}
+
+def test_compaction_keeps_the_oldest_and_moves_history(db_session):
+    topic_id = seed_topic(db_session)
+    # Stored before dedup: no signatures, no buckets
+    questions = [bank_question(text) for text in (PRICE, CLOSING, PRICE_REORDERED, PRICE)]
+    for question in questions:
+        question.topic_id, question.difficulty = topic_id, "Beginner"
+    db_session.add_all(questions)
+    db_session.commit()
+    kept_id, closing_id, reordered_id, copy_id = [q.id for q in questions]
+    db_session.add(QuestionHistory(session_id=1, topic_id=topic_id, question_bank_id=reordered_id,
+                                   question_text=PRICE_REORDERED, is_correct=1))
+    db_session.commit()
+
+    assert compact_bank(db_session) == {"topics": 1, "questions": 4, "removed": 2}
+
+    assert [q.id for q in db_session.query(QuestionBank).order_by(QuestionBank.id)] == [kept_id, closing_id]
+    assert db_session.query(QuestionHistory.question_bank_id).scalar() == kept_id
+    assert {row.question_id for row in db_session.query(QuestionBand)} == {kept_id, closing_id}
+    assert compact_bank(db_session)["removed"] == 0
+
+def test_fallback_generation_rejects_rewordings(db_session, fake_llm):
+    topic_id = seed_topic(db_session)
+    db_session.add(User(id=1, username="rep"))
+    session = AssessmentSession(user_id=1, topic_id=topic_id, current_level="Beginner", score=0.0)
+    db_session.add(session)
+    db_session.commit()
+    db_session.add(QuestionHistory(session_id=session.id, topic_id=topic_id, question_text=FIRST_STEP, is_correct=1))
+    db_session.commit()
+    replies = iter([REWORDED, CLOSING])
+    prompts = []
+    fake_llm.respond = lambda prompt: prompts.append(prompt) or json.dumps(
+        {"question_text": next(replies), "choices": ["A", "B", "C", "D"], "correct_answer": "A"})
+
+    question = prepare_question(db_session, session)
+
+    assert question["question_text"] == CLOSING
+    assert fake_llm.calls == 2
+    assert FIRST_STEP in prompts[1] # The retry names the question to avoid
@@ -0,0 +1,12 @@
+from app.resources import registry
+
+def test_registry_reuses_store_index_and_engines(in_memory_resources):
+    assert registry.vector_store() is registry.vector_store()
+    assert registry.index() is registry.index()
+    assert registry.query_engine() is registry.query_engine()
+    assert registry.retriever(similarity_top_k=5) is registry.retriever(similarity_top_k=5)
+
+def test_search_kb_uses_registry_retriever(client, in_memory_resources):
+    response = client.get("/api/v1/admin/knowledge_base/search", params={"query": "pricing"})
+    assert response.status_code == 200
+    assert response.json() == []
@@ -0,0 +1,46 @@
+import json
+from app.models import AssessmentSession, Project, QuestionBank, QuestionHistory, Topic, User
+from app.sampling import pick_random_topic, sample_unseen_question
+
+def seed(db, count=5):
+    topic = Topic(name="Closing", description="Test Topic")
+    user = User(username="rep")
+    db.add_all([topic, user])
+    db.commit()
+    for i in range(count):
+        db.add(QuestionBank(topic_id=topic.id, question_text=f"Q{i}?", choices=json.dumps(["A", "B"]),
+                            correct_answer="A", difficulty="Beginner"))
+    db.add(QuestionBank(topic_id=topic.id, question_text="Hard?", choices=json.dumps(["A", "B"]),
+                        correct_answer="A", difficulty="Advanced"))
+    session = AssessmentSession(user_id=user.id, current_level="Beginner", score=0.0)
+    db.add(session)
+    db.commit()
+    return topic, session
+
+def test_sampler_never_repeats_and_exhausts(db_session):
+    topic, session = seed(db_session)
+    # A legacy history row that only has the text must also count as seen
+    db_session.add(QuestionHistory(session_id=session.id, topic_id=topic.id, question_text="Q0?", correct_answer="A"))
+    db_session.commit()
+
+    picked = []
+    while True:
+        q = sample_unseen_question(db_session, session.id, topic.id, "Beginner")
+        if q is None:
+            break
+        picked.append(q.question_text)
+        db_session.add(QuestionHistory(session_id=session.id, topic_id=topic.id, question_bank_id=q.id,
+                                       question_text=q.question_text, correct_answer="A"))
+        db_session.commit()
+
+    assert sorted(picked) == ["Q1?", "Q2?", "Q3?", "Q4?"]
+
+def test_pick_random_topic_is_scoped_to_project(db_session):
+    assert pick_random_topic(db_session) is None
+    project = Project(name="P1")
+    db_session.add(project)
+    db_session.commit()
+    db_session.add_all([Topic(name="Other"), Topic(name="Mine", project_id=project.id)])
+    db_session.commit()
+
+    assert {pick_random_topic(db_session, project.id).name for _ in range(10)} == {"Mine"}
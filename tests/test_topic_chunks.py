@@ -0,0 +1,92 @@
+from llama_index.core import Document
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import NodeWithScore, TextNode
+from app.assessment import prepare_question
+from app.chunk_sync import sync_document_chunks
+from app.models import AssessmentSession, Project, Topic, TopicChunk, User
+from app.topic_chunks import bank_prompt_tokens, fit_to_budget, map_topic_chunks, topic_context
+from benchmarks.fakes import FakeEmbedding, FakeLLM
+
+PLAYBOOK = [
+    "Discount approval: any discount above ten percent needs director approval before the quote goes out.",
+    "ROI calculator: walk the buyer through the ROI calculator using their own headcount numbers.",
+    "Security review: send the security questionnaire early, procurement waits for it.",
+]
+
+def ingest(db, registry, project_id, topic_names, filename="playbook.pdf", paragraphs=PLAYBOOK):
+    docs = [Document(text=p, metadata={"filename": filename, "project_id": str(project_id)}) for p in paragraphs]
+    sync_document_chunks(
+        docs, registry.vector_store(project_id), filename, project_id, registry.embed_model,
+        node_parser=SentenceSplitter(chunk_size=64, chunk_overlap=0), lexical_index=registry.lexical_index(),
+    )
+    topics = []
+    for name in topic_names:
+        topic = db.query(Topic).filter(Topic.name == name, Topic.project_id == project_id).first()
+        if topic is None:
+            topic = Topic(name=name, project_id=project_id)
+            db.add(topic)
+            db.commit()
+        topics.append((topic.id, name))
+    stats = map_topic_chunks(
+        db, topics, filename, project_id, registry.vector_store(project_id).client,
+        registry.lexical_index().node_ids(filename, project_id), registry.embed_model, per_topic=1,
+    )
+    return topics, stats
+
+def context_texts(db, registry, topic_ids, project_id, token_budget=0):
+    context = topic_context(db, topic_ids, registry.vector_store(project_id).client, token_budget)
+    return {topic_id: [r.node.get_content() for r in results] for topic_id, results in context.items()}
+
+def test_topics_map_to_their_closest_chunks(db_session, in_memory_resources):
+    db_session.add(Project(id=1, name="Acme"))
+    topics, stats = ingest(db_session, in_memory_resources, 1, ["Discount approval", "ROI calculator"])
+
+    assert stats["mappings"] == 2
+    texts = context_texts(db_session, in_memory_resources, [topic_id for topic_id, _ in topics], 1)
+    assert texts[topics[0][0]] == [PLAYBOOK[0]]
+    assert texts[topics[1][0]] == [PLAYBOOK[1]]
+
+def test_reingesting_a_file_replaces_its_mappings(db_session, in_memory_resources):
+    db_session.add(Project(id=1, name="Acme"))
+    ((discounts, _), (roi, _)), _ = ingest(db_session, in_memory_resources, 1, ["Discount approval", "ROI calculator"])
+    ingest(db_session, in_memory_resources, 1, ["Security review"], filename="security.pdf", paragraphs=PLAYBOOK[2:])
+
+    ingest(db_session, in_memory_resources, 1, ["Discount approval"], paragraphs=PLAYBOOK[:1])
+
+    assert {row.topic_id for row in db_session.query(TopicChunk).filter(TopicChunk.filename == "playbook.pdf")} == {discounts}
+    assert db_session.query(TopicChunk).filter(TopicChunk.filename == "security.pdf").count() == 1
+    assert roi not in context_texts(db_session, in_memory_resources, [discounts, roi], 1)
+
+def test_context_is_trimmed_to_the_token_budget():
+    results = [NodeWithScore(node=TextNode(id_=str(i), text="x" * 400), score=1.0 - i / 10) for i in range(3)]
+    assert [r.node.node_id for r in fit_to_budget(results, 250)] == ["0", "1"]
+    assert fit_to_budget(results, 0) == results
+    # A first chunk larger than the budget is cut down, not dropped
+    (only,) = fit_to_budget(results, 50)
+    assert len(only.node.get_content()) == 200 and results[0].node.get_content() == "x" * 400
+
+def test_bank_prompt_tokens_compare_against_similarity_search():
+    context = {1: [NodeWithScore(node=TextNode(text="x" * 400), score=1.0)]}
+    report = bank_prompt_tokens([(1, "Scoped"), (2, "Unmapped")], context, avg_chunk_tokens=300)
+    # Three levels of one mapped topic: 100 context tokens each instead of two 300-token chunks
+    assert report["gen_prompt_tokens_unscoped"] - report["gen_prompt_tokens"] == 3 * (600 - 100)
+    assert 0 < report["gen_prompt_token_reduction"] < 1
+    assert bank_prompt_tokens([(2, "Unmapped")], context, 300) == {}
+
+def test_fallback_generation_answers_from_the_topic_chunks(db_session, in_memory_resources):
+    prompts = []
+    llm = FakeLLM(latency=0)
+    llm.respond = lambda prompt: prompts.append(prompt) or FakeLLM().respond(prompt)
+    in_memory_resources.use_in_memory(llm=llm, embed_model=FakeEmbedding())
+    db_session.add_all([Project(id=1, name="Acme"), User(id=1, username="rep")])
+    ((topic_id, _),), _ = ingest(db_session, in_memory_resources, 1, ["Security review"])
+    session = AssessmentSession(user_id=1, project_id=1, topic_id=topic_id, current_level="Beginner", score=0.0)
+    db_session.add(session)
+    db_session.commit()
+
+    question = prepare_question(db_session, session)
+
+    assert question["question_bank_id"] is None and "error" not in question
+    (prompt,) = prompts
+    assert PLAYBOOK[2] in prompt
+    assert PLAYBOOK[0] not in prompt and PLAYBOOK[1] not in prompt
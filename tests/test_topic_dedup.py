@@ -0,0 +1,52 @@
+import json
+from app.models import Project, Topic
+from app.topic_dedup import ProjectTopics, resolve_topics, topic_key
+from benchmarks.fakes import FakeEmbedding
+
+def test_topic_key_ignores_order_case_and_inflection():
+    assert topic_key("Objection Handling") == topic_key("handling objections") == topic_key("Handling of Objections")
+    assert topic_key("Closing Techniques") == topic_key("closing technique")
+    assert topic_key("Discovery Calls") != topic_key("Closing Calls")
+
+def test_near_duplicates_merge_into_one_topic(db_session):
+    db_session.add(Project(id=1, name="Acme"))
+    db_session.commit()
+    embed_model = FakeEmbedding()
+    names = ["Objection Handling", "Handling Objections", "Price objection handling", "Negotiation", "Negotiation"]
+
+    topics, stats = resolve_topics(db_session, names, ProjectTopics(1), embed_model, "Extracted from a.pdf", threshold=0.8)
+
+    assert [name for _, name in topics] == ["Objection Handling", "Negotiation"]
+    assert stats == {"topics_extracted": 5, "topics_merged": 2, "gen_calls_saved": 9}
+    assert [t.name for t in db_session.query(Topic).order_by(Topic.id)] == ["Objection Handling", "Negotiation"]
+    # Normalized-name matches and repeats are never embedded
+    assert embed_model.texts_embedded == 3
+
+def test_existing_topics_are_cached_and_refreshed(db_session):
+    db_session.add_all([Project(id=1, name="Acme"), Project(id=2, name="Globex")])
+    db_session.add(Topic(name="Discovery Calls", project_id=1)) # From before name embeddings were stored
+    db_session.add(Topic(name="Discovery Calls", project_id=2))
+    db_session.commit()
+    embed_model = FakeEmbedding()
+    index = ProjectTopics(1)
+
+    topics, stats = resolve_topics(db_session, ["discovery call"], index, embed_model)
+    assert [name for _, name in topics] == ["Discovery Calls"] and stats["topics_merged"] == 1
+    assert embed_model.texts_embedded == 1 # The stored topic, embedded once and saved
+    stored = db_session.query(Topic).filter(Topic.project_id == 1).one()
+    assert json.loads(stored.name_embedding)
+
+    # Another worker adds a topic: only that row is loaded, nothing is embedded again
+    db_session.add(Topic(name="Negotiation", project_id=1, name_embedding=json.dumps(embed_model.get_text_embedding("Negotiation"))))
+    db_session.commit()
+    before = embed_model.texts_embedded
+    topics, _ = resolve_topics(db_session, ["Negotiations", "Discovery Calls"], index, embed_model)
+    assert [name for _, name in topics] == ["Negotiation", "Discovery Calls"]
+    assert embed_model.texts_embedded == before
+    assert db_session.query(Topic).filter(Topic.project_id == 1).count() == 2
+
+def test_registry_cache_is_dropped_with_the_embedding_model(in_memory_resources):
+    index = in_memory_resources.project_topics(1)
+    assert in_memory_resources.project_topics(1) is index
+    in_memory_resources.use_in_memory(embed_model=FakeEmbedding())
+    assert in_memory_resources.project_topics(1) is not index
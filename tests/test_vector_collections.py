@@ -0,0 +1,64 @@
+from llama_index.core import Document
+from llama_index.core.node_parser import SentenceSplitter
+from app.chunk_sync import sync_document_chunks
+from app.vector_collections import KB_COLLECTION, collection_name, split_shared_collection
+
+ACME = ["Acme reps lead with the ROI calculator.", "Acme discounts need director approval."]
+GLOBEX = ["Globex reps lead with the security review.", "Globex discounts are capped at ten percent."]
+
+def ingest(registry, paragraphs, project_id, vector_store=None):
+    docs = [Document(text=p, metadata={"filename": "playbook.pdf", "project_id": str(project_id)}) for p in paragraphs]
+    sync_document_chunks(
+        docs, vector_store or registry.vector_store(project_id), "playbook.pdf", project_id, registry.embed_model,
+        node_parser=SentenceSplitter(chunk_size=64, chunk_overlap=0), lexical_index=registry.lexical_index(),
+    )
+
+def projects_of(results):
+    return {result.node.metadata["project_id"] for result in results}
+
+def test_each_project_gets_its_own_collection(in_memory_resources):
+    ingest(in_memory_resources, ACME, 1)
+    ingest(in_memory_resources, GLOBEX, 2)
+
+    assert in_memory_resources.collection(collection_name(1)).count() == 2
+    assert in_memory_resources.collection(collection_name(2)).count() == 2
+    assert in_memory_resources.collection(KB_COLLECTION).count() == 0
+    for mode in ("vector", "hybrid", "lexical"):
+        results = in_memory_resources.retriever(similarity_top_k=4, mode=mode, project_id=2).retrieve("discounts")
+        assert projects_of(results) == {"2"}
+
+def test_cross_project_search_fans_out_with_one_embedding(in_memory_resources):
+    ingest(in_memory_resources, ACME, 1)
+    ingest(in_memory_resources, GLOBEX, 2)
+    embed_model = in_memory_resources.embed_model
+    before = embed_model.texts_embedded
+
+    results = in_memory_resources.retriever(similarity_top_k=4, mode="vector").retrieve("who approves discounts")
+
+    assert projects_of(results) == {"1", "2"}
+    assert embed_model.texts_embedded == before + 1
+    assert [r.score for r in results] == sorted((r.score for r in results), reverse=True)
+
+def test_split_moves_project_chunks_out_of_the_shared_collection(in_memory_resources):
+    # As stored before per-project collections: everything in the shared collection
+    shared = in_memory_resources.vector_store()
+    ingest(in_memory_resources, ACME, 1, vector_store=shared)
+    ingest(in_memory_resources, GLOBEX, 2, vector_store=shared)
+    stored = shared.client.get(include=["embeddings"])
+    embeddings = dict(zip(stored["ids"], (list(e) for e in stored["embeddings"])))
+
+    moved = split_shared_collection(in_memory_resources.chroma_client, batch_size=1)
+
+    assert moved == {1: 2, 2: 2}
+    assert shared.client.count() == 0
+    project = in_memory_resources.collection(collection_name(1)).get(include=["embeddings"])
+    assert all(list(e) == embeddings[i] for i, e in zip(project["ids"], project["embeddings"]))
+    assert split_shared_collection(in_memory_resources.chroma_client) == {}
+
+def test_kb_search_by_project(client, in_memory_resources):
+    ingest(in_memory_resources, ACME, 1)
+    ingest(in_memory_resources, GLOBEX, 2)
+    scoped = client.get("/api/v1/admin/knowledge_base/search", params={"query": "discounts", "project_id": 1}).json()
+    assert {r["project_id"] for r in scoped} == {1}
+    everywhere = client.get("/api/v1/admin/knowledge_base/search", params={"query": "discounts"}).json()
+    assert {r["project_id"] for r in everywhere} == {1, 2}